@@ -0,0 +1,173 @@
+"""
+Admission control: bounded concurrency per route class and per-user rate limits.
+
+Each request takes a slot from its pool before the view runs and gives it
+back at teardown, so streamed bodies hold their slot until they finish.
+Expensive routes (password hashing, export, import) get a small pool of
+their own so they cannot crowd out cheap reads. A request that finds its
+pool full waits in a bounded queue for a short time; past that it is
+rejected at once with 503 and Retry-After instead of queueing without limit.
+
+Rate limits are token buckets keyed on the JWT identity, or on the client
+address for anonymous requests. State is per process.
+"""
+import math
+import threading
+import time
+from flask import current_app, g, jsonify, request
+from identity import request_identity
+
+# Never limited, so operators can still see what is going on
+EXEMPT_ENDPOINTS = {'health_check', 'metrics'}
+
+class ConcurrencyPool:
+    """At most ``limit`` holders and ``queue`` waiters; others are turned away"""
+    
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+    
+    def acquire(self):
+        """Take a slot, waiting up to ``timeout`` seconds; False when shed"""
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            
+            self.waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return True
+    
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+    
+    def stats(self):
+        with self.condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self.active,
+                'queued': self.waiting,
+                'admitted_total': self.admitted,
+                'rejected_total': self.rejected,
+            }
+
+class TokenBucketLimiter:
+    """Per-key token buckets refilled at ``rate`` tokens/second up to ``burst``"""
+    
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.limited = 0
+    
+    def take(self, key):
+        """Spend one token; returns 0 if allowed, else seconds until a token is due"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                if len(self.buckets) > self.max_keys:
+                    self._evict_idle(now)
+                return 0
+            self.buckets[key] = (tokens, now)
+            self.limited += 1
+            return (1 - tokens) / self.rate
+    
+    def _evict_idle(self, now):
+        # A bucket idle long enough to have refilled is the same as no bucket
+        idle = self.burst / self.rate
+        self.buckets = {key: value for key, value in self.buckets.items() if now - value[1] < idle}
+    
+    def stats(self):
+        with self.lock:
+            return {'limited_total': self.limited, 'tracked_keys': len(self.buckets)}
+
+def _busy(retry_after, status, message):
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, status
+
+def _rate_limit_key():
+    identity = request_identity()
+    if identity is not None:
+        return f'user:{identity}'
+    return f'addr:{request.remote_addr}'
+
+def init_admission(app):
+    """Install the concurrency pools and rate limiter as request hooks"""
+    config = app.config
+    if config['ADMISSION_ENABLED']:
+        app.extensions['admission'] = {
+            'default': ConcurrencyPool(
+                config['ADMISSION_MAX_CONCURRENT'],
+                config['ADMISSION_MAX_QUEUE'],
+                config['ADMISSION_QUEUE_TIMEOUT_MS'] / 1000
+            ),
+            'expensive': ConcurrencyPool(
+                config['ADMISSION_EXPENSIVE_MAX_CONCURRENT'],
+                config['ADMISSION_EXPENSIVE_MAX_QUEUE'],
+                config['ADMISSION_EXPENSIVE_QUEUE_TIMEOUT_MS'] / 1000
+            ),
+        }
+    if config['RATE_LIMIT_ENABLED']:
+        app.extensions['rate_limiter'] = TokenBucketLimiter(config['RATE_LIMIT_RATE'], config['RATE_LIMIT_BURST'])
+    expensive = set(config['ADMISSION_EXPENSIVE_ENDPOINTS'])
+    
+    @app.before_request
+    def admit():
+        if request.method == 'OPTIONS' or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        
+        # Cheap rejections first, so limited clients never take a slot
+        limiter = current_app.extensions.get('rate_limiter')
+        if limiter is not None:
+            wait = limiter.take(_rate_limit_key())
+            if wait:
+                return _busy(wait, 429, 'Rate limit exceeded')
+        
+        pools = current_app.extensions.get('admission')
+        if pools is not None:
+            pool = pools['expensive' if request.endpoint in expensive else 'default']
+            if not pool.acquire():
+                return _busy(current_app.config['ADMISSION_RETRY_AFTER'], 503, 'Server busy, please retry')
+            g.admission_pool = pool
+        return None
+    
+    @app.teardown_request
+    def release(exc):
+        pool = g.pop('admission_pool', None)
+        if pool is not None:
+            pool.release()
+
+def admission_stats(app):
+    """Limiter state for the metrics endpoint"""
+    pools = {name: pool.stats() for name, pool in app.extensions.get('admission', {}).items()}
+    limiter = app.extensions.get('rate_limiter')
+    return pools, limiter.stats() if limiter is not None else None
@@ -2,19 +2,44 @@ from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import Config
-from db import db, init_db
+from db import db, init_db, init_engine_profile
+from hashing import password_hasher
+from compression import init_compression
+from storage import init_content_storage
+from metrics import init_metrics
+from admission import init_admission
+from cache import init_cache
+from replicas import init_replicas
+from sharding import init_sharding
+from deletion import init_account_deletion
+from attachments import init_attachments
+from identity import init_identity
 from models import User, Note
 from schemas import user_schema, note_schema, notes_schema
 from werkzeug.security import check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 
-def create_app():
-    """Flask application factory"""
+def create_app(config=None):
+    """Flask application factory; ``config`` overrides settings from Config"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
     
     # Initialize extensions
     db.init_app(app)
+    init_engine_profile(app)
+    init_content_storage(app)
+    password_hasher.init_app(app)
+    init_compression(app)
+    init_metrics(app)
+    init_admission(app)
+    init_cache(app)
+    init_replicas(app)
+    init_sharding(app)
+    init_account_deletion(app)
+    init_attachments(app)
+    init_identity(app)
     jwt = JWTManager(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
     
@@ -42,6 +67,10 @@ def create_app():
     def not_found(error):
         return jsonify({'error': 'Not found'}), 404
     
+    @app.errorhandler(413)
+    def request_entity_too_large(error):
+        return jsonify({'error': 'Request entity too large'}), 413
+    
     @app.errorhandler(500)
     def internal_error(error):
         db.session.rollback()
@@ -0,0 +1,115 @@
+"""
+Content-addressed storage for note attachments.
+
+Every distinct content is stored once, under ATTACHMENTS_DIR at
+``<sha256[:2]>/<sha256[2:4]>/<sha256>``. An upload is copied from the
+request stream to a temporary file in ``tmp/`` while it is hashed, one
+read buffer at a time, and then renamed to its hash, or dropped when that
+content is already stored. The ``attachments`` table maps notes to blobs;
+deleting a row leaves the blob for gc_attachments.py, which removes blobs
+no row refers to any more.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from flask import current_app
+from sqlalchemy import select
+from db import db
+from models import Attachment
+from sharding import database_names, use_shard
+
+READ_SIZE = 64 * 1024
+TMP_DIR = 'tmp'
+INLINE_PREFIXES = ('image/', 'audio/', 'video/')
+
+class AttachmentTooLarge(Exception):
+    """The upload went over ATTACHMENTS_MAX_BYTES; nothing was stored"""
+
+def serve_inline(content_type):
+    """Media a browser can show in place; anything else, SVG included, downloads"""
+    return content_type.startswith(INLINE_PREFIXES) and content_type != 'image/svg+xml'
+
+class BlobStore:
+    """Blobs on the local filesystem, named by their SHA-256"""
+    
+    def __init__(self, root):
+        self.root = root
+    
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+    
+    def save(self, stream, max_bytes):
+        """Store everything read from ``stream``, returning ``(sha256, size)``"""
+        tmp_dir = os.path.join(self.root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge(max_bytes)
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            
+            sha256 = digest.hexdigest()
+            path = self.path(sha256)
+            try:
+                # Already stored. A fresh mtime puts the blob back inside the
+                # garbage collector's grace period until its row is committed
+                os.utime(path)
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def collect(self, referenced, grace_seconds):
+        """Delete blobs not in ``referenced`` and leftover temporary files.
+        
+        Files modified within ``grace_seconds`` are kept, so an upload whose
+        row is not committed yet survives. Returns ``(files, bytes)`` removed.
+        """
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        for directory, subdirectories, filenames in os.walk(self.root):
+            in_tmp = os.path.relpath(directory, self.root).split(os.sep)[0] == TMP_DIR
+            for filename in filenames:
+                if not in_tmp and filename in referenced:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+def collect_garbage(grace_seconds):
+    """Remove blobs no database refers to; returns ``(files, bytes)`` removed"""
+    referenced = set()
+    for name in database_names():
+        with use_shard(name):
+            referenced.update(db.session.scalars(select(Attachment.sha256).distinct()))
+    return current_app.extensions['attachments'].collect(referenced, grace_seconds)
+
+def init_attachments(app):
+    """Set up the blob store; relative ATTACHMENTS_DIR paths live in the instance folder"""
+    root = os.path.join(app.instance_path, app.config['ATTACHMENTS_DIR'])
+    app.extensions['attachments'] = BlobStore(root)
@@ -0,0 +1,149 @@
+from marshmallow import ValidationError
+from sqlalchemy import bindparam, delete, insert, select, update
+from db import db
+from models import Note, NoteTombstone
+from schemas import note_schema, note_update_schema
+from versioning import bump_notes_version
+
+OPERATIONS = ('create', 'update', 'delete')
+
+def _parse_operation(item):
+    """Validate one batch item, returning ``(op, note_id, data)``"""
+    if not isinstance(item, dict):
+        raise ValidationError({'_schema': ['Operation must be an object.']})
+    
+    fields = dict(item)
+    op = fields.pop('op', None)
+    if op not in OPERATIONS:
+        raise ValidationError({'op': ['Must be one of: create, update, delete.']})
+    if op == 'create':
+        return op, None, note_schema.load(fields)
+    
+    note_id = fields.pop('id', None)
+    if not isinstance(note_id, int) or isinstance(note_id, bool):
+        raise ValidationError({'id': ['Not a valid integer.']})
+    if op == 'update':
+        return op, note_id, note_update_schema.load(fields)
+    return op, note_id, None
+
+def apply_batch(user_id, operations):
+    """Apply mixed create/update/delete operations in one transaction.
+
+    Every item is validated with the regular note schemas first. Invalid
+    items and ids not owned by the user are reported and skipped; the rest
+    are written with one bulk statement per operation type and a single
+    commit. Returns one result per item, in request order.
+    
+    Writes are grouped by type rather than applied in request order, so a
+    note id may appear in at most one operation; otherwise ValidationError
+    is raised before anything is written.
+    """
+    results = [None] * len(operations)
+    parsed = []
+    
+    for index, item in enumerate(operations):
+        try:
+            parsed.append((index,) + _parse_operation(item))
+        except ValidationError as err:
+            results[index] = {'index': index, 'status': 400, 'error': 'Validation error', 'details': err.messages}
+    
+    first_use = {}
+    for index, op, note_id, _ in parsed:
+        if op == 'create':
+            continue
+        if note_id in first_use:
+            raise ValidationError({'operations': [
+                f'Operation {index} references note {note_id}, already used by operation {first_use[note_id]}.'
+            ]})
+        first_use[note_id] = index
+    
+    # One query resolves ownership for every referenced note
+    referenced = {note_id for _, op, note_id, _ in parsed if op != 'create'}
+    owned = set()
+    if referenced:
+        owned = {
+            row.id for row in
+            db.session.query(Note.id).filter(Note.user_id == user_id, Note.id.in_(referenced))
+        }
+    
+    creates, updates, deletes = [], [], []
+    for index, op, note_id, data in parsed:
+        if op != 'create' and note_id not in owned:
+            results[index] = {'index': index, 'op': op, 'id': note_id, 'status': 404, 'error': 'Note not found'}
+        elif op == 'create':
+            creates.append((index, data))
+        elif op == 'update':
+            updates.append((index, note_id, data))
+        else:
+            deletes.append((index, note_id))
+    
+    if not (creates or updates or deletes):
+        return results
+    
+    # The whole batch shares one change sequence number
+    version = bump_notes_version(user_id)
+    
+    touched_ids = []
+    if creates:
+        rows = [
+            {'title': data['title'], 'content': data.get('content', ''), 'user_id': user_id, 'change_seq': version}
+            for _, data in creates
+        ]
+        # A single executemany; RETURNING would cost a statement per row with
+        # the NEXT_NOTE_ID default. The fresh change_seq picks out the new
+        # notes, and ids are allocated in row order.
+        db.session.execute(insert(Note), rows)
+        new_ids = db.session.scalars(
+            select(Note.id).where(Note.user_id == user_id, Note.change_seq == version).order_by(Note.id)
+        ).all()
+        for (index, _), note_id in zip(creates, new_ids):
+            results[index] = {'index': index, 'op': 'create', 'id': note_id, 'status': 201}
+            touched_ids.append(note_id)
+    
+    if updates:
+        # One executemany per set of changed fields; ownership was checked above
+        groups = {}
+        for _, note_id, data in updates:
+            params = {f'new_{name}': value for name, value in data.items()}
+            params['note_id'] = note_id
+            groups.setdefault(tuple(sorted(data)), []).append(params)
+        for names, rows in groups.items():
+            statement = (
+                update(Note.__table__)
+                .where(Note.id == bindparam('note_id'))
+                .values(
+                    version=Note.version + 1,
+                    change_seq=version,
+                    **{name: bindparam(f'new_{name}') for name in names}
+                )
+            )
+            db.session.execute(statement, rows)
+        for index, note_id, _ in updates:
+            results[index] = {'index': index, 'op': 'update', 'id': note_id, 'status': 200}
+            touched_ids.append(note_id)
+    
+    if deletes:
+        delete_ids = {note_id for _, note_id in deletes}
+        db.session.execute(
+            delete(Note).where(Note.user_id == user_id, Note.id.in_(delete_ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(insert(NoteTombstone), [
+            {'note_id': note_id, 'user_id': user_id, 'change_seq': version}
+            for note_id in delete_ids
+        ])
+        for index, note_id in deletes:
+            results[index] = {'index': index, 'op': 'delete', 'id': note_id, 'status': 204}
+    
+    db.session.commit()
+    
+    # Return the final state of created/updated notes, fetched in one query
+    deleted = {note_id for _, note_id in deletes}
+    live_ids = set(touched_ids) - deleted
+    if live_ids:
+        notes = {note.id: note for note in Note.query.filter(Note.id.in_(live_ids))}
+        for result in results:
+            if result.get('status') in (200, 201) and result['id'] in notes:
+                result['note'] = note_schema.dump(notes[result['id']])
+    
+    return results
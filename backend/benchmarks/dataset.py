@@ -0,0 +1,102 @@
+"""
+Seeded synthetic dataset for benchmarks
+Notes per user follow a Zipf-like skew and content sizes a log-normal
+distribution, so a few heavy users own most of the data as in real traffic.
+"""
+
+import math
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from db import db, hash_password
+from models import User, Note
+
+BENCH_PASSWORD = 'benchmark-password'
+
+WORDS = (
+    'meeting agenda project roadmap budget review draft idea todo follow up '
+    'release deploy database index cache query latency design sketch recipe '
+    'travel book reading list grocery workout journal sprint retro bug fix '
+    'customer invoice contract research summary outline lecture chapter quote'
+).split()
+
+class Dataset:
+    """Users with their generated notes; ``note_ids`` is filled on load"""
+    def __init__(self, seed, users):
+        self.seed = seed
+        self.users = users
+        self.note_ids = {}
+    
+    @property
+    def note_count(self):
+        return sum(len(user['notes']) for user in self.users)
+    
+    def user_weights(self):
+        """Request traffic per user, proportional to how many notes they own"""
+        return [len(user['notes']) for user in self.users]
+
+def zipf_counts(rng, users, total, skew):
+    """Split ``total`` notes over ``users`` with rank-based Zipf weights"""
+    weights = [1 / (rank ** skew) for rank in range(1, users + 1)]
+    rng.shuffle(weights)
+    scale = total / sum(weights)
+    return [max(1, round(weight * scale)) for weight in weights]
+
+def random_text(rng, size):
+    """Roughly ``size`` characters of word salad, split into paragraphs"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if rng.random() < 0.02:
+            words.append('\n\n')
+    return ' '.join(words)[:size]
+
+def generate(seed=1, users=50, notes=5000, skew=1.1, median_size=800, max_size=64 * 1024):
+    """Build a deterministic dataset: the same arguments give the same data"""
+    rng = random.Random(seed)
+    now = datetime(2024, 1, 1)
+    generated = []
+    
+    for index, count in enumerate(zipf_counts(rng, users, notes, skew)):
+        user_notes = []
+        for _ in range(count):
+            # Some notes are title-only; the rest have log-normal sizes
+            if rng.random() < 0.05:
+                size = 0
+            else:
+                size = min(max_size, int(rng.lognormvariate(math.log(median_size), 1.0)))
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            user_notes.append({
+                'title': random_text(rng, rng.randint(8, 60)).strip() or 'untitled',
+                'content': random_text(rng, size) if size else None,
+                'created_at': created_at,
+                'updated_at': created_at + timedelta(seconds=rng.randint(0, 30 * 24 * 3600)),
+            })
+        generated.append({'email': f'bench{index}@example.com', 'notes': user_notes})
+    
+    return Dataset(seed, generated)
+
+def load(dataset, batch_size=1000):
+    """Insert a dataset into the current app's database with bulk INSERTs"""
+    # Every user shares one password so seeding pays for a single hash
+    password_hash = hash_password(BENCH_PASSWORD)
+    
+    for user in dataset.users:
+        user_id = db.session.execute(
+            insert(User)
+            .values(email=user['email'], password_hash=password_hash, notes_version=1)
+            .returning(User.id)
+        ).scalar_one()
+        user['id'] = user_id
+        
+        rows = [dict(note, user_id=user_id, change_seq=1) for note in user['notes']]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(insert(Note), rows[start:start + batch_size])
+        db.session.commit()
+        
+        dataset.note_ids[user_id] = list(
+            db.session.scalars(db.select(Note.id).filter_by(user_id=user_id).order_by(Note.id))
+        )
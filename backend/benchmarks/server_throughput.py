@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Compare request throughput of the development server and gunicorn
+
+Starts the app under each server against a fresh temporary database, seeds
+one user with some notes and hammers GET /api/notes from concurrent
+keep-alive clients. Run from the backend directory:
+
+    python benchmarks/server_throughput.py --clients 16 --duration 10
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEV_SERVER = [
+    sys.executable, '-c',
+    "import os; from wsgi import app; "
+    "app.run(host='127.0.0.1', port=int(os.environ['BENCH_PORT']), debug=True, use_reloader=False)"
+]
+GUNICORN = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+
+def request(conn, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            status, _ = request(conn, 'GET', '/api/health')
+            conn.close()
+            if status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+def seed(port, notes):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    credentials = {'email': 'bench@example.com', 'password': 'benchpassword'}
+    request(conn, 'POST', '/api/auth/register', credentials)
+    _, body = request(conn, 'POST', '/api/auth/login', credentials)
+    headers = {'Authorization': f"Bearer {json.loads(body)['access_token']}"}
+    operations = [{'op': 'create', 'title': f'Note {i}', 'content': 'x' * 500} for i in range(notes)]
+    request(conn, 'POST', '/api/notes/batch', {'operations': operations}, headers)
+    conn.close()
+    return headers
+
+def load(port, headers, clients, duration, path):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+    
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            try:
+                status, _ = request(conn, 'GET', path, headers=headers)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                status = None
+            if status == 200:
+                local.append(time.perf_counter() - started)
+            else:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    latencies.sort()
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+    }
+
+def run(name, command, port, args):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{db_path}',
+        BENCH_PORT=str(port),
+        SERVER_BIND=f'127.0.0.1:{port}',
+        SERVER_WORKERS=str(args.workers),
+        SERVER_THREADS=str(args.threads),
+        # A single benchmark user would otherwise hit the per-user rate limit
+        RATE_LIMIT_ENABLED='false',
+    )
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        headers = seed(port, args.notes)
+        result = load(port, headers, args.clients, args.duration, args.path)
+    finally:
+        server.terminate()
+        server.wait()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+    return dict(result, server=name)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--notes', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--path', default='/api/notes?limit=20')
+    args = parser.parse_args()
+    
+    results = [
+        run('werkzeug dev server (debug)', DEV_SERVER, 5101, args),
+        run(f'gunicorn {args.workers}x{args.threads} gthread', GUNICORN, 5102, args),
+    ]
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
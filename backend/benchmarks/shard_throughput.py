@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Measure note write throughput as the number of shards grows
+
+For each shard count, builds the app on fresh SQLite files (a directory plus
+that many shards), registers one user per writer thread, spreads the users
+evenly over the shards and has every writer create notes for a fixed time.
+Writers for different users only contend for the database lock when their
+users share a shard.
+
+Sharding pays off when commits hold the lock for a while, i.e. when they
+wait for durable storage. On a machine whose disk acknowledges fsync from
+cache, --commit-latency-ms emulates slower storage by sleeping inside each
+commit, with the write lock held. Run from the backend directory:
+
+    python -m benchmarks.shard_throughput --shards 1 2 4 --writers 8 --commit-latency-ms 5
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import event
+
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+from app import create_app
+from config import Config
+from db import db, init_db
+from models import User
+from sharding import move_user, shard_names
+
+PASSWORD = 'benchpassword'
+
+def make_app(directory, shards, synchronous):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'directory.db')}",
+        'SQLALCHEMY_BINDS': {
+            f'shard_{index}': f"sqlite:///{os.path.join(directory, f'shard_{index}.db')}"
+            for index in range(shards)
+        },
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'ADMISSION_ENABLED': False,
+        'CACHE_BACKEND': 'none',
+        'METRICS_ENABLED': False,
+        'SQLITE_PRAGMAS': {**Config.SQLITE_PRAGMAS, 'synchronous': synchronous},
+    }
+    return create_app(config)
+
+def run(shards, writers, duration, content_size, synchronous, commit_latency):
+    with tempfile.TemporaryDirectory(dir=os.environ.get('BENCH_DIR')) as directory:
+        app = make_app(directory, shards, synchronous)
+        init_db(app)
+        client = app.test_client()
+        headers = []
+        for index in range(writers):
+            credentials = {'email': f'writer{index}@example.com', 'password': PASSWORD}
+            user_id = client.post('/api/auth/register', json=credentials).json['id']
+            token = client.post('/api/auth/login', json=credentials).json['access_token']
+            headers.append({'Authorization': f'Bearer {token}'})
+            with app.app_context():
+                # Even spread, so the result does not depend on where a few ids hash to
+                names = shard_names()
+                move_user(user_id, names[index % len(names)])
+        
+        if commit_latency:
+            def slow_commit(connection):
+                time.sleep(commit_latency)
+            with app.app_context():
+                for engine in db.engines.values():
+                    event.listen(engine, 'commit', slow_commit)
+        
+        counts = [0] * writers
+        errors = [0] * writers
+        start = threading.Barrier(writers + 1)
+        body = {'title': 'Benchmark note', 'content': 'x' * content_size}
+        
+        def writer(index):
+            local_client = app.test_client()
+            start.wait()
+            stop_at = time.perf_counter() + duration
+            while time.perf_counter() < stop_at:
+                response = local_client.post('/api/notes', json=body, headers=headers[index])
+                if response.status_code == 201:
+                    counts[index] += 1
+                else:
+                    errors[index] += 1
+        
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        
+        placements = {}
+        with app.app_context():
+            for shard, in db.session.query(User.shard):
+                placements[shard] = placements.get(shard, 0) + 1
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+    return sum(counts) / elapsed, sum(errors), placements
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--content-size', type=int, default=1000)
+    parser.add_argument('--synchronous', default='FULL',
+                        help='SQLite synchronous pragma; FULL makes each commit wait for the disk')
+    parser.add_argument('--commit-latency-ms', type=float, default=0.0,
+                        help='extra time each commit holds the write lock, to emulate slow storage')
+    args = parser.parse_args()
+    
+    baseline = None
+    print(f'{args.writers} writers, {args.duration:g}s each, commit latency {args.commit_latency_ms:g} ms')
+    print(f"{'shards':>6} {'writes/s':>10} {'speedup':>8} {'errors':>7}  users per shard")
+    for shards in args.shards:
+        throughput, errors, placements = run(
+            shards, args.writers, args.duration, args.content_size, args.synchronous,
+            args.commit_latency_ms / 1000
+        )
+        baseline = baseline or throughput
+        spread = ' '.join(f'{count}' for _, count in sorted(placements.items(), key=lambda item: str(item[0])))
+        print(f'{shards:>6} {throughput:>10.1f} {throughput / baseline:>7.2f}x {errors:>7}  {spread}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark suite
+
+Seeds a fresh database with a synthetic dataset (see dataset.py), then drives
+each endpoint from concurrent clients and reports throughput, p50/p95/p99
+latency and SQL statements per request. Run from the backend directory:
+
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json --threshold 0.2
+
+With --compare the exit status is 1 when any scenario regressed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Statements issued by the current thread's request
+_counter = threading.local()
+
+class Workload:
+    """Shared state the scenarios draw users and notes from"""
+    def __init__(self, dataset, tokens):
+        self.dataset = dataset
+        self.tokens = tokens
+        self.user_ids = [user['id'] for user in dataset.users]
+        self.weights = dataset.user_weights()
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.versions = {}
+        self.created = []
+    
+    def pick_user(self, rng):
+        return rng.choices(self.user_ids, weights=self.weights)[0]
+    
+    def headers(self, user_id):
+        return {'Authorization': f'Bearer {self.tokens[user_id]}'}
+    
+    def pick_note(self, rng, user_id):
+        return rng.choice(self.dataset.note_ids[user_id])
+    
+    def checkout(self, rng):
+        """Reserve a note so concurrent writers never race on its version"""
+        while True:
+            user_id = self.pick_user(rng)
+            note_id = self.pick_note(rng, user_id)
+            with self.lock:
+                if note_id not in self.busy:
+                    self.busy.add(note_id)
+                    return user_id, note_id, self.versions.get(note_id, 1)
+    
+    def checkin(self, note_id, version):
+        with self.lock:
+            self.busy.discard(note_id)
+            if version is not None:
+                self.versions[note_id] = version
+
+def words(rng, count):
+    from benchmarks.dataset import WORDS
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+def list_page(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes?limit=50', headers=work.headers(user_id))
+
+def list_summary(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes?limit=50&view=summary', headers=work.headers(user_id))
+
+def list_all(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes?view=summary', headers=work.headers(user_id))
+
+def get_note(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get(f'/api/notes/{work.pick_note(rng, user_id)}', headers=work.headers(user_id))
+
+def search(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get(f'/api/notes/search?q={words(rng, 1)}', headers=work.headers(user_id))
+
+def changes(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes/changes?since=1', headers=work.headers(user_id))
+
+def stats(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes/stats', headers=work.headers(user_id))
+
+def export(client, work, rng):
+    user_id = work.pick_user(rng)
+    return client.get('/api/notes/export', headers=work.headers(user_id))
+
+def create(client, work, rng):
+    user_id = work.pick_user(rng)
+    response = client.post('/api/notes', json={
+        'title': words(rng, 4),
+        'content': words(rng, rng.randint(20, 400)),
+    }, headers=work.headers(user_id))
+    if response.status_code == 201:
+        with work.lock:
+            work.created.append((user_id, response.json['id']))
+    return response
+
+def update(client, work, rng):
+    user_id, note_id, _ = work.checkout(rng)
+    version = None
+    try:
+        response = client.put(f'/api/notes/{note_id}', json={
+            'title': words(rng, 4),
+            'content': words(rng, rng.randint(20, 400)),
+        }, headers=work.headers(user_id))
+        if response.status_code == 200:
+            version = response.json['version']
+    finally:
+        work.checkin(note_id, version)
+    return response
+
+def patch(client, work, rng):
+    user_id, note_id, base_version = work.checkout(rng)
+    version = None
+    try:
+        response = client.patch(f'/api/notes/{note_id}', json={
+            'base_version': base_version,
+            'patches': [{'start': 0, 'end': 0, 'text': words(rng, 3) + ' '}],
+        }, headers=work.headers(user_id))
+        if response.status_code == 200:
+            version = response.json['version']
+    finally:
+        work.checkin(note_id, version)
+    return response
+
+def delete(client, work, rng):
+    # Only delete notes created by this run so other scenarios keep their data
+    with work.lock:
+        user_id, note_id = work.created.pop()
+    return client.delete(f'/api/notes/{note_id}', headers=work.headers(user_id))
+
+def login(client, work, rng):
+    from benchmarks.dataset import BENCH_PASSWORD
+    user = work.dataset.users[work.user_ids.index(work.pick_user(rng))]
+    return client.post('/api/auth/login', json={'email': user['email'], 'password': BENCH_PASSWORD})
+
+# name -> (callable, expected status, share of --requests)
+SCENARIOS = {
+    'list_page': (list_page, 200, 1.0),
+    'list_summary': (list_summary, 200, 1.0),
+    'list_all': (list_all, 200, 0.25),
+    'get_note': (get_note, 200, 1.0),
+    'search': (search, 200, 1.0),
+    'changes': (changes, 200, 0.5),
+    'stats': (stats, 200, 0.5),
+    'export': (export, 200, 0.1),
+    'create': (create, 201, 0.5),
+    'update': (update, 200, 0.5),
+    'patch': (patch, 200, 0.5),
+    'delete': (delete, 204, 0.25),
+    # Password hashing is deliberately slow, so keep this one small
+    'login': (login, 200, 0.05),
+}
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+def run_scenario(app, work, name, total, concurrency, seed):
+    """Issue ``total`` requests from ``concurrency`` threads and summarise them"""
+    scenario, expected_status, _ = SCENARIOS[name]
+    latencies = []
+    statements = []
+    errors = [0]
+    remaining = [total]
+    lock = threading.Lock()
+    
+    def worker(index):
+        client = app.test_client()
+        rng = random.Random(f'{seed}-{name}-{index}')
+        local_latencies = []
+        local_statements = []
+        local_errors = 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            _counter.count = 0
+            started = time.perf_counter()
+            response = scenario(client, work, rng)
+            # Drain streamed bodies inside the timed section
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if response.status_code == expected_status:
+                local_latencies.append(elapsed)
+                local_statements.append(_counter.count)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            statements.extend(local_statements)
+            errors[0] += local_errors
+    
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'sql_per_request': round(sum(statements) / len(statements), 2) if statements else None,
+        'sql_max': max(statements) if statements else None,
+    }
+
+def run(args):
+    """Build the app on a temporary database, seed it and run the scenarios"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    # Config reads the environment at import time
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # The skewed traffic would otherwise trip the per-user rate limit
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+    from app import create_app
+    from db import db, init_db
+    from benchmarks import dataset
+    
+    app = create_app()
+    init_db(app)
+    
+    try:
+        with app.app_context():
+            data = dataset.generate(args.seed, args.users, args.notes, args.skew)
+            dataset.load(data)
+            tokens = {user['id']: create_access_token(identity=str(user['id'])) for user in data.users}
+            
+            @event.listens_for(db.engine, 'before_cursor_execute')
+            def count_statement(conn, cursor, statement, parameters, context, executemany):
+                _counter.count = getattr(_counter, 'count', 0) + 1
+        
+        work = Workload(data, tokens)
+        results = {}
+        for name in args.scenarios:
+            total = max(1, int(args.requests * SCENARIOS[name][2]))
+            if name == 'delete':
+                total = min(total, len(work.created))
+                if not total:
+                    continue
+            results[name] = run_scenario(app, work, name, total, args.concurrency, args.seed)
+            print(f'{name:>14}: {format_result(results[name])}', file=sys.stderr)
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+    
+    return {
+        'meta': {
+            'seed': args.seed,
+            'users': args.users,
+            'notes': data.note_count,
+            'skew': args.skew,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+def format_result(result):
+    return (
+        f"{result['requests_per_second']:>8} req/s  "
+        f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  "
+        f"sql {result['sql_per_request']}  errors {result['errors']}"
+    )
+
+def compare(baseline, current, threshold):
+    """Return a list of regressions of ``current`` against ``baseline``.
+    
+    Latency (p95) and throughput are flagged when they are worse by more than
+    ``threshold`` (a fraction). SQL statement counts are deterministic, so any
+    increase of half a statement per request or more is flagged, as are new
+    errors.
+    """
+    regressions = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        if before['p95_ms'] and after['p95_ms'] and after['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+        if (before['requests_per_second'] and after['requests_per_second'] is not None
+                and after['requests_per_second'] < before['requests_per_second'] * (1 - threshold)):
+            regressions.append(
+                f"{name}: throughput {before['requests_per_second']} -> {after['requests_per_second']} req/s"
+            )
+        if (before['sql_per_request'] is not None and after['sql_per_request'] is not None
+                and after['sql_per_request'] >= before['sql_per_request'] + 0.5):
+            regressions.append(
+                f"{name}: SQL statements per request {before['sql_per_request']} -> {after['sql_per_request']}"
+            )
+        if after['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--notes', type=int, default=5000, help='approximate total notes')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for notes per user')
+    parser.add_argument('--requests', type=int, default=400, help='requests per full-share scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--save', metavar='FILE', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed latency/throughput change')
+    args = parser.parse_args(argv)
+    
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    current = run(args)
+    
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+            f.write('\n')
+        print(f'Saved results to {args.save}', file=sys.stderr)
+    else:
+        print(json.dumps(current, indent=2))
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ('seed', 'users', 'notes', 'concurrency'):
+            if baseline['meta'].get(key) != current['meta'][key]:
+                print(f"warning: {key} differs from baseline "
+                      f"({baseline['meta'].get(key)} vs {current['meta'][key]})", file=sys.stderr)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+        print('No regressions against baseline', file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
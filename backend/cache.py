@@ -0,0 +1,179 @@
+"""
+Read-through cache for serialized note payloads.
+
+Entries are keyed by user and that user's ``notes_version``, which every
+note write bumps, so a write makes all of the user's cached reads
+unreachable at once and nothing has to be deleted. The key also carries
+the account's creation time, since a version number alone repeats when an
+id is held by a new account. Stale generations fall
+out through LRU eviction (in-process backend) or expiry (shared backend).
+
+Backends share a small get/set interface. ``lru`` keeps entries in process
+memory bounded by total bytes. ``redis`` shares them between workers and
+needs the optional ``redis`` package.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import redis
+except ImportError:  # optional
+    redis = None
+
+class LRUCache:
+    """In-process cache evicting least recently used entries past ``max_bytes``"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        cost = len(key) + len(value)
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(key) + len(previous)
+            self.entries[key] = value
+            self.size += cost
+            while self.size > self.max_bytes:
+                old_key, old_value = self.entries.popitem(last=False)
+                self.size -= len(old_key) + len(old_value)
+                self.evictions += 1
+    
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'evictions_total': self.evictions}
+
+class RedisCache:
+    """Shared cache on any client with redis-style ``get`` and ``set(ex=)``"""
+    
+    def __init__(self, client, ttl, prefix='notes-cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+    
+    @classmethod
+    def from_url(cls, url, ttl):
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND=redis needs the redis package installed')
+        return cls(redis.Redis.from_url(url), ttl)
+    
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+    
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+    
+    def stats(self):
+        # Evictions happen inside the server and are reported there
+        return {}
+
+class CachedResponse:
+    """A cached JSON body with the validators it was served with"""
+    
+    def __init__(self, body, etag, last_modified=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+    
+    def pack(self):
+        last_modified = self.last_modified.isoformat() if self.last_modified else ''
+        header = f'{self.etag}\n{last_modified}\n'.encode('utf-8')
+        return header + self.body
+    
+    @classmethod
+    def unpack(cls, value):
+        etag, last_modified, body = bytes(value).split(b'\n', 2)
+        last_modified = datetime.fromisoformat(last_modified.decode('utf-8')) if last_modified else None
+        return cls(body, etag.decode('utf-8'), last_modified)
+
+class ResponseCache:
+    """Backend plus hit/miss counters; failures of a shared backend count as misses"""
+    
+    def __init__(self, backend, max_entry_bytes):
+        self.backend = backend
+        self.max_entry_bytes = max_entry_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+    
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+    
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            self._count('errors')
+            value = None
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return CachedResponse.unpack(value)
+    
+    def set(self, key, entry):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        try:
+            self.backend.set(key, entry.pack())
+        except Exception:
+            self._count('errors')
+            return
+        self._count('stores')
+    
+    def tee(self, key, chunks, etag, last_modified=None):
+        """Pass a streamed body through, caching it once complete if small enough"""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                size += len(data)
+                if size <= self.max_entry_bytes:
+                    parts.append(data)
+                else:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            self.set(key, CachedResponse(b''.join(parts), etag, last_modified))
+    
+    def stats(self):
+        with self.lock:
+            values = {
+                'hits_total': self.hits,
+                'misses_total': self.misses,
+                'stores_total': self.stores,
+                'errors_total': self.errors,
+            }
+        values.update(self.backend.stats())
+        return values
+
+def init_cache(app):
+    """Create the configured response cache, if any"""
+    backend_name = app.config['CACHE_BACKEND']
+    if backend_name == 'none':
+        return
+    if backend_name == 'lru':
+        backend = LRUCache(app.config['CACHE_MAX_BYTES'])
+    elif backend_name == 'redis':
+        backend = RedisCache.from_url(app.config['CACHE_REDIS_URL'], app.config['CACHE_TTL'])
+    else:
+        raise ValueError(f'Unknown CACHE_BACKEND {backend_name!r}; expected lru, redis or none')
+    app.extensions['response_cache'] = ResponseCache(backend, app.config['CACHE_MAX_ENTRY_BYTES'])
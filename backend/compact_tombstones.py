@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Script to prune old note tombstones
+Run this periodically (e.g. from cron) to keep the delta sync change log small
+"""
+
+from app import create_app
+from sharding import database_names, use_shard
+from sync import compact_tombstones
+
+if __name__ == '__main__':
+    app = create_app()
+    removed = 0
+    with app.app_context():
+        for name in database_names():
+            with use_shard(name):
+                removed += compact_tombstones(app.config['TOMBSTONE_RETENTION_DAYS'])
+    print(f"Removed {removed} tombstones.")
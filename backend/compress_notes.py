@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Script to convert stored note content to the current compression setting
+Compresses large notes when NOTES_COMPRESS_CONTENT is enabled and expands
+compressed notes when it is disabled. Safe to interrupt and run again.
+Databases created before compression existed are upgraded first, which
+adds and fills in the content_size/stored_size columns.
+"""
+
+from app import create_app
+from db import db
+from migrations import upgrade_schema
+from sharding import database_names, shard_engine, use_shard
+from storage import migrate_content
+
+BATCH_SIZE = 500
+
+if __name__ == '__main__':
+    app = create_app()
+    rewritten = 0
+    with app.app_context():
+        for name in database_names():
+            upgrade_schema(shard_engine(name))
+            with use_shard(name):
+                rewritten += migrate_content(db.session, BATCH_SIZE)
+    print(f"Rewrote {rewritten} notes.")
@@ -0,0 +1,251 @@
+"""
+HTTP response compression and compressed request bodies.
+
+gzip and deflate always work; br and zstd are offered when the optional
+``brotli`` / ``zstandard`` packages are installed.
+"""
+import io
+import json
+import zlib
+from flask import request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import get_input_stream
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+# Separator between an ETag and the encoding it was served with
+ETAG_ENCODING_SEPARATOR = '-'
+
+# Compressed bytes read per step; bounds how much one step can expand to
+REQUEST_READ_SIZE = 8 * 1024
+
+def available_encodings():
+    """Supported content codings, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.extend(['gzip', 'deflate'])
+    return encodings
+
+class _ZlibCompressor:
+    def __init__(self, level, wbits):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    
+    def compress(self, data):
+        # Sync-flush so each streamed chunk can be decoded on arrival
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+    
+    def finish(self):
+        return self._compressor.flush()
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+    
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+    
+    def finish(self):
+        return self._compressor.finish()
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    
+    def finish(self):
+        return self._compressor.flush()
+
+def new_compressor(encoding, config):
+    if encoding == 'gzip':
+        return _ZlibCompressor(config['COMPRESS_LEVEL'], 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _ZlibCompressor(config['COMPRESS_LEVEL'], zlib.MAX_WBITS)
+    if encoding == 'br':
+        return _BrotliCompressor(config['COMPRESS_BR_LEVEL'])
+    if encoding == 'zstd':
+        return _ZstdCompressor(config['COMPRESS_ZSTD_LEVEL'])
+    raise ValueError(f'Unsupported encoding {encoding!r}')
+
+class _ZlibDecompressor:
+    def __init__(self, wbits):
+        self._decompressor = zlib.decompressobj(wbits)
+    
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+    
+    def finished(self):
+        return self._decompressor.eof
+
+class _BrotliDecompressor:
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+    
+    def decompress(self, data):
+        return self._decompressor.process(data)
+    
+    def finished(self):
+        return self._decompressor.is_finished()
+
+class _ZstdDecompressor:
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+    
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+    
+    def finished(self):
+        return self._decompressor.eof
+
+def new_decompressor(encoding):
+    """Return a decompressor for ``encoding``, or None if unsupported"""
+    if encoding in ('gzip', 'x-gzip'):
+        return _ZlibDecompressor(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _ZlibDecompressor(zlib.MAX_WBITS)
+    if encoding == 'br' and brotli is not None:
+        return _BrotliDecompressor()
+    if encoding == 'zstd' and zstandard is not None:
+        return _ZstdDecompressor()
+    return None
+
+# What a corrupt body raises, per available codec
+DECOMPRESS_ERRORS = (zlib.error,)
+if brotli is not None:
+    DECOMPRESS_ERRORS += (brotli.error,)
+if zstandard is not None:
+    DECOMPRESS_ERRORS += (zstandard.ZstdError,)
+
+def _compress_iter(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _is_compressible(response, config):
+    # A 304 has no body, but stands in for a 200 that would be compressed
+    if response.status_code < 200 or response.status_code in (204, 206):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in config['COMPRESS_MIMETYPES']
+
+def compress_response(response, config):
+    """Compress ``response`` in place according to Accept-Encoding"""
+    if not config['COMPRESS_ENABLED'] or not _is_compressible(response, config):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    
+    etag, weak = response.get_etag()
+    if etag:
+        # Each encoding is a different representation with its own ETag. It
+        # depends only on the negotiated encoding, not on whether the body
+        # was big enough to compress, so a 304 carries the same one as the 200
+        response.set_etag(f'{etag}{ETAG_ENCODING_SEPARATOR}{encoding}', weak)
+    if response.status_code == 304:
+        return response
+    
+    compressor = new_compressor(encoding, config)
+    if response.is_streamed:
+        response.response = _compress_iter(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compressor.compress(data) + compressor.finish())
+    
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+class _DecompressingStream(io.RawIOBase):
+    """Readable stream that decodes a compressed WSGI input on the fly"""
+    
+    def __init__(self, source, decompressor, max_size):
+        self._source = source
+        self._decompressor = decompressor
+        self._max_size = max_size
+        self._buffer = b''
+        self._total = 0
+        self._eof = False
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, target):
+        while not self._buffer and not self._eof:
+            chunk = self._source.read(REQUEST_READ_SIZE)
+            if not chunk:
+                self._eof = True
+                if not self._decompressor.finished():
+                    raise BadRequest('Truncated compressed request body')
+                break
+            try:
+                self._buffer = self._decompressor.decompress(chunk)
+            except DECOMPRESS_ERRORS:
+                raise BadRequest('Malformed compressed request body')
+            self._total += len(self._buffer)
+            if self._total > self._max_size:
+                raise RequestEntityTooLarge()
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+class DecompressRequestMiddleware:
+    """WSGI middleware that transparently decodes Content-Encoding bodies.
+
+    The decoded size is capped so a small compressed upload cannot expand
+    without bound.
+    """
+    
+    def __init__(self, wsgi_app, max_size):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+    
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            decompressor = new_decompressor(encoding)
+            if decompressor is None:
+                body = json.dumps({'error': f'Unsupported Content-Encoding: {encoding}'})
+                return Response(body, 415, mimetype='application/json')(environ, start_response)
+            raw = _DecompressingStream(get_input_stream(environ), decompressor, self.max_size)
+            environ['wsgi.input'] = io.BufferedReader(raw)
+            environ['wsgi.input_terminated'] = True
+            environ.pop('CONTENT_LENGTH', None)
+            environ.pop('HTTP_CONTENT_ENCODING', None)
+        return self.wsgi_app(environ, start_response)
+
+def init_compression(app):
+    """Enable response compression and compressed request bodies"""
+    app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app, app.config['COMPRESS_MAX_REQUEST_SIZE'])
+    
+    @app.after_request
+    def compress(response):
+        return compress_response(response, app.config)
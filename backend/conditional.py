@@ -0,0 +1,62 @@
+from datetime import timezone
+from hashlib import sha1
+from flask import Response, request
+
+def make_etag(*parts):
+    """Build a strong ETag value from cheap version components"""
+    raw = ':'.join(str(part) for part in parts).encode('utf-8')
+    return sha1(raw).hexdigest()
+
+def version_etag(kind, object_id, version):
+    """ETag that carries a row version, so If-Match can go into a WHERE clause"""
+    return f'{kind}.{object_id}.{version}'
+
+def if_match_versions(kind, object_id):
+    """Versions allowed by If-Match for a version_etag() resource.
+
+    Returns None when the header is absent or ``*``; otherwise a set of
+    versions, empty when none of the tags could match this resource.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    prefix = f'{kind}.{object_id}.'
+    versions = set()
+    for tag in request.if_match.as_set():
+        tag = tag.split('-', 1)[0]
+        if tag.startswith(prefix) and tag[len(prefix):].isdigit():
+            versions.add(int(tag[len(prefix):]))
+    return versions
+
+def _as_utc(value):
+    """Timestamps are stored as naive UTC; HTTP dates need them aware"""
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+def _matches(etag, candidates):
+    """ETags of compressed responses carry an ``-<encoding>`` suffix"""
+    if candidates.star_tag:
+        return True
+    return any(tag.split('-', 1)[0] == etag for tag in candidates.as_set())
+
+def is_not_modified(etag, last_modified=None):
+    """Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110)"""
+    if request.if_none_match:
+        return _matches(etag, request.if_none_match)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _as_utc(last_modified) <= request.if_modified_since
+    return False
+
+def add_validators(response, etag, last_modified=None):
+    """Attach ETag/Last-Modified and make clients revalidate before reuse"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _as_utc(last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, last_modified=None):
+    """Build an empty 304 response carrying the current validators.
+
+    Typed like the JSON it stands in for, so compression gives it the
+    same encoding-specific ETag as the 200.
+    """
+    return add_validators(Response(status=304, mimetype='application/json'), etag, last_modified)
@@ -8,6 +8,127 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'dev-jwt-secret-key'
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
+    # Optional read replicas, comma separated; see replicas.py
+    DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    # Optional note shards, comma separated; the main database stays the
+    # user directory. See sharding.py
+    DATABASE_SHARD_URLS = [url for url in os.environ.get('DATABASE_SHARD_URLS', '').split(',') if url]
+    SQLALCHEMY_BINDS = {
+        **{f'replica_{index}': url for index, url in enumerate(DATABASE_REPLICA_URLS)},
+        **{f'shard_{index}': url for index, url in enumerate(DATABASE_SHARD_URLS)},
+    }
+    # How long an unreachable replica is skipped before it is tried again
+    REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+    # Retry-After for note writes refused while a user moves between shards
+    SHARD_MOVE_RETRY_AFTER = int(os.environ.get('SHARD_MOVE_RETRY_AFTER', 5))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('SQLALCHEMY_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('SQLALCHEMY_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('SQLALCHEMY_POOL_RECYCLE', 3600)),
+        'pool_pre_ping': True,
+    }
+    # Applied to every new SQLite connection; see db.init_engine_profile
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # milliseconds
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # negative means KiB
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+        'foreign_keys': os.environ.get('SQLITE_FOREIGN_KEYS', 'ON'),
+    }
     JWT_ACCESS_TOKEN_EXPIRES = 86400  # 1 day in seconds
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:5173').split(',')
+    
+    # Notes listing pagination
+    NOTES_PAGE_SIZE = int(os.environ.get('NOTES_PAGE_SIZE', 50))
+    NOTES_MAX_PAGE_SIZE = int(os.environ.get('NOTES_MAX_PAGE_SIZE', 200))
+    NOTES_SNIPPET_LENGTH = int(os.environ.get('NOTES_SNIPPET_LENGTH', 200))
+    # Rows fetched per round trip (and per chunk) when streaming listings
+    NOTES_STREAM_BATCH_SIZE = int(os.environ.get('NOTES_STREAM_BATCH_SIZE', 500))
+    
+    # Maximum number of operations accepted by POST /api/notes/batch
+    NOTES_BATCH_MAX_SIZE = int(os.environ.get('NOTES_BATCH_MAX_SIZE', 500))
+    
+    # Delta sync tombstones older than this are pruned by compact_tombstones.py
+    TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30))
+    
+    # Background account deletion; see deletion.py
+    ACCOUNT_DELETION_CHUNK_SIZE = int(os.environ.get('ACCOUNT_DELETION_CHUNK_SIZE', 500))  # notes per transaction
+    ACCOUNT_DELETION_PAUSE_MS = int(os.environ.get('ACCOUNT_DELETION_PAUSE_MS', 50))  # between chunks
+    # Pending/running jobs idle this long were cut off and are resumed; 0 turns that off
+    ACCOUNT_DELETION_RESUME_AFTER = int(os.environ.get('ACCOUNT_DELETION_RESUME_AFTER', 300))  # seconds
+    
+    # Password hashing runs on a bounded process pool; see hashing.py
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 16))
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 1))  # seconds
+    
+    # Streaming import: rows per INSERT/commit and per-record size limits
+    NOTES_IMPORT_BATCH_SIZE = int(os.environ.get('NOTES_IMPORT_BATCH_SIZE', 1000))
+    NOTES_IMPORT_MAX_RECORD_BYTES = int(os.environ.get('NOTES_IMPORT_MAX_RECORD_BYTES', 10 * 1024 * 1024))
+    
+    # Note attachments, stored once per distinct content; see attachments.py
+    ATTACHMENTS_DIR = os.environ.get('ATTACHMENTS_DIR', 'attachments')  # relative paths: under the instance folder
+    ATTACHMENTS_MAX_BYTES = int(os.environ.get('ATTACHMENTS_MAX_BYTES', 25 * 1024 * 1024))
+    ATTACHMENTS_CACHE_MAX_AGE = int(os.environ.get('ATTACHMENTS_CACHE_MAX_AGE', 86400))  # seconds, private caches
+    ATTACHMENTS_GC_GRACE_SECONDS = int(os.environ.get('ATTACHMENTS_GC_GRACE_SECONDS', 3600))  # see gc_attachments.py
+    
+    # HTTP compression; see compression.py
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzip/deflate, 1-9
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))  # 0-11
+    COMPRESS_ZSTD_LEVEL = int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3))  # 1-22
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))  # bytes
+    COMPRESS_MIMETYPES = ['application/json', 'application/x-ndjson', 'application/javascript', 'application/xml']
+    COMPRESS_MAX_REQUEST_SIZE = int(os.environ.get('COMPRESS_MAX_REQUEST_SIZE', 64 * 1024 * 1024))
+    
+    # Opt-in compression of large note content at rest; see storage.py
+    NOTES_COMPRESS_CONTENT = os.environ.get('NOTES_COMPRESS_CONTENT', 'false').lower() == 'true'
+    NOTES_COMPRESS_THRESHOLD = int(os.environ.get('NOTES_COMPRESS_THRESHOLD', 4096))  # bytes
+    NOTES_COMPRESS_LEVEL = int(os.environ.get('NOTES_COMPRESS_LEVEL', 6))
+    
+    # Request/SQL instrumentation served at /api/metrics; see metrics.py
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 1000))
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    # Bearer token the scraper sends; unset means loopback clients only
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Read-through cache of serialized note payloads; see cache.py
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru')  # lru, redis or none
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))  # lru, per process
+    CACHE_MAX_ENTRY_BYTES = int(os.environ.get('CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', 3600))  # seconds, redis only
+    
+    # Admission control and rate limits, per process; see admission.py
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 16))
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 32))
+    ADMISSION_QUEUE_TIMEOUT_MS = int(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 1000))
+    # Password hashing, export and import share a smaller budget
+    ADMISSION_EXPENSIVE_ENDPOINTS = os.environ.get(
+        'ADMISSION_EXPENSIVE_ENDPOINTS',
+        'auth.register,auth.login,notes.export_notes,notes.import_notes_upload'
+    ).split(',')
+    ADMISSION_EXPENSIVE_MAX_CONCURRENT = int(os.environ.get('ADMISSION_EXPENSIVE_MAX_CONCURRENT', 2))
+    ADMISSION_EXPENSIVE_MAX_QUEUE = int(os.environ.get('ADMISSION_EXPENSIVE_MAX_QUEUE', 8))
+    ADMISSION_EXPENSIVE_QUEUE_TIMEOUT_MS = int(os.environ.get('ADMISSION_EXPENSIVE_QUEUE_TIMEOUT_MS', 2000))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))  # seconds
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', 20))  # requests/second per user
+    RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 40))
+    
+    # Production server; see gunicorn.conf.py
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))  # per worker
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 10000))  # 0 disables recycling
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 1000))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 30))  # seconds
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))  # seconds
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))  # seconds
@@ -1,18 +1,108 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from hashing import password_hasher
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """Session that sends statements to ``g.db_shard`` or ``g.db_replica``.
+
+    sharding.use_shard sets the first for a user's note data; tables marked
+    ``info={'directory': True}`` still go to the main database.
+    replicas.read_replica sets the second for read-only handlers. Everything
+    else uses the usual bind, the primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard = g.get('db_shard')
+            if shard is not None and not (mapper is not None and mapper.local_table.info.get('directory')):
+                return shard
+            replica = g.get('db_replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Allowed values for the enumerated SQLite pragmas in Config.SQLITE_PRAGMAS
+SQLITE_PRAGMA_CHOICES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'foreign_keys': {'ON', 'OFF'},
+}
+SQLITE_PRAGMA_INTEGERS = {'busy_timeout', 'cache_size', 'mmap_size'}
+
+# busy_timeout goes first so that switching the journal mode waits for locks
+SQLITE_PRAGMA_ORDER = ['busy_timeout', 'journal_mode', 'synchronous', 'cache_size',
+                       'mmap_size', 'temp_store', 'foreign_keys']
+
+def validate_sqlite_pragmas(pragmas):
+    """Check a pragma profile, returning it normalized; raises ValueError"""
+    normalized = {}
+    for name, value in pragmas.items():
+        if name in SQLITE_PRAGMA_CHOICES:
+            if isinstance(value, bool):
+                value = 'ON' if value else 'OFF'
+            value = str(value).upper()
+            if value not in SQLITE_PRAGMA_CHOICES[name]:
+                choices = ', '.join(sorted(SQLITE_PRAGMA_CHOICES[name]))
+                raise ValueError(f'Invalid SQLite pragma {name}={value!r}; expected one of {choices}')
+        elif name in SQLITE_PRAGMA_INTEGERS:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f'SQLite pragma {name} must be an integer')
+            if name != 'cache_size' and value < 0:
+                raise ValueError(f'SQLite pragma {name} must not be negative')
+        else:
+            raise ValueError(f'Unsupported SQLite pragma {name!r}')
+        normalized[name] = value
+    return normalized
+
+def init_engine_profile(app):
+    """Apply Config.SQLITE_PRAGMAS to every new SQLite connection.
+
+    The profile is validated up front so a bad setting fails at startup
+    rather than on the first request.
+    """
+    pragmas = validate_sqlite_pragmas(app.config.get('SQLITE_PRAGMAS') or {})
+    statements = [
+        f'PRAGMA {name}={pragmas[name]}' for name in SQLITE_PRAGMA_ORDER if name in pragmas
+    ]
+    
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', set_pragmas)
 
 def init_db(app):
     """Initialize database with app context"""
     with app.app_context():
-        db.create_all()
+        # Replicas get their schema from the primary, not from here
+        db.create_all(bind_key=None)
+        # Imported here because sharding needs the models, which need db
+        from sharding import create_shard_tables, database_names, shard_engine
+        from migrations import upgrade_schema
+        create_shard_tables()
+        # create_all never alters a table that already exists
+        for name in database_names():
+            upgrade_schema(shard_engine(name))
         print("Database tables created successfully!")
 
 def hash_password(password):
     """Hash a password for storing"""
-    return generate_password_hash(password)
+    return password_hasher.hash(password)
 
 def check_password(password_hash, password):
     """Check if provided password matches the hash"""
-    return check_password_hash(password_hash, password)
+    return password_hasher.verify(password_hash, password)
+
+def password_needs_rehash(password_hash):
+    """Check if a stored hash uses outdated hashing parameters"""
+    return password_hasher.needs_rehash(password_hash)
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Script to finish pending account deletions
+Run this after a restart (or periodically) to resume deletion jobs that the
+background worker did not complete, including failed ones
+"""
+
+from app import create_app
+from deletion import resume_deletions
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        count = resume_deletions(app.config['ACCOUNT_DELETION_CHUNK_SIZE'])
+    print(f"Processed {count} account deletions.")
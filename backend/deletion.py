@@ -0,0 +1,233 @@
+"""
+Background account deletion.
+
+Deleting a user through the ORM would load every note and delete it row by
+row in one long transaction. Instead the request only records an
+AccountDeletion job. A background thread then deletes the notes in chunks
+of ACCOUNT_DELETION_CHUNK_SIZE, committing each chunk together with the
+job's progress and pausing between chunks so other requests can take the
+write lock. Because progress is committed with the work, a job can be
+resumed from wherever it stopped. Each process's thread also looks for
+pending or running jobs that nobody has touched for
+ACCOUNT_DELETION_RESUME_AFTER seconds, such as those of a worker that was
+restarted, and finishes them. delete_accounts.py does the same on demand
+and also retries failed jobs. For a sharded user the notes go from their
+shard and the job row, like the user row, stays on the directory.
+
+Requesting deletion sets deletion_requested_at on the user row, and on a
+shard's tenant row too. bump_notes_version, which every note write runs,
+only updates a row without it. So writes made with tokens issued before
+the request are refused without an extra query.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import jsonify
+from sqlalchemy import delete, select, update
+from db import db
+from models import AccountDeletion, Note, NoteTombstone, User
+from sharding import use_shard
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+# How often each process's thread looks for abandoned jobs
+RESUME_SWEEP_SECONDS = 60
+
+class AccountDeleted(Exception):
+    """A note write for an account that is deleted or queued for deletion"""
+
+def request_account_deletion(user):
+    """Queue ``user`` for deletion, returning the new or already active job"""
+    job = AccountDeletion.query.filter(
+        AccountDeletion.user_id == user.id,
+        AccountDeletion.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if job is None:
+        user.deletion_requested_at = datetime.utcnow()
+        with use_shard(user.shard):
+            if user.shard is not None:
+                # The tenant row is the one note writes check
+                db.session.execute(
+                    update(User).where(User.id == user.id).values(deletion_requested_at=user.deletion_requested_at),
+                    execution_options={'synchronize_session': False}
+                )
+            # The counters row makes the total free to read
+            notes_total = db.session.scalar(select(User.note_count).where(User.id == user.id))
+        job = AccountDeletion(user_id=user.id, notes_total=notes_total)
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+def _delete_chunk(model, user_id, chunk_size):
+    ids = select(model.id).where(model.user_id == user_id).limit(chunk_size).scalar_subquery()
+    return db.session.execute(
+        delete(model).where(model.id.in_(ids)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+def _set_job(job_id, **values):
+    db.session.execute(
+        update(AccountDeletion).where(AccountDeletion.id == job_id).values(updated_at=datetime.utcnow(), **values),
+        execution_options={'synchronize_session': False}
+    )
+
+def _delete_user(user_id):
+    db.session.execute(delete(User).where(User.id == user_id), execution_options={'synchronize_session': False})
+
+def run_deletion(job_id, chunk_size, pause=0):
+    """Run or resume a deletion job until the user and their data are gone"""
+    job = db.session.get(AccountDeletion, job_id)
+    if job is None or job.status == 'done':
+        return
+    user_id = job.user_id
+    shard = db.session.scalar(select(User.shard).where(User.id == user_id))
+    _set_job(job_id, status='running', error=None)
+    db.session.commit()
+    
+    try:
+        with use_shard(shard):
+            # Each chunk is its own short transaction, committed with its progress
+            while True:
+                deleted = _delete_chunk(Note, user_id, chunk_size)
+                _set_job(job_id, notes_deleted=AccountDeletion.notes_deleted + deleted)
+                db.session.commit()
+                if deleted < chunk_size:
+                    break
+                time.sleep(pause)
+            
+            while _delete_chunk(NoteTombstone, user_id, chunk_size) == chunk_size:
+                db.session.commit()
+                time.sleep(pause)
+            
+            # Notes written while the job ran go in the same transaction as the user
+            stragglers = _delete_chunk(Note, user_id, chunk_size)
+            _delete_chunk(NoteTombstone, user_id, chunk_size)
+            _delete_user(user_id)
+            if shard is not None:
+                # That was the shard's tenant row. Commit it before the
+                # directory's, so a finished job never leaves data behind
+                db.session.commit()
+        
+        if shard is not None:
+            _delete_user(user_id)
+        _set_job(
+            job_id,
+            status='done',
+            notes_deleted=AccountDeletion.notes_deleted + stragglers,
+            finished_at=datetime.utcnow()
+        )
+        db.session.commit()
+    except Exception as err:
+        db.session.rollback()
+        _set_job(job_id, status='failed', error=str(err))
+        db.session.commit()
+        raise
+
+def claim_abandoned_jobs(idle_seconds):
+    """Claim pending or running jobs untouched for ``idle_seconds``.
+    
+    A running job touches updated_at with every chunk, so an idle one was
+    cut off, typically by a worker restart. The claim touches updated_at in
+    a conditional UPDATE, so only one process picks each job up. Returns the
+    claimed job ids.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=idle_seconds)
+    idle = (AccountDeletion.status.in_(ACTIVE_STATUSES), AccountDeletion.updated_at < cutoff)
+    job_ids = db.session.scalars(select(AccountDeletion.id).where(*idle).order_by(AccountDeletion.id)).all()
+    claimed = []
+    for job_id in job_ids:
+        if db.session.execute(
+            update(AccountDeletion).where(AccountDeletion.id == job_id, *idle).values(updated_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        ).rowcount:
+            claimed.append(job_id)
+        db.session.commit()
+    return claimed
+
+def resume_deletions(chunk_size, pause=0):
+    """Run every unfinished job, including failed ones; returns how many ran"""
+    job_ids = db.session.scalars(
+        select(AccountDeletion.id)
+        .where(AccountDeletion.status.in_(ACTIVE_STATUSES + ('failed',)))
+        .order_by(AccountDeletion.id)
+    ).all()
+    for job_id in job_ids:
+        run_deletion(job_id, chunk_size, pause)
+    return len(job_ids)
+
+class DeletionWorker:
+    """One background thread per process working through queued jobs in order"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.thread_pid = None
+    
+    def start(self):
+        """Start this process's thread unless it is running"""
+        if self.thread_pid == os.getpid():
+            return
+        with self.lock:
+            # Started lazily and per process, so forked workers get their own
+            if self.thread is None or self.thread_pid != os.getpid():
+                self.thread = threading.Thread(target=self._run, name='account-deletion', daemon=True)
+                self.thread.start()
+                self.thread_pid = os.getpid()
+    
+    def submit(self, job_id):
+        self.start()
+        self.queue.put(job_id)
+    
+    def join(self):
+        """Block until every submitted job has finished"""
+        self.queue.join()
+    
+    def _run(self):
+        config = self.app.config
+        resume_after = config['ACCOUNT_DELETION_RESUME_AFTER']
+        while True:
+            try:
+                job_id = self.queue.get(timeout=RESUME_SWEEP_SECONDS if resume_after else None)
+            except queue.Empty:
+                self._resume_abandoned(resume_after)
+                continue
+            try:
+                with self.app.app_context():
+                    run_deletion(
+                        job_id,
+                        config['ACCOUNT_DELETION_CHUNK_SIZE'],
+                        config['ACCOUNT_DELETION_PAUSE_MS'] / 1000
+                    )
+            except Exception:
+                self.app.logger.exception('Account deletion job %s failed', job_id)
+            finally:
+                self.queue.task_done()
+    
+    def _resume_abandoned(self, idle_seconds):
+        try:
+            with self.app.app_context():
+                job_ids = claim_abandoned_jobs(idle_seconds)
+        except Exception:
+            self.app.logger.exception('Looking for abandoned account deletions failed')
+            return
+        for job_id in job_ids:
+            self.app.logger.info('Resuming abandoned account deletion job %s', job_id)
+            self.submit(job_id)
+
+def _account_deleted(exc):
+    # The refused UPDATE opened a write transaction
+    db.session.rollback()
+    return jsonify({'error': 'User not found'}), 404
+
+def init_account_deletion(app):
+    """Set up the deletion worker; with resumption on, every process starts it"""
+    worker = DeletionWorker(app)
+    app.extensions['account_deletion'] = worker
+    app.register_error_handler(AccountDeleted, _account_deleted)
+    if app.config['ACCOUNT_DELETION_RESUME_AFTER']:
+        # Worker processes get no other signal that they have started
+        app.before_request(worker.start)
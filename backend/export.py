@@ -0,0 +1,77 @@
+import re
+import zipfile
+from models import Note
+from serializers import dump_note, dumps
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'notes.ndjson'),
+    'zip': ('application/zip', 'notes.zip'),
+}
+
+def export_query(user_id, batch_size):
+    """All of a user's notes in id order, fetched from a server-side cursor"""
+    return (
+        Note.query
+        .filter_by(user_id=user_id)
+        .order_by(Note.id)
+        .execution_options(stream_results=True)
+        .yield_per(batch_size)
+    )
+
+def iter_ndjson(notes, batch_size):
+    """Yield one JSON document per line, ``batch_size`` notes per chunk"""
+    batch = []
+    for note in notes:
+        batch.append(dumps(dump_note(note)))
+        if len(batch) >= batch_size:
+            yield b'\n'.join(batch) + b'\n'
+            batch = []
+    if batch:
+        yield b'\n'.join(batch) + b'\n'
+
+def note_filename(note):
+    """A stable, filesystem-safe Markdown file name for a note"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '-', note.title).strip('-.')[:60]
+    return f'{note.id}-{slug or "note"}.md'
+
+def note_markdown(note):
+    return f'# {note.title}\n\n{note.content or ""}\n'
+
+class _ZipSink:
+    """Unseekable file object that hands written bytes back to a generator"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def iter_zip(notes):
+    """Yield a ZIP archive with one Markdown file per note as it is built.
+
+    Because the sink cannot seek, zipfile writes sizes in data descriptors
+    after each member, so nothing but the central directory is retained.
+    That still grows with the number of notes: zipfile keeps a ZipInfo of
+    under 1 KB per member until the archive is closed.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for note in notes:
+            info = zipfile.ZipInfo(note_filename(note))
+            if note.updated_at is not None:
+                info.date_time = note.updated_at.timetuple()[:6]
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, note_markdown(note))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
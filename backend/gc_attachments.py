@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Script to delete attachment blobs that no note refers to any more
+Run this periodically (e.g. from cron); blobs newer than
+ATTACHMENTS_GC_GRACE_SECONDS are kept so in-flight uploads survive
+"""
+
+from app import create_app
+from attachments import collect_garbage
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        removed, freed = collect_garbage(app.config['ATTACHMENTS_GC_GRACE_SECONDS'])
+    print(f"Removed {removed} blobs ({freed} bytes).")
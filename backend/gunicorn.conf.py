@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for production
+All values come from Config, so they can be set through the environment.
+"""
+
+from config import Config
+
+bind = Config.SERVER_BIND
+workers = Config.SERVER_WORKERS
+threads = Config.SERVER_THREADS
+# gthread workers serve keep-alive connections; sync workers close them
+worker_class = 'gthread'
+keepalive = Config.SERVER_KEEPALIVE
+
+# Load the app once in the master so workers fork with it already imported
+preload_app = True
+
+# Recycle workers after a number of requests, staggered by the jitter
+max_requests = Config.SERVER_MAX_REQUESTS
+max_requests_jitter = Config.SERVER_MAX_REQUESTS_JITTER
+
+timeout = Config.SERVER_TIMEOUT
+graceful_timeout = Config.SERVER_GRACEFUL_TIMEOUT
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master process"""
+    from db import db
+    from wsgi import app
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+def _timed(func, submitted_at, *args):
+    """Run ``func`` in a worker and report how long it waited to start"""
+    return func(*args), time.time() - submitted_at
+
+class _HasherState:
+    """Per-app pool, queue limit and wait-time statistics"""
+    
+    def __init__(self, workers, queue_depth, method):
+        self.workers = workers
+        self.method = method
+        # Normalized form of ``method`` as written into stored hashes,
+        # e.g. "pbkdf2:sha256" becomes "pbkdf2:sha256:600000"
+        self.method_prefix = generate_password_hash('', method).split('$', 1)[0]
+        self.slots = threading.BoundedSemaphore(queue_depth)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_pid = None
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.in_flight = 0
+        self.rejected = 0
+    
+    def _get_executor(self):
+        # Created lazily and per process so that forking servers which
+        # preload the app do not share one pool between workers
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'))
+                self.executor_pid = os.getpid()
+            return self.executor
+    
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HashingBusy()
+        
+        with self.lock:
+            self.in_flight += 1
+        try:
+            submitted_at = time.time()
+            if self.workers:
+                future = self._get_executor().submit(_timed, func, submitted_at, *args)
+                result, waited = future.result()
+            else:
+                result, waited = _timed(func, submitted_at, *args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+        
+        with self.lock:
+            self.wait_count += 1
+            self.wait_sum += waited
+            self.wait_max = max(self.wait_max, waited)
+        return result
+    
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None and self.executor_pid == os.getpid():
+                self.executor.shutdown(wait=True)
+            self.executor = None
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    ``PASSWORD_HASH_WORKERS`` processes hash in parallel, at most
+    ``PASSWORD_HASH_QUEUE_DEPTH`` requests may be running or waiting, and
+    anything beyond that fails immediately with HashingBusy. Setting the
+    worker count to 0 hashes inline in the request thread.
+    """
+    
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        app.extensions['password_hasher'] = _HasherState(
+            app.config['PASSWORD_HASH_WORKERS'],
+            app.config['PASSWORD_HASH_QUEUE_DEPTH'],
+            app.config['PASSWORD_HASH_METHOD']
+        )
+    
+    @property
+    def _state(self):
+        return current_app.extensions['password_hasher']
+    
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        state = self._state
+        return state.run(generate_password_hash, password, state.method)
+    
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash"""
+        return self._state.run(check_password_hash, password_hash, password)
+    
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with different parameters"""
+        return password_hash.split('$', 1)[0] != self._state.method_prefix
+    
+    def stats(self):
+        """Queue wait time and saturation counters"""
+        state = self._state
+        with state.lock:
+            return {
+                'hash_queue_wait_seconds_count': state.wait_count,
+                'hash_queue_wait_seconds_sum': state.wait_sum,
+                'hash_queue_wait_seconds_max': state.wait_max,
+                'hash_in_flight': state.in_flight,
+                'hash_rejected_total': state.rejected,
+            }
+
+password_hasher = PasswordHasher()
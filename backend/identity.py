@@ -0,0 +1,74 @@
+"""
+The user a request acts for, worked out once per request.
+
+Several request hooks need the JWT identity before the view runs: the rate
+limiter and shard routing. request_identity decodes the token once and
+keeps the result on ``g``. request_user adds the user's directory row,
+also loaded at most once. A missing or bad token gives None here; the
+view's jwt_required rejects it with the usual 401.
+
+A token older than the account it names was issued to an earlier holder
+of the id. Ids are no longer reused (users is AUTOINCREMENT), but rows
+created before that could still share one; token_predates catches it.
+"""
+from datetime import datetime, timedelta
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import select
+from db import db
+from models import User
+
+# Directory columns the request hooks look at
+USER_COLUMNS = (User.shard, User.shard_moving)
+
+# iat has whole seconds and created_at does not, so a token issued in the
+# second its account was created would otherwise look older
+TOKEN_TIME_SLACK = timedelta(seconds=1)
+
+def request_identity():
+    """The JWT identity as an int, or None"""
+    if 'request_identity' not in g:
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            # Bad tokens are rejected by the view itself
+            identity = None
+        g.request_identity = None if identity is None else int(identity)
+    return g.request_identity
+
+def request_user():
+    """The identity's directory row (see USER_COLUMNS), or None"""
+    if 'request_user' not in g:
+        user_id = request_identity()
+        row = None
+        if user_id is not None:
+            # The directory, whichever shard the session is routed to
+            with db.engine.connect() as connection:
+                row = connection.execute(select(*USER_COLUMNS).where(User.id == user_id)).first()
+        g.request_user = row
+    return g.request_user
+
+def token_issued_at():
+    """When the request's verified JWT was issued, or None"""
+    if not has_request_context():
+        return None
+    try:
+        iat = get_jwt().get('iat')
+    except RuntimeError:
+        # No JWT was verified for this request
+        return None
+    return None if iat is None else datetime.utcfromtimestamp(iat)
+
+def token_predates(created_at):
+    """Whether the request's token was issued before an account created at ``created_at``"""
+    issued_at = token_issued_at()
+    return issued_at is not None and created_at is not None and created_at >= issued_at + TOKEN_TIME_SLACK
+
+def init_identity(app):
+    """Drop the per-request values when the request ends"""
+    @app.teardown_request
+    def forget_identity(exc):
+        # g outlives the request when an app context was already pushed
+        g.pop('request_identity', None)
+        g.pop('request_user', None)
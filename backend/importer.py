@@ -0,0 +1,155 @@
+import json
+import shutil
+import tempfile
+import zipfile
+import zlib
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from db import db
+from models import Note
+from schemas import note_schema
+from versioning import bump_notes_version
+
+# Only the first few rejections are reported back in detail
+MAX_REPORTED_REJECTIONS = 100
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Keys our own NDJSON export writes but a client cannot set (id, version, ...);
+# they are dropped so an export imports as-is, while other unknown keys still fail
+EXPORT_ONLY_FIELDS = frozenset(note_schema.dump_fields) - frozenset(note_schema.load_fields)
+
+class ImportSummary:
+    def __init__(self):
+        self.imported = 0
+        self.rejected_count = 0
+        self.rejected = []
+    
+    def reject(self, location, errors):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED_REJECTIONS:
+            self.rejected.append(dict(location, errors=errors))
+    
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'rejected_count': self.rejected_count,
+            'rejected': self.rejected,
+        }
+
+def iter_ndjson_records(stream, max_line_bytes):
+    """Yield ``({'line': n}, record_or_None, errors_or_None)`` per NDJSON line"""
+    line_no = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_no += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Skip the rest of an oversized line without buffering it
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(COPY_CHUNK_SIZE)
+            yield {'line': line_no}, None, {'_schema': ['Line too long.']}
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield {'line': line_no}, None, {'_schema': ['Invalid JSON.']}
+            continue
+        yield {'line': line_no}, record, None
+
+def parse_markdown(name, text):
+    """Inverse of export.note_markdown: a ``# Title`` line, blank line, body"""
+    if text.startswith('# '):
+        title, _, body = text[2:].partition('\n')
+        if body.startswith('\n'):
+            body = body[1:]
+    else:
+        title = name.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        body = text
+    if body.endswith('\n'):
+        body = body[:-1]
+    return {'title': title.strip(), 'content': body}
+
+def iter_zip_records(stream, max_member_bytes):
+    """Yield one record per ``.md`` member of a ZIP upload.
+
+    zipfile needs a seekable file, so the upload is first copied to a
+    temporary file on disk in fixed-size chunks. A member that cannot be
+    read (corrupt, encrypted or compressed with an unsupported method) is
+    rejected on its own; the rest of the archive is still imported.
+    """
+    with tempfile.TemporaryFile() as spool:
+        shutil.copyfileobj(stream, spool, COPY_CHUNK_SIZE)
+        spool.seek(0)
+        try:
+            archive = zipfile.ZipFile(spool)
+        except zipfile.BadZipFile:
+            yield {'file': None}, None, {'_schema': ['Not a valid ZIP archive.']}
+            return
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith('.md'):
+                    continue
+                location = {'file': info.filename}
+                if info.file_size > max_member_bytes:
+                    yield location, None, {'_schema': ['File too large.']}
+                    continue
+                try:
+                    data = archive.read(info)
+                except (zipfile.BadZipFile, zlib.error, EOFError):
+                    # Bad CRC, damaged deflate stream or truncated member
+                    yield location, None, {'_schema': ['File is corrupt.']}
+                    continue
+                except NotImplementedError:
+                    yield location, None, {'_schema': ['Unsupported compression method.']}
+                    continue
+                except RuntimeError:
+                    # zipfile's way of asking for a password
+                    yield location, None, {'_schema': ['File is encrypted.']}
+                    continue
+                try:
+                    text = data.decode('utf-8')
+                except UnicodeDecodeError:
+                    yield location, None, {'_schema': ['File is not UTF-8 text.']}
+                    continue
+                yield location, parse_markdown(info.filename, text), None
+
+def import_notes(user_id, records, batch_size):
+    """Validate records with NoteSchema and insert them in batches.
+
+    Each batch is one executemany INSERT and one commit, so memory use is
+    bounded by ``batch_size`` whatever the size of the upload.
+    """
+    summary = ImportSummary()
+    rows = []
+    
+    def flush():
+        version = bump_notes_version(user_id)
+        for row in rows:
+            row['change_seq'] = version
+        db.session.execute(insert(Note), rows)
+        db.session.commit()
+        summary.imported += len(rows)
+        rows.clear()
+    
+    for location, record, errors in records:
+        if errors is None:
+            try:
+                if isinstance(record, dict):
+                    record = {key: value for key, value in record.items() if key not in EXPORT_ONLY_FIELDS}
+                data = note_schema.load(record if isinstance(record, dict) else None)
+            except ValidationError as err:
+                errors = err.messages
+        if errors is not None:
+            summary.reject(location, errors)
+            continue
+        
+        rows.append({'title': data['title'], 'content': data.get('content', ''), 'user_id': user_id})
+        if len(rows) >= batch_size:
+            flush()
+    
+    if rows:
+        flush()
+    return summary
@@ -0,0 +1,284 @@
+"""
+Request and SQL instrumentation exposed as Prometheus text at /api/metrics.
+
+Every request is timed from before_request to teardown, so streamed bodies
+are included, and SQLAlchemy cursor events add the statement count and time
+spent in the database. Counters live in process memory: under gunicorn each
+worker reports its own numbers.
+
+The endpoint is for the scraper only. With METRICS_TOKEN set it requires
+``Authorization: Bearer <token>``; without one it answers loopback clients
+only. It stays outside the rate limits either way.
+"""
+import hmac
+import threading
+import time
+from flask import Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from db import db
+from admission import admission_stats
+from hashing import password_hasher
+
+# Upper bounds in seconds, Prometheus client defaults
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# admission.py stats key -> (metric name, type, help)
+ADMISSION_METRICS = {
+    'limit': ('admission_limit', 'gauge', 'Concurrent requests allowed per pool.'),
+    'in_flight': ('admission_in_flight', 'gauge', 'Requests holding a slot per pool.'),
+    'queued': ('admission_queued', 'gauge', 'Requests waiting for a slot per pool.'),
+    'admitted_total': ('admission_admitted_total', 'counter', 'Requests admitted per pool.'),
+    'rejected_total': ('admission_rejected_total', 'counter', 'Requests shed with 503 per pool.'),
+}
+
+# Clients allowed to scrape when no METRICS_TOKEN is configured
+LOOPBACK_ADDRESSES = {'127.0.0.1', '::1'}
+
+# Longest SQL text written to the slow query log
+SLOW_QUERY_MAX_CHARS = 500
+
+class Histogram:
+    """Cumulative-bucket histogram; callers hold the registry lock"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+    
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(self.sum)}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+class _MetricsState:
+    """Per-app counters, guarded by one lock held only for a few updates"""
+    
+    def __init__(self, slow_request_seconds, slow_query_seconds):
+        self.slow_request_seconds = slow_request_seconds
+        self.slow_query_seconds = slow_query_seconds
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}
+        self.durations = {}
+        self.statements = {}
+        self.db_seconds = {}
+        self.slow_requests = 0
+        self.statement_durations = Histogram(DURATION_BUCKETS)
+        self.slow_queries = 0
+    
+    def request_started(self):
+        with self.lock:
+            self.in_flight += 1
+    
+    def request_finished(self, method, endpoint, status, duration, statements, db_seconds, slow):
+        key = (method, endpoint)
+        with self.lock:
+            self.in_flight -= 1
+            status_key = (method, endpoint, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.durations:
+                self.durations[key] = Histogram(DURATION_BUCKETS)
+                self.statements[key] = Histogram(STATEMENT_BUCKETS)
+                self.db_seconds[key] = 0.0
+            self.durations[key].observe(duration)
+            self.statements[key].observe(statements)
+            self.db_seconds[key] += db_seconds
+            if slow:
+                self.slow_requests += 1
+    
+    def statement_finished(self, duration, slow):
+        with self.lock:
+            self.statement_durations.observe(duration)
+            if slow:
+                self.slow_queries += 1
+    
+    def render(self):
+        """Prometheus text exposition format, version 0.0.4"""
+        lines = []
+        
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+        
+        with self.lock:
+            header('http_requests_in_flight', 'gauge', 'Requests currently being served.')
+            lines.append(f'http_requests_in_flight {self.in_flight}')
+            
+            header('http_requests_total', 'counter', 'Requests by method, endpoint and status.')
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels([("method", method), ("endpoint", endpoint), ("status", status)])} {count}')
+            
+            header('http_request_duration_seconds', 'histogram', 'Request latency including streamed bodies.')
+            for (method, endpoint), histogram in sorted(self.durations.items()):
+                lines.extend(histogram.render('http_request_duration_seconds', [('method', method), ('endpoint', endpoint)]))
+            
+            header('http_request_sql_statements', 'histogram', 'SQL statements issued per request.')
+            for (method, endpoint), histogram in sorted(self.statements.items()):
+                lines.extend(histogram.render('http_request_sql_statements', [('method', method), ('endpoint', endpoint)]))
+            
+            header('http_request_sql_seconds_total', 'counter', 'Time spent in SQL statements per endpoint.')
+            for (method, endpoint), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'http_request_sql_seconds_total{_labels([("method", method), ("endpoint", endpoint)])} {_number(seconds)}')
+            
+            header('http_slow_requests_total', 'counter', 'Requests slower than SLOW_REQUEST_THRESHOLD_MS.')
+            lines.append(f'http_slow_requests_total {self.slow_requests}')
+            
+            header('db_statement_duration_seconds', 'histogram', 'Duration of every SQL statement.')
+            lines.extend(self.statement_durations.render('db_statement_duration_seconds', []))
+            
+            header('db_slow_statements_total', 'counter', 'Statements slower than SLOW_QUERY_THRESHOLD_MS.')
+            lines.append(f'db_slow_statements_total {self.slow_queries}')
+        
+        for name, value in password_hasher.stats().items():
+            kind = 'gauge' if name in ('hash_in_flight', 'hash_queue_wait_seconds_max') else 'counter'
+            header(f'password_{name}', kind, 'Password hashing pool statistics.')
+            lines.append(f'password_{name} {_number(value)}')
+        
+        pools, limiter = admission_stats(current_app)
+        for key, (name, kind, text) in ADMISSION_METRICS.items():
+            if pools:
+                header(name, kind, text)
+            for pool, values in sorted(pools.items()):
+                lines.append(f'{name}{_labels([("pool", pool)])} {values[key]}')
+        if limiter is not None:
+            header('rate_limited_total', 'counter', 'Requests refused with 429 by the per-user rate limit.')
+            lines.append(f'rate_limited_total {limiter["limited_total"]}')
+            header('rate_limit_tracked_keys', 'gauge', 'Token buckets currently held in memory.')
+            lines.append(f'rate_limit_tracked_keys {limiter["tracked_keys"]}')
+        
+        replicas = current_app.extensions.get('replicas')
+        if replicas is not None:
+            replica_stats = replicas.stats()
+            for key, name, kind, text in (
+                ('reads', 'replica_reads_total', 'counter', 'Read-only requests served by each replica.'),
+                ('failures', 'replica_failures_total', 'counter', 'Failed connection attempts per replica.'),
+                ('down', 'replica_down', 'gauge', 'Whether a replica is currently being skipped.'),
+            ):
+                header(name, kind, text)
+                for bind, value in sorted(replica_stats[key].items()):
+                    lines.append(f'{name}{_labels([("bind", bind)])} {value}')
+            header('replica_stale_reads_total', 'counter', 'Reads sent to the primary because no replica had the user\'s latest writes.')
+            lines.append(f'replica_stale_reads_total {replica_stats["stale_reads_total"]}')
+            header('replica_fallbacks_total', 'counter', 'Reads sent to the primary because no replica was usable.')
+            lines.append(f'replica_fallbacks_total {replica_stats["fallbacks_total"]}')
+        
+        cache = current_app.extensions.get('response_cache')
+        if cache is not None:
+            for name, value in cache.stats().items():
+                kind = 'counter' if name.endswith('_total') else 'gauge'
+                header(f'cache_{name}', kind, 'Response cache statistics.')
+                lines.append(f'cache_{name} {value}')
+        
+        return '\n'.join(lines) + '\n'
+
+def _refuse_scrape(token):
+    """Error response for a request that may not read the metrics, else None"""
+    if not token:
+        if request.remote_addr not in LOOPBACK_ADDRESSES:
+            return jsonify({'error': 'Forbidden'}), 403
+        return None
+    scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(presented.encode(), token.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+def init_metrics(app):
+    """Install request hooks, SQL timing events and the /api/metrics endpoint"""
+    if not app.config['METRICS_ENABLED']:
+        return
+    
+    state = _MetricsState(
+        app.config['SLOW_REQUEST_THRESHOLD_MS'] / 1000,
+        app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+    )
+    app.extensions['metrics'] = state
+    logger = app.logger
+    
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_db_seconds = 0.0
+        state.request_started()
+    
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+    
+    @app.teardown_request
+    def stop_timer(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+        endpoint = request.endpoint or 'unmatched'
+        slow = duration >= state.slow_request_seconds
+        state.request_finished(request.method, endpoint, status, duration,
+                               g.metrics_statements, g.metrics_db_seconds, slow)
+        if slow:
+            # The path only: query strings carry search terms and other user input
+            logger.warning('Slow request: %s %s %d %.3fs, %d SQL statements in %.3fs',
+                           request.method, request.path, status, duration,
+                           g.metrics_statements, g.metrics_db_seconds)
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+    
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['metrics_started'].pop()
+        slow = duration >= state.slow_query_seconds
+        state.statement_finished(duration, slow)
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_statements += 1
+            g.metrics_db_seconds += duration
+        if slow:
+            logger.warning('Slow query: %.3fs %s', duration, statement[:SLOW_QUERY_MAX_CHARS])
+    
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_started'):
+            connection.info['metrics_started'].pop()
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+            event.listen(engine, 'handle_error', handle_error)
+    
+    @app.route('/api/metrics')
+    def metrics():
+        refused = _refuse_scrape(current_app.config['METRICS_TOKEN'])
+        if refused is not None:
+            return refused
+        return Response(state.render(), mimetype='text/plain; version=0.0.4')
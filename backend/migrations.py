@@ -0,0 +1,167 @@
+"""
+In-place upgrade of databases created by earlier versions of the app.
+
+db.create_all only creates missing tables, so columns added to existing
+tables since (users.notes_version, notes.version, notes.content_size,
+users.shard, ...) would be missing and every query naming them would fail.
+upgrade_schema compares each existing table with its model and adds the
+missing columns with ALTER TABLE ADD COLUMN and the missing indexes. It then
+creates the note triggers and the search index where they are absent and
+backfills what the new columns derive from existing rows. Every step checks
+the current schema first, so running it again changes nothing. init_db runs
+it on every database.
+
+Some changes cannot be made with ALTER TABLE, such as AUTOINCREMENT on
+users. Such a table is rebuilt the way SQLite documents: create the new
+definition under another name, copy the rows, drop the old table and
+rename. Foreign keys are off meanwhile, so the drop does not cascade.
+"""
+from sqlalchemy import MetaData, func, inspect, select, text, update
+from sqlalchemy.schema import CreateColumn, CreateTable
+from db import db
+from models import NOTE_ID_DDL, NOTE_SIZE_DDL, NOTE_STATS_DDL, AccountDeletion, Note, User
+from search import FTS_DDL, FTS_DROP
+
+# Objects the search index needs; if any is missing the index is rebuilt
+FTS_OBJECTS = {'notes_text', 'notes_fts', 'notes_fts_ai', 'notes_fts_ad', 'notes_fts_au'}
+
+def _schema_objects(connection):
+    return {row[0] for row in connection.exec_driver_sql('SELECT name FROM sqlite_master')}
+
+def _add_missing_columns(connection, table, present):
+    added = []
+    for column in table.columns:
+        if column.name in present:
+            continue
+        # Carries the type, NOT NULL and server default; SQLite requires a
+        # default for a NOT NULL column added to a table that has rows
+        spec = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {spec}')
+        added.append(f'{table.name}.{column.name}')
+    return added
+
+def _backfill_sizes(connection):
+    connection.execute(text(
+        'UPDATE notes SET content_size = note_size(content), stored_size = length(CAST(content AS BLOB))'
+    ))
+
+def _backfill_counters(connection):
+    users, notes = User.__table__, Note.__table__
+    count = select(func.count(notes.c.id)).where(notes.c.user_id == users.c.id).scalar_subquery()
+    size = (
+        select(func.coalesce(func.sum(notes.c.content_size), 0))
+        .where(notes.c.user_id == users.c.id)
+        .scalar_subquery()
+    )
+    connection.execute(update(users).values(note_count=count, notes_content_bytes=size))
+
+def _rebuild_search_index(connection):
+    for statement in FTS_DROP + FTS_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+
+def _start_note_id_counter(connection):
+    """Start unset shard_info counters past every id of their range still on record"""
+    connection.execute(text(
+        'UPDATE shard_info SET next_id = max('
+        '(SELECT coalesce(max(id), shard_info.id_floor) FROM notes '
+        ' WHERE id > shard_info.id_floor AND id < shard_info.id_ceiling), '
+        '(SELECT coalesce(max(note_id), shard_info.id_floor) FROM note_tombstones '
+        ' WHERE note_id > shard_info.id_floor AND note_id < shard_info.id_ceiling)'
+        ') + 1 WHERE next_id IS NULL'
+    ))
+
+def _tables_missing_autoincrement(connection):
+    definitions = dict(connection.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type = 'table'").all())
+    return [
+        table for table in db.metadata.sorted_tables
+        if table.dialect_options['sqlite']['autoincrement']
+        and table.name in definitions and 'AUTOINCREMENT' not in definitions[table.name].upper()
+    ]
+
+def _highest_used_user_id(connection, existing):
+    """Largest id users ever had here, as far as the rows still tell"""
+    users, jobs = User.__table__, AccountDeletion.__table__
+    highest = connection.scalar(select(func.max(users.c.id))) or 0
+    # Deletion jobs outlive the user rows they removed
+    if jobs.name in existing:
+        highest = max(highest, connection.scalar(select(func.max(jobs.c.user_id))) or 0)
+    return highest
+
+def _rebuild_table(connection, table, existing):
+    present = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    columns = ', '.join(f'"{column.name}"' for column in table.columns if column.name in present)
+    rebuilt = table.to_metadata(MetaData(), name=f'{table.name}_rebuilt')
+    connection.execute(CreateTable(rebuilt))
+    connection.exec_driver_sql(
+        f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"'
+    )
+    connection.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    # Triggers on other tables name this one; the modern RENAME would
+    # reject them while the table is missing
+    connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    connection.exec_driver_sql(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"')
+    connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    for index in table.indexes:
+        index.create(connection)
+    if table is User.__table__:
+        # Ids deleted before the rebuild must not come back either
+        highest = _highest_used_user_id(connection, existing)
+        connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'users'")
+        connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('users', ?)", (highest,))
+
+def _rebuild_for_autoincrement(engine):
+    with engine.connect() as connection:
+        tables = _tables_missing_autoincrement(connection)
+        connection.rollback()
+        if not tables:
+            return []
+        # Only takes effect outside a transaction
+        connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        connection.commit()
+        try:
+            with connection.begin():
+                existing = set(inspect(connection).get_table_names())
+                for table in tables:
+                    _rebuild_table(connection, table, existing)
+                if connection.exec_driver_sql('PRAGMA foreign_key_check').first() is not None:
+                    raise RuntimeError('Rebuilding tables left dangling foreign keys')
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+            connection.commit()
+    return [table.name for table in tables]
+
+def upgrade_schema(engine):
+    """Bring the existing tables of one database up to the models.
+    
+    Returns the ``table.column`` names that were added.
+    """
+    if engine.dialect.name != 'sqlite':
+        return []
+    added = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            added += _add_missing_columns(connection, table, present)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        
+        if 'notes' not in existing:
+            return added
+        # Every statement is CREATE ... IF NOT EXISTS
+        for statement in NOTE_SIZE_DDL + NOTE_STATS_DDL + NOTE_ID_DDL:
+            connection.execute(text(statement))
+        if {'shard_info', 'note_tombstones'} <= existing:
+            _start_note_id_counter(connection)
+        if 'notes.content_size' in added:
+            _backfill_sizes(connection)
+        if 'notes.content_size' in added or 'users.note_count' in added:
+            _backfill_counters(connection)
+        if not FTS_OBJECTS <= _schema_objects(connection):
+            _rebuild_search_index(connection)
+    _rebuild_for_autoincrement(engine)
+    return added
@@ -1,29 +1,189 @@
 from datetime import datetime
+from sqlalchemy import DDL, event, text
+from sqlalchemy.orm import query_expression
 from db import db
+from storage import CompressedText
 
 class User(db.Model):
     __tablename__ = 'users'
+    # Ids of deleted accounts are never handed out again: tokens, cache keys
+    # and note ownership all go by id. Older databases are rebuilt by migrations.py
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every note write; drives ETag/Last-Modified on note reads
+    # and doubles as the per-user change sequence for delta sync
+    notes_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    notes_modified_at = db.Column(db.DateTime, nullable=True)
+    # Highest change sequence whose tombstones have been compacted away
+    notes_sync_floor = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Maintained by triggers on notes; see NOTE_STATS_DDL and reconcile_stats.py
+    note_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    notes_content_bytes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set when the account is queued for deletion; the user can no longer log in
+    deletion_requested_at = db.Column(db.DateTime, nullable=True)
+    # Bind holding this user's notes (NULL: this database); see sharding.py
+    shard = db.Column(db.String(32), nullable=True)
+    # Note writes are refused while the user is copied to another shard
+    shard_moving = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     # Relationship to notes
-    notes = db.relationship('Note', backref='user', lazy=True, cascade='all, delete-orphan')
+    # passive_deletes: never load every note just to delete the user; the
+    # database cascade (or deletion.py, in chunks) removes them
+    notes = db.relationship('Note', backref='user', lazy=True, cascade='all, delete-orphan',
+                            passive_deletes=True)
     
     def __repr__(self):
         return f'<User {self.email}>'
 
+class ShardInfo(db.Model):
+    """Range of note ids this database hands out; one row on shards, none otherwise"""
+    __tablename__ = 'shard_info'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    id_floor = db.Column(db.Integer, nullable=False)
+    id_ceiling = db.Column(db.Integer, nullable=False)
+    # Next note id to hand out; only ever goes up (see NOTE_ID_DDL), so ids
+    # of notes that were deleted or moved away are not handed out again
+    next_id = db.Column(db.Integer, nullable=True)
+
+# Next free id inside this database's shard_info range, so note ids stay
+# unique across shards and survive a move. Without a shard_info row it is
+# NULL and SQLite allocates the rowid as usual.
+NEXT_NOTE_ID = text('(SELECT next_id FROM shard_info)')
+
 class Note(db.Model):
     __tablename__ = 'notes'
+    __table_args__ = (
+        # Covers the keyset pagination scan used by the notes listing
+        db.Index('ix_notes_user_updated_id', 'user_id', 'updated_at', 'id'),
+        # Serves delta sync: notes changed after a given sequence
+        db.Index('ix_notes_user_change_seq', 'user_id', 'change_seq'),
+    )
     
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, default=NEXT_NOTE_ID)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    content = db.Column(CompressedText, nullable=True)
+    # Maintained by triggers so listings can report sizes without the blob
+    content_size = db.Column(db.Integer, nullable=True)
+    stored_size = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Incremented on every write to this note; clients send it back as the
+    # base version of a PATCH
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Owner's notes_version at the time of the last write
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Populated only by summary listings and search, via with_expression()
+    snippet = query_expression()
+    # Search only: the snippet as HTML with matches marked (see search.py)
+    highlight = query_expression()
     
     def __repr__(self):
         return f'<Note {self.title}>'
+
+# Keep content_size/stored_size current for every write, bulk ones included
+NOTE_SIZE_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS notes_sizes_ai AFTER INSERT ON notes BEGIN
+        UPDATE notes SET content_size = note_size(new.content), stored_size = length(CAST(new.content AS BLOB))
+        WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_sizes_au AFTER UPDATE OF content ON notes BEGIN
+        UPDATE notes SET content_size = note_size(new.content), stored_size = length(CAST(new.content AS BLOB))
+        WHERE id = new.id;
+    END""",
+]
+
+# Per-user counters, kept in the same transaction as every note write.
+# content_size is filled in by the size triggers above, so byte totals
+# follow changes to it rather than to content.
+NOTE_STATS_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS notes_stats_ai AFTER INSERT ON notes BEGIN
+        UPDATE users SET note_count = note_count + 1,
+            notes_content_bytes = notes_content_bytes + coalesce(new.content_size, 0)
+        WHERE id = new.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_stats_ad AFTER DELETE ON notes BEGIN
+        UPDATE users SET note_count = note_count - 1,
+            notes_content_bytes = notes_content_bytes - coalesce(old.content_size, 0)
+        WHERE id = old.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_stats_au AFTER UPDATE OF content_size ON notes BEGIN
+        UPDATE users SET
+            notes_content_bytes = notes_content_bytes + coalesce(new.content_size, 0) - coalesce(old.content_size, 0)
+        WHERE id = new.user_id;
+    END""",
+]
+
+# Advance the shard_info counter past every id taken from its range. Notes
+# copied in by a move keep ids from another range and leave it alone.
+NOTE_ID_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS notes_next_id_ai AFTER INSERT ON notes BEGIN
+        UPDATE shard_info SET next_id = new.id + 1
+        WHERE new.id >= next_id AND new.id < id_ceiling;
+    END""",
+]
+
+for statement in NOTE_SIZE_DDL + NOTE_STATS_DDL + NOTE_ID_DDL:
+    event.listen(Note.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+class NoteTombstone(db.Model):
+    __tablename__ = 'note_tombstones'
+    __table_args__ = (
+        db.Index('ix_note_tombstones_user_change_seq', 'user_id', 'change_seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<NoteTombstone {self.note_id}>'
+
+class Attachment(db.Model):
+    """A file attached to a note; the bytes live in the blob store, see attachments.py"""
+    __tablename__ = 'attachments'
+    __table_args__ = (
+        # Also the index for listing a note's attachments
+        db.UniqueConstraint('note_id', 'sha256', name='uq_attachments_note_sha256'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    # Hex SHA-256 of the content, which is also the blob's name on disk
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(127), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Attachment {self.note_id} {self.sha256[:12]}>'
+
+class AccountDeletion(db.Model):
+    """Progress of a background account deletion; outlives the user row"""
+    __tablename__ = 'account_deletions'
+    # Lives on the directory database only, even inside a shard's session
+    __table_args__ = {'info': {'directory': True}}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Deliberately not a foreign key: the user row is deleted last
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, running, done, failed
+    notes_total = db.Column(db.Integer, nullable=False, default=0)
+    notes_deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<AccountDeletion {self.user_id} {self.status}>'
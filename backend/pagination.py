@@ -0,0 +1,37 @@
+import base64
+import binascii
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(updated_at, note_id):
+    """Encode the (updated_at, id) position of a note as an opaque token"""
+    raw = f'{updated_at.isoformat()}|{note_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode an opaque token back into an (updated_at, id) tuple"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        timestamp, note_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(note_id)
+    except (binascii.Error, UnicodeError, ValueError) as err:
+        raise InvalidCursor(str(err)) from err
+
+
+def parse_limit(value, default, maximum):
+    """Parse the ``limit`` query parameter, clamping it to ``maximum``"""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, maximum)
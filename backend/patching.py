@@ -0,0 +1,41 @@
+# Patch offsets count UTF-16 code units, as JavaScript string indexes do
+ENCODING = 'utf-16-le'
+UNIT_BYTES = 2
+LOW_SURROGATES = range(0xDC00, 0xE000)
+
+class PatchError(ValueError):
+    """Raised when a patch list cannot be applied to the base text"""
+
+def _splits_pair(units, offset):
+    """Whether ``offset`` falls between the two halves of a surrogate pair"""
+    unit = units[offset * UNIT_BYTES:(offset + 1) * UNIT_BYTES]
+    return len(unit) == UNIT_BYTES and int.from_bytes(unit, 'little') in LOW_SURROGATES
+
+def apply_patches(text, patches):
+    """Apply splice operations to ``text`` and return the result.
+
+    Each patch replaces the UTF-16 code units ``start`` to ``end`` of the
+    base text with ``patch['text']``, so an emoji counts as two, as it does
+    in the browser editor. Offsets refer to the base text, so patches must
+    not overlap; they may be given in any order.
+    """
+    units = text.encode(ENCODING)
+    length = len(units) // UNIT_BYTES
+    ordered = sorted(patches, key=lambda patch: (patch['start'], patch['end']))
+    pieces = []
+    position = 0
+    for patch in ordered:
+        start, end = patch['start'], patch['end']
+        if end < start:
+            raise PatchError('end must not be before start')
+        if start < position:
+            raise PatchError('patches must not overlap')
+        if end > length:
+            raise PatchError('patch range is outside the base content')
+        if _splits_pair(units, start) or _splits_pair(units, end):
+            raise PatchError('patch range splits a character')
+        pieces.append(units[position * UNIT_BYTES:start * UNIT_BYTES])
+        pieces.append(patch.get('text', '').encode(ENCODING))
+        position = end
+    pieces.append(units[position * UNIT_BYTES:])
+    return b''.join(pieces).decode(ENCODING)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script to move users between note shards
+With no arguments, moves every user whose shard differs from their hash
+placement: run it after adding shards, or once after enabling sharding to
+move existing accounts off the directory database.
+Use --user ID --to NAME to move one user; NAME is shard_<n> or directory.
+"""
+
+import argparse
+import sys
+from app import create_app
+from sharding import move_user, rebalance
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move users between note shards')
+    parser.add_argument('--user', type=int, help='move only this user')
+    parser.add_argument('--to', help='target for --user: shard_<n> or directory')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='list the moves without making them')
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        if args.user is not None:
+            if not args.to:
+                parser.error('--user needs --to')
+            target = None if args.to == 'directory' else args.to
+            moved = move_user(args.user, target, args.batch_size)
+            print(f"Moved {moved} notes of user {args.user} to {args.to}.")
+        else:
+            moves, failures = rebalance(args.batch_size, dry_run=args.dry_run)
+            for user_id, source, target in moves:
+                print(f"User {user_id}: {source or 'directory'} -> {target}")
+            for user_id, error in failures:
+                print(f"User {user_id}: not moved: {error}")
+            print(f"{'Would move' if args.dry_run else 'Moved'} {len(moves)} users.")
+            if failures:
+                sys.exit(f"{len(failures)} moves failed; run again to retry them.")
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Script to recompute per-user note counters
+Run this to repair drift, e.g. after manual edits to the notes table, or
+once on databases created before the counters existed
+"""
+
+from app import create_app
+from sharding import database_names, use_shard
+from stats import reconcile_stats
+
+if __name__ == '__main__':
+    app = create_app()
+    fixed = 0
+    with app.app_context():
+        for name in database_names():
+            with use_shard(name):
+                fixed += reconcile_stats()
+    print(f"Corrected counters for {fixed} users.")
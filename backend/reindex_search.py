@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Script to (re)build the full-text search index
+Run this once on databases created before search was added, or at any time
+to rebuild the index from the notes table
+"""
+
+from app import create_app
+from db import db
+from search import rebuild_index
+from sharding import database_names, use_shard
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        for name in database_names():
+            with use_shard(name):
+                rebuild_index(db.session)
+    print("Search index rebuilt successfully!")
@@ -0,0 +1,147 @@
+"""
+Read replica routing.
+
+Replicas are Flask-SQLAlchemy binds named ``replica_<n>``, built from
+DATABASE_REPLICA_URLS. Handlers wrapped in read_replica run all of their
+queries on one replica, chosen round robin; everything else uses the
+primary.
+
+Every write to a user's notes or attachments bumps users.notes_version on
+the primary, so a replica whose copy of that counter is behind the
+primary's has not replicated the user's latest writes. read_replica reads
+the counter from the primary and only uses a replica that has caught up,
+which gives read-your-writes across processes and hosts without any
+shared state, and means a sync token from the primary is never ahead of
+the replica serving the next /changes call. The check costs one primary
+key lookup on each side.
+
+A replica that cannot be reached is skipped for REPLICA_RETRY_SECONDS, and
+reads fall back to the primary if no replica is left. Health state and
+counters are per process.
+"""
+import threading
+import time
+from functools import wraps
+from flask import current_app, g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from db import db
+from models import User
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+class ReplicaRouter:
+    """Round-robin replica choice and health tracking"""
+    
+    def __init__(self, names, retry_seconds):
+        self.names = names
+        self.retry_seconds = retry_seconds
+        self.lock = threading.Lock()
+        self.position = 0
+        self.down_until = {}
+        self.reads = dict.fromkeys(names, 0)
+        self.failures = dict.fromkeys(names, 0)
+        self.stale_reads = 0
+        self.fallbacks = 0
+    
+    def candidates(self):
+        """Replicas currently believed healthy, starting at the next in rotation"""
+        now = time.monotonic()
+        with self.lock:
+            start = self.position
+            self.position = (self.position + 1) % len(self.names)
+            ordered = self.names[start:] + self.names[:start]
+            return [name for name in ordered if self.down_until.get(name, 0) <= now]
+    
+    def mark_down(self, name):
+        with self.lock:
+            self.down_until[name] = time.monotonic() + self.retry_seconds
+            self.failures[name] += 1
+    
+    def record_read(self, name, stale=False):
+        """Count a read served by ``name``, or by the primary when it is None"""
+        with self.lock:
+            if name is not None:
+                self.reads[name] += 1
+            elif stale:
+                self.stale_reads += 1
+            else:
+                self.fallbacks += 1
+    
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                'reads': dict(self.reads),
+                'failures': dict(self.failures),
+                'down': {name: int(self.down_until.get(name, 0) > now) for name in self.names},
+                'stale_reads_total': self.stale_reads,
+                'fallbacks_total': self.fallbacks,
+            }
+
+def _current_identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # No JWT was checked for this request
+        return None
+
+def _notes_version(connection, user_id):
+    return connection.scalar(select(User.notes_version).where(User.id == user_id))
+
+def read_replica(view):
+    """Run a read-only view on a replica that has caught up with the user"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('replicas')
+        # Replicas copy the main database; sharded note data is read from its shard
+        if router is not None and g.get('db_shard') is None:
+            user_id = _current_identity()
+            required = None
+            if user_id is not None:
+                with db.engine.connect() as connection:
+                    required = _notes_version(connection, user_id)
+            # A user the primary does not know is answered by the primary
+            if user_id is None or required is not None:
+                _use_replica(router, user_id, required)
+        return view(*args, **kwargs)
+    return wrapper
+
+def _use_replica(router, user_id, required):
+    stale = False
+    for name in router.candidates():
+        engine = db.engines[name]
+        try:
+            # Check out the connection now so a dead replica is noticed
+            # before the view has done anything
+            connection = db.session.connection(bind_arguments={'bind': engine})
+            version = None if user_id is None else _notes_version(connection, user_id)
+        except SQLAlchemyError:
+            db.session.rollback()
+            router.mark_down(name)
+            current_app.logger.warning('Read replica %s unavailable, skipping it', name)
+            continue
+        if user_id is not None and (version is None or version < required):
+            # Lagging behind this user's latest writes; try another replica
+            stale = True
+            continue
+        g.db_replica = engine
+        router.record_read(name)
+        return
+    router.record_read(None, stale)
+
+def init_replicas(app):
+    """Enable replica routing when replica binds are configured"""
+    names = sorted(name for name in app.config.get('SQLALCHEMY_BINDS') or {}
+                   if name.startswith(REPLICA_BIND_PREFIX))
+    if not names:
+        return
+    
+    app.extensions['replicas'] = ReplicaRouter(names, app.config['REPLICA_RETRY_SECONDS'])
+    
+    @app.teardown_request
+    def release_replica(exc):
+        # g outlives the request when an app context was already pushed,
+        # and a later write must not be routed to the replica
+        g.pop('db_replica', None)
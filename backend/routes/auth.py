@@ -1,12 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from marshmallow import ValidationError
-from db import db, hash_password, check_password
-from models import User
-from schemas import user_register_schema, user_login_schema, user_schema
+from db import db, hash_password, check_password, password_needs_rehash
+from hashing import HashingBusy
+from identity import token_predates
+from deletion import request_account_deletion
+from models import AccountDeletion, User
+from schemas import user_register_schema, user_login_schema, account_deletion_schema
+from serializers import dump_user
+from sharding import assign_shard
 
 auth_bp = Blueprint('auth', __name__)
 
+@auth_bp.errorhandler(HashingBusy)
+def hashing_busy(error):
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = str(current_app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -26,9 +37,11 @@ def register():
     )
     
     db.session.add(user)
+    db.session.flush()
+    assign_shard(user)
     db.session.commit()
     
-    return jsonify(user_schema.dump(user)), 201
+    return jsonify(dump_user(user)), 201
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -43,23 +56,67 @@ def login():
     
     if not user or not check_password(user.password_hash, data['password']):
         return jsonify({'error': 'Invalid email or password'}), 401
+    if user.deletion_requested_at is not None:
+        return jsonify({'error': 'Invalid email or password'}), 401
+    
+    # Upgrade hashes made with outdated parameters while we have the password
+    if password_needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hash_password(data['password'])
+            db.session.commit()
+        except HashingBusy:
+            pass
     
     # Create access token
     access_token = create_access_token(identity=str(user.id))
     
     return jsonify({
         'access_token': access_token,
-        'user': user_schema.dump(user)
+        'user': dump_user(user)
     }), 200
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    """Get current user information"""
+    """Get current user information.
+
+    Read from the primary: choosing a replica would look this row up there
+    anyway, and the account may have been created or deleted moments ago.
+    """
     user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     
+    if not user or user.deletion_requested_at is not None or token_predates(user.created_at):
+        return jsonify({'error': 'User not found'}), 404
+    
+    return jsonify(dump_user(user)), 200
+
+@auth_bp.route('/me', methods=['DELETE'])
+@jwt_required()
+def delete_current_user():
+    """Queue the current account for deletion in the background.
+
+    Answers 202 at once; progress is reported by GET /api/auth/me/deletion.
+    """
+    user_id = int(get_jwt_identity())
+    user = db.session.get(User, user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(user_schema.dump(user)), 200
+    job = request_account_deletion(user)
+    current_app.extensions['account_deletion'].submit(job.id)
+    
+    response = jsonify(account_deletion_schema.dump(job))
+    response.headers['Location'] = '/api/auth/me/deletion'
+    return response, 202
+
+@auth_bp.route('/me/deletion', methods=['GET'])
+@jwt_required()
+def get_deletion_status():
+    """Progress of the current account's deletion"""
+    user_id = int(get_jwt_identity())
+    job = AccountDeletion.query.filter_by(user_id=user_id).order_by(AccountDeletion.id.desc()).first()
+    if not job:
+        return jsonify({'error': 'No deletion requested'}), 404
+    
+    return jsonify(account_deletion_schema.dump(job)), 200
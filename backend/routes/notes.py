@@ -1,20 +1,250 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy import delete, func, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer, with_expression
 from db import db
-from models import Note
-from schemas import note_schema, notes_schema, note_update_schema
+from models import Attachment, Note, NoteTombstone
+from schemas import note_schema, note_summaries_schema, note_tombstones_schema, note_update_schema, note_patch_schema
+from schemas import attachment_schema, attachments_schema, search_results_schema
+from pagination import InvalidCursor, encode_cursor, decode_cursor, parse_limit
+from search import search_notes
+from conditional import make_etag, version_etag, if_match_versions, is_not_modified, add_validators, not_modified
+from versioning import bump_notes_version, get_notes_version
+from batch import apply_batch
+from cache import CachedResponse
+from replicas import read_replica
+from sharding import release_user_shard, use_user_shard
+from stats import get_note_stats
+from sync import SyncTokenExpired, get_changes, parse_sync_token
+from serializers import dump_note, dump_note_summary, dumps, iter_json_array
+from export import EXPORT_FORMATS, export_query, iter_ndjson, iter_zip
+from importer import import_notes, iter_ndjson_records, iter_zip_records
+from patching import PatchError, apply_patches
+from attachments import AttachmentTooLarge, serve_inline
 
 notes_bp = Blueprint('notes', __name__)
+# Every note route runs on the current user's shard, when sharding is on
+notes_bp.before_request(use_user_shard)
+notes_bp.teardown_request(release_user_shard)
 
 @notes_bp.route('', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_notes():
-    """Get all notes for the current user"""
+    """Get notes for the current user, newest first.
+
+    Passing ``limit`` and/or ``cursor`` switches to keyset pagination and
+    returns ``{"notes": [...], "next_cursor": ...}``; without them the full
+    list is streamed as a chunked JSON array. ``view=summary`` (or
+    ``fields=summary``) skips loading ``content`` and returns a bounded
+    ``snippet`` instead.
+    
+    Responses carry an ETag derived from the user's notes version, so a
+    matching If-None-Match is answered with 304 before any note is loaded.
+    """
+    user_id = int(get_jwt_identity())
+    version, modified_at, account = get_notes_version(user_id)
+    query_string = request.query_string.decode('utf-8')
+    etag = make_etag('notes', user_id, account, version, query_string)
+    if is_not_modified(etag, modified_at):
+        return not_modified(etag, modified_at)
+    
+    cache = current_app.extensions.get('response_cache')
+    cache_key = f'notes:{user_id}:{account}:{version}:{query_string}'
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached), 200
+    
+    query = Note.query.filter_by(user_id=user_id).order_by(Note.updated_at.desc(), Note.id.desc())
+    
+    view = request.args.get('view') or request.args.get('fields') or 'full'
+    if view not in ('full', 'summary'):
+        return jsonify({'error': 'Validation error', 'details': {'view': ['Must be one of: full, summary.']}}), 400
+    
+    serialize = dump_note
+    if view == 'summary':
+        snippet_length = current_app.config['NOTES_SNIPPET_LENGTH']
+        query = query.options(
+            defer(Note.content),
+            with_expression(Note.snippet, func.substr(func.note_text(Note.content), 1, snippet_length))
+        )
+        serialize = dump_note_summary
+    
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        # Stream rows as they come off the cursor so memory stays flat
+        batch_size = current_app.config['NOTES_STREAM_BATCH_SIZE']
+        rows = query.yield_per(batch_size)
+        body = iter_json_array(rows, serialize, batch_size)
+        if cache is not None:
+            body = cache.tee(cache_key, body, etag, modified_at)
+        response = Response(stream_with_context(body), mimetype='application/json')
+        return add_validators(response, etag, modified_at), 200
+    
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['NOTES_PAGE_SIZE'],
+            current_app.config['NOTES_MAX_PAGE_SIZE']
+        )
+    except ValueError as err:
+        return jsonify({'error': 'Validation error', 'details': {'limit': [str(err)]}}), 400
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            updated_at, note_id = decode_cursor(cursor)
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(Note.updated_at, Note.id) < (updated_at, note_id))
+    
+    # Fetch one extra row to find out whether another page exists
+    notes = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_cursor = encode_cursor(notes[-1].updated_at, notes[-1].id)
+    
+    response = jsonify({
+        'notes': [serialize(note) for note in notes],
+        'next_cursor': next_cursor
+    })
+    if cache is not None:
+        cache.set(cache_key, CachedResponse(response.get_data(), etag, modified_at))
+    return add_validators(response, etag, modified_at), 200
+
+@notes_bp.route('/search', methods=['GET'])
+@jwt_required()
+@read_replica
+def search():
+    """Full-text search over the current user's notes, best match first"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Validation error', 'details': {'q': ['Missing search query.']}}), 400
+    
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            current_app.config['NOTES_PAGE_SIZE'],
+            current_app.config['NOTES_MAX_PAGE_SIZE']
+        )
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise ValueError('offset must not be negative')
+    except ValueError as err:
+        return jsonify({'error': 'Validation error', 'details': {'query': [str(err)]}}), 400
+    
+    user_id = int(get_jwt_identity())
+    notes = search_notes(user_id, q, limit + 1, offset)
+    
+    next_offset = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_offset = offset + limit
+    
+    return jsonify({
+        'results': search_results_schema.dump(notes),
+        'next_offset': next_offset
+    }), 200
+
+@notes_bp.route('/stats', methods=['GET'])
+@jwt_required()
+@read_replica
+def get_stats():
+    """Note count, total content bytes and last change for the current user.
+
+    Read from counters kept up to date by every write, so the cost does not
+    depend on how many notes the user has.
+    """
+    user_id = int(get_jwt_identity())
+    stats = get_note_stats(user_id)
+    if stats is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    etag = make_etag('stats', user_id, stats.notes_version)
+    if is_not_modified(etag, stats.notes_modified_at):
+        return not_modified(etag, stats.notes_modified_at)
+    
+    response = jsonify({
+        'note_count': stats.note_count,
+        'content_bytes': stats.notes_content_bytes,
+        'last_modified': stats.notes_modified_at.isoformat() if stats.notes_modified_at else None
+    })
+    return add_validators(response, etag, stats.notes_modified_at), 200
+
+@notes_bp.route('/changes', methods=['GET'])
+@jwt_required()
+@read_replica
+def get_changes_since():
+    """Get notes changed and deleted since a sync token.
+
+    Omitting ``since`` returns a full snapshot. Pass the returned
+    ``sync_token`` as ``since`` on the next call.
+    """
+    try:
+        since = parse_sync_token(request.args.get('since'))
+    except ValueError as err:
+        return jsonify({'error': 'Validation error', 'details': {'since': [str(err)]}}), 400
+    
+    user_id = int(get_jwt_identity())
+    try:
+        notes, tombstones, version = get_changes(user_id, since)
+    except SyncTokenExpired:
+        return jsonify({'error': 'Sync token expired, full resync required'}), 410
+    except ValueError as err:
+        return jsonify({'error': 'Validation error', 'details': {'since': [str(err)]}}), 400
+    
+    return jsonify({
+        'notes': [dump_note(note) for note in notes],
+        'deleted': note_tombstones_schema.dump(tombstones),
+        'sync_token': str(version)
+    }), 200
+
+@notes_bp.route('/export', methods=['GET'])
+@jwt_required()
+@read_replica
+def export_notes():
+    """Stream a backup of every note as NDJSON or a ZIP of Markdown files"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Validation error', 'details': {'format': ['Must be one of: ndjson, zip.']}}), 400
+    
+    user_id = int(get_jwt_identity())
+    batch_size = current_app.config['NOTES_STREAM_BATCH_SIZE']
+    notes = export_query(user_id, batch_size)
+    
+    if export_format == 'zip':
+        body = iter_zip(notes)
+    else:
+        body = iter_ndjson(notes, batch_size)
+    
+    mimetype, filename = EXPORT_FORMATS[export_format]
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@notes_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_notes_upload():
+    """Import notes from a raw NDJSON or Markdown-ZIP request body"""
+    import_format = request.args.get('format')
+    if import_format is None:
+        import_format = 'zip' if request.mimetype == 'application/zip' else 'ndjson'
+    if import_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Validation error', 'details': {'format': ['Must be one of: ndjson, zip.']}}), 400
+    
+    max_record_bytes = current_app.config['NOTES_IMPORT_MAX_RECORD_BYTES']
+    if import_format == 'zip':
+        records = iter_zip_records(request.stream, max_record_bytes)
+    else:
+        records = iter_ndjson_records(request.stream, max_record_bytes)
+    
     user_id = int(get_jwt_identity())
-    notes = Note.query.filter_by(user_id=user_id).order_by(Note.updated_at.desc()).all()
+    summary = import_notes(user_id, records, current_app.config['NOTES_IMPORT_BATCH_SIZE'])
     
-    return jsonify(notes_schema.dump(notes)), 200
+    return jsonify(summary.to_dict()), 200
 
 @notes_bp.route('', methods=['POST'])
 @jwt_required()
@@ -30,7 +260,8 @@ def create_note():
     note = Note(
         title=data['title'],
         content=data.get('content', ''),
-        user_id=user_id
+        user_id=user_id,
+        change_seq=bump_notes_version(user_id)
     )
     
     db.session.add(note)
@@ -38,54 +269,327 @@ def create_note():
     
     return jsonify(note_schema.dump(note)), 201
 
+@notes_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch():
+    """Apply a list of create/update/delete operations in one transaction"""
+    payload = request.json
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Validation error', 'details': {'operations': ['Must be a non-empty list.']}}), 400
+    
+    max_size = current_app.config['NOTES_BATCH_MAX_SIZE']
+    if len(operations) > max_size:
+        return jsonify({'error': 'Validation error', 'details': {'operations': [f'At most {max_size} operations per batch.']}}), 400
+    
+    user_id = int(get_jwt_identity())
+    try:
+        results = apply_batch(user_id, operations)
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'details': err.messages}), 400
+    
+    return jsonify({'results': results}), 200
+
 @notes_bp.route('/<int:note_id>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_note(note_id):
-    """Get a specific note by ID"""
+    """Get a specific note by ID.
+
+    Served from the response cache when the user's notes have not changed
+    since it was stored, which costs a single user row lookup.
+    """
     user_id = int(get_jwt_identity())
-    note = Note.query.filter_by(id=note_id, user_id=user_id).first()
     
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        generation, _, account = get_notes_version(user_id)
+        cache_key = f'note:{user_id}:{account}:{generation}:{note_id}'
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if is_not_modified(cached.etag, cached.last_modified):
+                return not_modified(cached.etag, cached.last_modified)
+            return cached_response(cached), 200
+        
+        note = Note.query.filter_by(id=note_id, user_id=user_id).first()
+        if not note:
+            return jsonify({'error': 'Note not found'}), 404
+        
+        etag = version_etag('note', note_id, note.version)
+        cached = CachedResponse(dumps(dump_note(note)), etag, note.updated_at)
+        cache.set(cache_key, cached)
+        if is_not_modified(etag, note.updated_at):
+            return not_modified(etag, note.updated_at)
+        return cached_response(cached), 200
+    
+    # Only the version is needed to answer a conditional request
+    row = db.session.query(Note.version, Note.updated_at).filter_by(id=note_id, user_id=user_id).first()
+    if row is None:
+        return jsonify({'error': 'Note not found'}), 404
+    
+    updated_at = row.updated_at
+    etag = version_etag('note', note_id, row.version)
+    if is_not_modified(etag, updated_at):
+        return not_modified(etag, updated_at)
+    
+    note = Note.query.filter_by(id=note_id, user_id=user_id).first()
     if not note:
         return jsonify({'error': 'Note not found'}), 404
     
-    return jsonify(note_schema.dump(note)), 200
+    # The row may have changed between the two reads
+    etag = version_etag('note', note_id, note.version)
+    return add_validators(jsonify(note_schema.dump(note)), etag, note.updated_at), 200
+
+def cached_response(cached):
+    """Rebuild a response from a cache entry"""
+    response = Response(cached.body, mimetype='application/json')
+    return add_validators(response, cached.etag, cached.last_modified)
+
+def write_failed(note_id, user_id):
+    """404 or 412 for a conditional write that matched no row"""
+    db.session.rollback()
+    current = db.session.query(Note.version).filter_by(id=note_id, user_id=user_id).scalar()
+    if current is None:
+        return jsonify({'error': 'Note not found'}), 404
+    response = jsonify({'error': 'Precondition failed', 'version': current})
+    response.set_etag(version_etag('note', note_id, current))
+    return response, 412
+
+def version_condition(note_id):
+    """WHERE clause for If-Match, or None when the write is unconditional"""
+    versions = if_match_versions('note', note_id)
+    if versions is None:
+        return None
+    return Note.version.in_(versions)
 
 @notes_bp.route('/<int:note_id>', methods=['PUT'])
 @jwt_required()
 def update_note(note_id):
-    """Update a specific note by ID"""
+    """Update a specific note by ID.
+
+    The write is a single conditional UPDATE ... RETURNING. With If-Match it
+    only applies to the listed version(s); a stale one gets 412.
+    """
     try:
         data = note_update_schema.load(request.json)
     except ValidationError as err:
         return jsonify({'error': 'Validation error', 'details': err.messages}), 400
     
+    user_id = int(get_jwt_identity())
+    condition = version_condition(note_id)
+    
+    statement = update(Note).where(Note.id == note_id, Note.user_id == user_id)
+    if condition is not None:
+        statement = statement.where(condition)
+    note = db.session.scalars(
+        statement
+        .values(version=Note.version + 1, change_seq=bump_notes_version(user_id), **data)
+        .returning(Note)
+        .execution_options(populate_existing=True)
+    ).first()
+    if note is None:
+        return write_failed(note_id, user_id)
+    
+    # Serialize before commit expires the returned row
+    response = jsonify(note_schema.dump(note))
+    response.set_etag(version_etag('note', note_id, note.version))
+    db.session.commit()
+    
+    return response, 200
+
+@notes_bp.route('/<int:note_id>', methods=['PATCH'])
+@jwt_required()
+def patch_note(note_id):
+    """Apply splice patches to a note's content against a base version.
+
+    Only the edits travel over the wire. The response carries just the new
+    version; a stale ``base_version`` is rejected with 409.
+    """
+    try:
+        data = note_patch_schema.load(request.json)
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'details': err.messages}), 400
+    
     user_id = int(get_jwt_identity())
     note = Note.query.filter_by(id=note_id, user_id=user_id).first()
     
     if not note:
         return jsonify({'error': 'Note not found'}), 404
+    if note.version != data['base_version']:
+        return jsonify({'error': 'Version conflict', 'version': note.version}), 409
     
-    # Update fields if provided
+    values = {}
+    if data['patches']:
+        try:
+            values['content'] = apply_patches(note.content or '', data['patches'])
+        except PatchError as err:
+            return jsonify({'error': 'Validation error', 'details': {'patches': [str(err)]}}), 400
     if 'title' in data:
-        note.title = data['title']
-    if 'content' in data:
-        note.content = data['content']
+        values['title'] = data['title']
+    
+    # Guard on the base version in SQL too, in case another write got in first
+    result = db.session.execute(
+        update(Note)
+        .where(Note.id == note_id, Note.user_id == user_id, Note.version == data['base_version'])
+        .values(version=Note.version + 1, change_seq=bump_notes_version(user_id), **values)
+        .returning(Note.version, Note.updated_at)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if result is None:
+        db.session.rollback()
+        current = db.session.query(Note.version).filter_by(id=note_id, user_id=user_id).scalar()
+        return jsonify({'error': 'Version conflict', 'version': current}), 409
     
     db.session.commit()
     
-    return jsonify(note_schema.dump(note)), 200
+    response = jsonify({
+        'id': note_id,
+        'version': result.version,
+        'updated_at': result.updated_at.isoformat()
+    })
+    response.set_etag(version_etag('note', note_id, result.version))
+    return response, 200
 
 @notes_bp.route('/<int:note_id>', methods=['DELETE'])
 @jwt_required()
 def delete_note(note_id):
-    """Delete a specific note by ID"""
+    """Delete a specific note by ID, honoring If-Match"""
     user_id = int(get_jwt_identity())
-    note = Note.query.filter_by(id=note_id, user_id=user_id).first()
+    condition = version_condition(note_id)
     
-    if not note:
-        return jsonify({'error': 'Note not found'}), 404
+    version = bump_notes_version(user_id)
+    statement = delete(Note).where(Note.id == note_id, Note.user_id == user_id)
+    if condition is not None:
+        statement = statement.where(condition)
+    deleted = db.session.execute(
+        statement.returning(Note.id).execution_options(synchronize_session=False)
+    ).first()
+    if deleted is None:
+        return write_failed(note_id, user_id)
     
-    db.session.delete(note)
+    db.session.add(NoteTombstone(note_id=note_id, user_id=user_id, change_seq=version))
     db.session.commit()
     
     return '', 204
+
+def note_exists(note_id, user_id):
+    return db.session.query(Note.id).filter_by(id=note_id, user_id=user_id).first() is not None
+
+@notes_bp.route('/<int:note_id>/attachments', methods=['POST'])
+@jwt_required()
+def upload_attachment(note_id):
+    """Attach the raw request body to a note, named by ``?filename=``.
+    
+    The body is streamed into the blob store as it arrives, never held in
+    memory. Content the note already has returns its attachment with 200.
+    """
+    filename = request.args.get('filename', '').strip()
+    if not 1 <= len(filename) <= 255:
+        return jsonify({'error': 'Validation error', 'details': {'filename': ['Length must be between 1 and 255.']}}), 400
+    
+    user_id = int(get_jwt_identity())
+    if not note_exists(note_id, user_id):
+        return jsonify({'error': 'Note not found'}), 404
+    # No read transaction stays open while a slow client sends the body
+    db.session.close()
+    
+    max_bytes = current_app.config['ATTACHMENTS_MAX_BYTES']
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({'error': 'Request entity too large'}), 413
+    try:
+        sha256, size = current_app.extensions['attachments'].save(request.stream, max_bytes)
+    except AttachmentTooLarge:
+        return jsonify({'error': 'Request entity too large'}), 413
+    
+    status = 200
+    attachment = Attachment.query.filter_by(note_id=note_id, sha256=sha256).first()
+    if attachment is None:
+        attachment = Attachment(
+            note_id=note_id,
+            user_id=user_id,
+            sha256=sha256,
+            size=size,
+            filename=filename,
+            content_type=request.mimetype or 'application/octet-stream'
+        )
+        db.session.add(attachment)
+        try:
+            # Read replicas compare this counter to tell whether they have the upload
+            bump_notes_version(user_id)
+            db.session.commit()
+            status = 201
+        except IntegrityError:
+            # The same content was attached concurrently, or the note deleted
+            db.session.rollback()
+            attachment = Attachment.query.filter_by(note_id=note_id, sha256=sha256).first()
+            if attachment is None:
+                return jsonify({'error': 'Note not found'}), 404
+    
+    response = jsonify(attachment_schema.dump(attachment))
+    response.headers['Location'] = url_for('notes.download_attachment', note_id=note_id, sha256=sha256)
+    return response, status
+
+@notes_bp.route('/<int:note_id>/attachments', methods=['GET'])
+@jwt_required()
+@read_replica
+def get_attachments(note_id):
+    """List a note's attachments, oldest first"""
+    user_id = int(get_jwt_identity())
+    attachments = Attachment.query.filter_by(note_id=note_id, user_id=user_id).order_by(Attachment.id).all()
+    if not attachments and not note_exists(note_id, user_id):
+        return jsonify({'error': 'Note not found'}), 404
+    
+    return jsonify(attachments_schema.dump(attachments)), 200
+
+@notes_bp.route('/<int:note_id>/attachments/<sha256>', methods=['GET'])
+@jwt_required()
+@read_replica
+def download_attachment(note_id, sha256):
+    """Serve an attachment's bytes.
+    
+    The content hash is the ETag, so If-None-Match gets 304 and Range
+    requests get 206 without reading the file. Whole files are passed to
+    the server's file wrapper, which gunicorn sends with sendfile(2).
+    """
+    user_id = int(get_jwt_identity())
+    attachment = Attachment.query.filter_by(note_id=note_id, sha256=sha256, user_id=user_id).first()
+    if attachment is None:
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    try:
+        response = send_file(
+            current_app.extensions['attachments'].path(sha256),
+            mimetype=attachment.content_type,
+            as_attachment=not serve_inline(attachment.content_type),
+            download_name=attachment.filename,
+            conditional=True,
+            etag=sha256,
+            max_age=current_app.config['ATTACHMENTS_CACHE_MAX_AGE']
+        )
+    except FileNotFoundError:
+        current_app.logger.error('Blob %s of note %s is missing', sha256, note_id)
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    # Per-user content: browser caches only, and never run as a page
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+@notes_bp.route('/<int:note_id>/attachments/<sha256>', methods=['DELETE'])
+@jwt_required()
+def delete_attachment(note_id, sha256):
+    """Detach a file from a note; gc_attachments.py removes unused blobs"""
+    user_id = int(get_jwt_identity())
+    deleted = db.session.execute(
+        delete(Attachment)
+        .where(Attachment.note_id == note_id, Attachment.sha256 == sha256, Attachment.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    bump_notes_version(user_id)
+    db.session.commit()
+    return '', 204
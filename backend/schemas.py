@@ -18,17 +18,71 @@ class NoteSchema(Schema):
     title = fields.Str(required=True, validate=validate.Length(min=1, max=200))
     content = fields.Str(allow_none=True)
     user_id = fields.Int(dump_only=True)
+    version = fields.Int(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
 
+class NoteSummarySchema(Schema):
+    id = fields.Int(dump_only=True)
+    title = fields.Str(dump_only=True)
+    snippet = fields.Str(dump_only=True, allow_none=True)
+    content_size = fields.Int(dump_only=True, allow_none=True)
+    user_id = fields.Int(dump_only=True)
+    version = fields.Int(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+
+class SearchResultSchema(NoteSummarySchema):
+    # snippet stays plain text, as in summary listings; this is the HTML version
+    highlight = fields.Str(dump_only=True, allow_none=True)
+
+class NoteTombstoneSchema(Schema):
+    id = fields.Int(attribute='note_id', dump_only=True)
+    deleted_at = fields.DateTime(dump_only=True)
+
 class NoteUpdateSchema(Schema):
     title = fields.Str(validate=validate.Length(min=1, max=200))
     content = fields.Str(allow_none=True)
 
+class SpliceSchema(Schema):
+    start = fields.Int(required=True, validate=validate.Range(min=0))
+    end = fields.Int(required=True, validate=validate.Range(min=0))
+    text = fields.Str(load_default='')
+
+class NotePatchSchema(Schema):
+    base_version = fields.Int(required=True)
+    title = fields.Str(validate=validate.Length(min=1, max=200))
+    patches = fields.List(fields.Nested(SpliceSchema), load_default=list)
+
+class AccountDeletionSchema(Schema):
+    id = fields.Int(dump_only=True)
+    status = fields.Str(dump_only=True)
+    notes_total = fields.Int(dump_only=True)
+    notes_deleted = fields.Int(dump_only=True)
+    error = fields.Str(dump_only=True, allow_none=True)
+    requested_at = fields.DateTime(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+    finished_at = fields.DateTime(dump_only=True, allow_none=True)
+
+class AttachmentSchema(Schema):
+    note_id = fields.Int(dump_only=True)
+    sha256 = fields.Str(dump_only=True)
+    filename = fields.Str(dump_only=True)
+    content_type = fields.Str(dump_only=True)
+    size = fields.Int(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+
 # Initialize schemas
 user_schema = UserSchema()
 user_register_schema = UserRegisterSchema()
 user_login_schema = UserLoginSchema()
 note_schema = NoteSchema()
 notes_schema = NoteSchema(many=True)
+note_summaries_schema = NoteSummarySchema(many=True)
+search_results_schema = SearchResultSchema(many=True)
+note_tombstones_schema = NoteTombstoneSchema(many=True)
 note_update_schema = NoteUpdateSchema()
+note_patch_schema = NotePatchSchema()
+account_deletion_schema = AccountDeletionSchema()
+attachment_schema = AttachmentSchema()
+attachments_schema = AttachmentSchema(many=True)
@@ -0,0 +1,110 @@
+import html
+from sqlalchemy import DDL, column, event, func, literal_column, table, text
+from sqlalchemy.orm import defer, with_expression
+from sqlalchemy.orm.attributes import set_committed_value
+from models import Note
+
+# External-content FTS5 index over notes.title/notes.content. The triggers
+# keep it in sync with every INSERT, UPDATE and DELETE on the notes table,
+# including bulk statements that bypass the ORM. Content may be stored
+# compressed (see storage.py), so the index reads it through the notes_text
+# view and note_text() rather than from the notes table directly.
+FTS_DDL = [
+    """CREATE VIEW IF NOT EXISTS notes_text AS
+        SELECT id, title, note_text(content) AS content FROM notes""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, content, content='notes_text', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, note_text(new.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, note_text(old.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, content ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, note_text(old.content));
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, note_text(new.content));
+    END""",
+]
+
+# Objects from earlier versions of the index, dropped before a rebuild
+FTS_DROP = [
+    "DROP TRIGGER IF EXISTS notes_fts_ai",
+    "DROP TRIGGER IF EXISTS notes_fts_ad",
+    "DROP TRIGGER IF EXISTS notes_fts_au",
+    "DROP TABLE IF EXISTS notes_fts",
+    "DROP VIEW IF EXISTS notes_text",
+]
+
+for statement in FTS_DDL:
+    event.listen(Note.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+notes_fts = table('notes_fts', column('rowid'))
+fts = literal_column('notes_fts')
+
+# Private-use characters FTS5 wraps matches in. Note text is not HTML, so
+# the highlight is escaped first and only then are these turned into <mark>;
+# the plain snippet simply drops them
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+# Title matches count for more than body matches
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+def build_match_query(q):
+    """Turn free text into an FTS5 query that ANDs every term.
+
+    Each term is quoted so user input can never be parsed as FTS5 syntax.
+    """
+    terms = q.split()
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+def search_notes(user_id, q, limit, offset=0, snippet_tokens=16):
+    """Return BM25-ranked notes of ``user_id`` matching ``q``.
+
+    Matching notes carry a plain-text ``snippet``, like summary listings,
+    and a ``highlight``: the same text HTML-escaped with matches wrapped in
+    ``<mark>`` tags. ``content`` is not loaded.
+    """
+    rank = func.bm25(fts, TITLE_WEIGHT, CONTENT_WEIGHT)
+    snippet = func.snippet(fts, -1, MATCH_START, MATCH_END, '…', snippet_tokens)
+    
+    notes = (
+        Note.query
+        .join(notes_fts, notes_fts.c.rowid == Note.id)
+        .filter(fts.op('MATCH')(build_match_query(q)))
+        .filter(Note.user_id == user_id)
+        .options(defer(Note.content), with_expression(Note.highlight, snippet))
+        .order_by(rank, Note.id.desc())
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
+    for note in notes:
+        # Not a change to the row, so nothing is flushed
+        marked = note.highlight
+        set_committed_value(note, 'snippet', plain(marked))
+        set_committed_value(note, 'highlight', highlight(marked))
+    return notes
+
+def plain(snippet):
+    """An FTS snippet as plain text, without its match markers"""
+    if snippet is None:
+        return None
+    return snippet.replace(MATCH_START, '').replace(MATCH_END, '')
+
+def highlight(snippet):
+    """HTML-escape an FTS snippet and mark its matches with <mark> tags"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+def rebuild_index(session):
+    """Recreate the FTS table, view and triggers and reindex every note"""
+    for statement in FTS_DROP + FTS_DDL:
+        session.execute(text(statement))
+    session.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+    session.commit()
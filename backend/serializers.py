@@ -0,0 +1,70 @@
+"""
+Hand-written serializers for hot read paths.
+
+Each function returns exactly what the matching marshmallow schema's
+``dump`` would, without the per-field dispatch. Schemas remain the source
+of truth for validation; tests/test_serializers.py keeps the two in sync.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def dump_note(note):
+    """Same output as NoteSchema().dump(note)"""
+    return {
+        'id': note.id,
+        'title': note.title,
+        'content': note.content,
+        'user_id': note.user_id,
+        'version': note.version,
+        'created_at': _isoformat(note.created_at),
+        'updated_at': _isoformat(note.updated_at),
+    }
+
+def dump_note_summary(note):
+    """Same output as NoteSummarySchema().dump(note)"""
+    return {
+        'id': note.id,
+        'title': note.title,
+        'snippet': note.snippet,
+        'content_size': note.content_size,
+        'user_id': note.user_id,
+        'version': note.version,
+        'created_at': _isoformat(note.created_at),
+        'updated_at': _isoformat(note.updated_at),
+    }
+
+def dump_user(user):
+    """Same output as UserSchema().dump(user)"""
+    return {
+        'id': user.id,
+        'email': user.email,
+        'created_at': _isoformat(user.created_at),
+    }
+
+def dumps(obj):
+    """Encode ``obj`` as compact JSON bytes with sorted keys, like jsonify"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def iter_json_array(rows, serialize, batch_size):
+    """Yield a JSON array of ``serialize(row)`` in chunks of ``batch_size`` rows"""
+    yield b'['
+    separator = b''
+    batch = []
+    for row in rows:
+        batch.append(dumps(serialize(row)))
+        if len(batch) >= batch_size:
+            yield separator + b','.join(batch)
+            separator = b','
+            batch = []
+    if batch:
+        yield separator + b','.join(batch)
+    yield b']\n'
@@ -0,0 +1,286 @@
+"""
+Per-user sharding of note data.
+
+With DATABASE_SHARD_URLS set, note data lives on ``shard_<n>`` binds, so
+writes from different users stop queueing on a single database lock. The
+main database becomes the directory. It keeps the login rows and records
+each user's shard in ``users.shard``. NULL there means the directory
+itself, which is where accounts made before sharding stay until they are
+moved. New users are placed by rendezvous hashing of their id, so adding a
+shard only claims about 1/N of the users when rebalancing.
+
+A shard holds its users' notes, tombstones, attachment rows and search
+index; attachment blobs are shared by every database. It also holds a
+tenant row per user in its own ``users`` table. That row has no
+credentials and carries the counters the note triggers and writers keep,
+so every note request runs on one database. Each database allocates note
+ids from its own range (see ShardInfo), which lets move_user copy a user
+to another shard without renumbering their notes.
+
+A move freezes the user in the directory, so new note writes get 503, and
+also freezes the user row on the source database. Requests admitted
+before the freeze may still be writing there. Every note write bumps
+notes_version inside its transaction, and bump_notes_version only updates
+a row that is not frozen and still holds the user's data (``shard`` is
+NULL). So such a write either commits before the freeze, and is copied,
+or fails with UserMoving and is answered with 503.
+"""
+import hashlib
+from contextlib import contextmanager
+from flask import current_app, g, jsonify, request
+from sqlalchemy import delete, insert, select, update
+from db import db
+from identity import request_user
+from models import Attachment, Note, NoteTombstone, ShardInfo, User
+
+SHARD_BIND_PREFIX = 'shard_'
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# Note ids per database: the directory allocates below this, shard_<n>
+# from (n + 1) times this upwards
+NOTE_ID_RANGE = 2 ** 40
+
+# Per-user counters that live on the tenant row
+TENANT_COLUMNS = ('notes_version', 'notes_modified_at', 'notes_sync_floor', 'note_count', 'notes_content_bytes')
+
+class ShardMoveError(Exception):
+    """A move could not be completed; the user stays where they were"""
+
+class UserMoving(Exception):
+    """A note write reached a database the user is being moved off"""
+
+def _shard_index(name):
+    return int(name[len(SHARD_BIND_PREFIX):])
+
+def shard_names(app=None):
+    """Configured shard binds, in index order"""
+    return (app or current_app).extensions.get('shards', [])
+
+def database_names(app=None):
+    """The directory (None) followed by every shard, for maintenance scripts"""
+    return [None] + shard_names(app)
+
+def placement(user_id, names):
+    """Rendezvous hashing: the shard that scores highest for this user"""
+    def score(name):
+        digest = hashlib.blake2b(f'{name}:{user_id}'.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    return max(names, key=score)
+
+def shard_engine(name):
+    """Engine for a shard name; None is the directory"""
+    return db.engine if name is None else db.engines[name]
+
+@contextmanager
+def use_shard(name):
+    """Send the session's note statements to shard ``name`` (None: the directory)"""
+    # Pending changes are flushed where they were made, not where autoflush happens
+    db.session.flush()
+    previous = g.get('db_shard')
+    g.db_shard = None if name is None else db.engines[name]
+    try:
+        yield
+        db.session.flush()
+    finally:
+        g.db_shard = previous
+
+def create_shard_tables():
+    """Create the note tables on every shard and give each database its id range"""
+    names = shard_names()
+    if not names:
+        return
+    tables = [table for table in db.metadata.sorted_tables if not table.info.get('directory')]
+    for name in names:
+        db.metadata.create_all(db.engines[name], tables=tables)
+    
+    info = ShardInfo.__table__
+    for name in database_names():
+        with shard_engine(name).begin() as connection:
+            if connection.execute(select(info.c.id)).first() is None:
+                floor = 0 if name is None else (_shard_index(name) + 1) * NOTE_ID_RANGE
+                # next_id is started by upgrade_schema, past the ids in use
+                connection.execute(insert(info).values(id_floor=floor, id_ceiling=floor + NOTE_ID_RANGE))
+
+def assign_shard(user):
+    """Place a new, flushed user on a shard and add their tenant row there"""
+    names = shard_names()
+    if not names:
+        return
+    user.shard = placement(user.id, names)
+    with use_shard(user.shard):
+        db.session.execute(insert(User).values(
+            id=user.id, email=user.email, password_hash='', created_at=user.created_at
+        ))
+
+def moving_response(exc=None):
+    """503 for note writes during a move; also the UserMoving error handler"""
+    if exc is not None:
+        # The refused UPDATE opened a write transaction
+        db.session.rollback()
+    response = jsonify({'error': 'Account is being moved, please retry'})
+    response.headers['Retry-After'] = str(current_app.config['SHARD_MOVE_RETRY_AFTER'])
+    return response, 503
+
+def use_user_shard():
+    """before_request hook for the note routes: run them on the user's shard.
+    
+    Writes are refused with 503 while the user is being moved.
+    """
+    if not shard_names():
+        return None
+    row = request_user()
+    if row is None:
+        return None
+    if row.shard_moving and request.method not in READ_METHODS:
+        return moving_response()
+    g.db_shard = None if row.shard is None else db.engines[row.shard]
+    return None
+
+def release_user_shard(exc):
+    """teardown_request counterpart of use_user_shard"""
+    g.pop('db_shard', None)
+
+def _copy_user(source, target, user_id, batch_size):
+    """Replace the user's data on ``target`` with a snapshot from ``source``"""
+    users, notes, tombstones, attachments = User.__table__, Note.__table__, NoteTombstone.__table__, Attachment.__table__
+    with source.connect() as reader, target.begin() as writer:
+        if reader.dialect.name == 'sqlite':
+            # pysqlite only opens a transaction before DML, and each SELECT
+            # would see the database as of its own start; one read
+            # transaction makes the copy a consistent snapshot
+            reader.exec_driver_sql('BEGIN')
+        tenant = reader.execute(select(users).where(users.c.id == user_id)).one()
+        values = {name: tenant._mapping[name] for name in TENANT_COLUMNS}
+        if target is not db.engine:
+            # A tenant row left frozen by an interrupted move
+            values['shard_moving'] = False
+        
+        # Leftovers of an earlier, interrupted move; attachments go with their notes
+        writer.execute(delete(notes).where(notes.c.user_id == user_id))
+        writer.execute(delete(tombstones).where(tombstones.c.user_id == user_id))
+        # The tenant row goes first for the foreign keys
+        if writer.execute(update(users).where(users.c.id == user_id).values(**values)).rowcount == 0:
+            writer.execute(insert(users).values(
+                id=user_id, email=tenant.email, password_hash='', created_at=tenant.created_at, **values
+            ))
+        
+        moved = 0
+        result = reader.execution_options(yield_per=batch_size).execute(
+            select(notes).where(notes.c.user_id == user_id).order_by(notes.c.id)
+        )
+        for rows in result.partitions():
+            writer.execute(insert(notes), [row._asdict() for row in rows])
+            moved += len(rows)
+        
+        # Tombstone and attachment ids are internal, so the target numbers them itself
+        for table in (tombstones, attachments):
+            columns = [column for column in table.c if column.name != 'id']
+            result = reader.execution_options(yield_per=batch_size).execute(
+                select(*columns).where(table.c.user_id == user_id).order_by(table.c.id)
+            )
+            for rows in result.partitions():
+                writer.execute(insert(table), [row._asdict() for row in rows])
+        
+        # The note triggers counted the copies on top; restore the source's values
+        writer.execute(update(users).where(users.c.id == user_id).values(**values))
+    return moved
+
+def _delete_user_data(engine, user_id, batch_size, keep_user_row):
+    users, notes, tombstones, attachments = User.__table__, Note.__table__, NoteTombstone.__table__, Attachment.__table__
+    for table in (attachments, notes, tombstones):
+        deleted = batch_size
+        while deleted == batch_size:
+            ids = select(table.c.id).where(table.c.user_id == user_id).limit(batch_size).scalar_subquery()
+            with engine.begin() as connection:
+                deleted = connection.execute(delete(table).where(table.c.id.in_(ids))).rowcount
+    if not keep_user_row:
+        with engine.begin() as connection:
+            connection.execute(delete(users).where(users.c.id == user_id))
+
+def _set_user(user_id, engine=None, **values):
+    """Update the user's row on ``engine``, by default the directory"""
+    with (engine or db.engine).begin() as connection:
+        connection.execute(update(User).where(User.id == user_id).values(**values))
+
+def move_user(user_id, target, batch_size=500):
+    """Move a user's note data to shard ``target`` (None: the directory).
+    
+    Note writes are refused while the data is copied, including those of
+    requests admitted before the move started (see the module docstring).
+    The directory is then pointed at the copy and the old one deleted.
+    Returns the number of notes moved.
+    """
+    with db.engine.connect() as connection:
+        row = connection.execute(
+            select(User.shard, User.deletion_requested_at).where(User.id == user_id)
+        ).first()
+    if row is None:
+        raise ShardMoveError(f'User {user_id} does not exist')
+    if row.deletion_requested_at is not None:
+        raise ShardMoveError(f'User {user_id} is being deleted')
+    if target is not None and target not in shard_names():
+        raise ShardMoveError(f'Unknown shard {target!r}')
+    source = row.shard
+    if source == target:
+        return 0
+    source_engine = shard_engine(source)
+    
+    _set_user(user_id, shard_moving=True)
+    try:
+        if source is not None:
+            # Waits for write transactions on the source that already hold
+            # its lock; later ones find the row frozen
+            _set_user(user_id, source_engine, shard_moving=True)
+        moved = _copy_user(source_engine, shard_engine(target), user_id, batch_size)
+    except BaseException:
+        if source is not None:
+            _set_user(user_id, source_engine, shard_moving=False)
+        _set_user(user_id, shard_moving=False)
+        raise
+    # The source row stays frozen until it is deleted. On the directory it is
+    # the login row, and the non-NULL shard now turns away late writers
+    _set_user(user_id, shard=target, shard_moving=False)
+    
+    # On the directory the user row is also the login row, so it stays
+    _delete_user_data(source_engine, user_id, batch_size, keep_user_row=source is None)
+    return moved
+
+def rebalance(batch_size=500, dry_run=False):
+    """Move every user whose shard differs from their placement.
+    
+    Returns ``(moves, failures)``: the ``(user_id, source, target)`` moves
+    made (all of them with ``dry_run``), and ``(user_id, ShardMoveError)``
+    for each one that failed. A failed move leaves that user where they
+    were and the others are still moved.
+    """
+    names = shard_names()
+    if not names:
+        raise ShardMoveError('No shards are configured')
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(User.id, User.shard).where(User.deletion_requested_at.is_(None)).order_by(User.id)
+        ).all()
+    moves = [(row.id, row.shard, placement(row.id, names)) for row in rows]
+    moves = [move for move in moves if move[1] != move[2]]
+    if dry_run:
+        return moves, []
+    made, failures = [], []
+    for user_id, source, target in moves:
+        try:
+            move_user(user_id, target, batch_size)
+        except ShardMoveError as exc:
+            failures.append((user_id, exc))
+        except Exception as exc:
+            current_app.logger.exception('Moving user %s to %s failed', user_id, target)
+            failures.append((user_id, ShardMoveError(f'Moving user {user_id} to {target} failed: {exc}')))
+        else:
+            made.append((user_id, source, target))
+    return made, failures
+
+def init_sharding(app):
+    """Record the configured shard binds"""
+    app.register_error_handler(UserMoving, moving_response)
+    names = sorted((name for name in app.config.get('SQLALCHEMY_BINDS') or {}
+                    if name.startswith(SHARD_BIND_PREFIX)), key=_shard_index)
+    if names:
+        app.extensions['shards'] = names
@@ -0,0 +1,41 @@
+from sqlalchemy import func, or_, select, text, update
+from db import db
+from models import Note, User, NOTE_STATS_DDL
+
+def get_note_stats(user_id):
+    """Return a user's counters row: one primary key lookup, no note scan"""
+    return db.session.query(
+        User.note_count,
+        User.notes_content_bytes,
+        User.notes_version,
+        User.notes_modified_at
+    ).filter_by(id=user_id).first()
+
+def reconcile_stats(user_id=None):
+    """Recompute note counters from the notes table.
+
+    Also (re)creates the triggers that maintain them. Returns the number of
+    users whose counters had drifted and were corrected.
+    """
+    for statement in NOTE_STATS_DDL:
+        db.session.execute(text(statement))
+    
+    count = (
+        select(func.count(Note.id))
+        .where(Note.user_id == User.id)
+        .scalar_subquery()
+    )
+    size = (
+        select(func.coalesce(func.sum(Note.content_size), 0))
+        .where(Note.user_id == User.id)
+        .scalar_subquery()
+    )
+    statement = update(User).where(or_(User.note_count != count, User.notes_content_bytes != size))
+    if user_id is not None:
+        statement = statement.where(User.id == user_id)
+    fixed = db.session.execute(
+        statement.values(note_count=count, notes_content_bytes=size),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return fixed
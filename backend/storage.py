@@ -0,0 +1,117 @@
+"""
+Optional compression of note content at rest.
+
+Large content is stored as a BLOB (a small header followed by zlib data)
+in the same ``notes.content`` column that holds plain text, so the column
+type decides nothing and old rows keep working. Decompression happens in
+CompressedText when a row is loaded; listings that defer ``content`` never
+touch the blob. SQLite sees the same data through the ``note_text()`` and
+``note_size()`` functions registered on every connection.
+"""
+import struct
+import zlib
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.types import Text, TypeDecorator
+from db import db
+
+# Format version byte + original size in bytes, then the zlib stream
+HEADER = struct.Struct('>BQ')
+FORMAT_VERSION = 1
+
+# Process-wide policy, set from Config by init_content_storage
+_policy = {'enabled': False, 'threshold': 4096, 'level': 6}
+
+def compress_content(text):
+    """Encode ``text`` as a compressed blob if the policy says so"""
+    if text is None or not _policy['enabled']:
+        return text
+    raw = text.encode('utf-8')
+    if len(raw) < _policy['threshold']:
+        return text
+    packed = HEADER.pack(FORMAT_VERSION, len(raw)) + zlib.compress(raw, _policy['level'])
+    # Not worth it if compression barely helps
+    if len(packed) >= len(raw):
+        return text
+    return packed
+
+def decompress_content(value):
+    """Inverse of compress_content; plain text passes through unchanged"""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    return zlib.decompress(value[HEADER.size:]).decode('utf-8')
+
+def content_size(value):
+    """Original size in bytes, read from the blob header without inflating"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, memoryview)):
+        return HEADER.unpack_from(bytes(value[:HEADER.size]))[1]
+    return len(value.encode('utf-8'))
+
+class CompressedText(TypeDecorator):
+    """Text column whose large values are transparently stored compressed"""
+    
+    impl = Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return compress_content(value)
+    
+    def process_result_value(self, value, dialect):
+        return decompress_content(value)
+
+def register_sqlite_functions(dbapi_connection, connection_record=None):
+    dbapi_connection.create_function('note_text', 1, decompress_content, deterministic=True)
+    dbapi_connection.create_function('note_size', 1, content_size, deterministic=True)
+
+def init_content_storage(app):
+    """Apply the NOTES_COMPRESS_* settings and register the SQL helpers"""
+    level = app.config['NOTES_COMPRESS_LEVEL']
+    if not 1 <= level <= 9:
+        raise ValueError('NOTES_COMPRESS_LEVEL must be between 1 and 9')
+    _policy.update(
+        enabled=app.config['NOTES_COMPRESS_CONTENT'],
+        threshold=app.config['NOTES_COMPRESS_THRESHOLD'],
+        level=level
+    )
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', register_sqlite_functions)
+
+def migrate_content(session, batch_size):
+    """Rewrite stored content to match the current policy, in id order.
+
+    With compression enabled, large plain-text rows are compressed; with it
+    disabled, compressed rows are expanded again. Rows without sizes are
+    rewritten too so the size triggers fill them in. Commits once per batch
+    and returns the number of rows rewritten.
+    """
+    if _policy['enabled']:
+        condition = ("content_size IS NULL OR (typeof(content) = 'text' "
+                     "AND length(CAST(content AS BLOB)) >= :threshold)")
+    else:
+        condition = "content_size IS NULL OR typeof(content) = 'blob'"
+    select_batch = text(
+        f'SELECT id, content FROM notes WHERE id > :last_id AND ({condition}) ORDER BY id LIMIT :limit'
+    )
+    update_row = text('UPDATE notes SET content = :content WHERE id = :id').bindparams(
+        bindparam('content', type_=CompressedText())
+    )
+    
+    last_id = 0
+    rewritten = 0
+    while True:
+        rows = session.execute(select_batch, {
+            'last_id': last_id, 'threshold': _policy['threshold'], 'limit': batch_size
+        }).all()
+        if not rows:
+            return rewritten
+        session.execute(update_row, [
+            {'id': row.id, 'content': decompress_content(row.content)} for row in rows
+        ])
+        session.commit()
+        rewritten += len(rows)
+        last_id = rows[-1].id
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, update
+from db import db
+from models import Note, NoteTombstone, User
+
+class SyncTokenExpired(Exception):
+    """Raised when tombstones newer than a sync token have been compacted"""
+
+def parse_sync_token(token):
+    """Sync tokens are the user's notes_version rendered as a string"""
+    if token is None or token == '':
+        return 0
+    since = int(token)
+    if since < 0:
+        raise ValueError('since must not be negative')
+    return since
+
+def get_changes(user_id, since):
+    """Return ``(notes, tombstones, version)`` for changes after ``since``.
+
+    ``since=0`` returns a full snapshot without tombstones. When nothing
+    changed the answer comes from the users primary key alone.
+    """
+    row = db.session.query(User.notes_version, User.notes_sync_floor).filter_by(id=user_id).first()
+    if row is None:
+        return [], [], 0
+    version, floor = row
+    
+    if since == 0:
+        notes = Note.query.filter_by(user_id=user_id).order_by(Note.change_seq, Note.id).all()
+        return notes, [], version
+    if since > version:
+        raise ValueError('since is ahead of the current sync token')
+    if since < floor:
+        raise SyncTokenExpired()
+    if since == version:
+        return [], [], version
+    
+    notes = (
+        Note.query
+        .filter(Note.user_id == user_id, Note.change_seq > since)
+        .order_by(Note.change_seq, Note.id)
+        .all()
+    )
+    # A tombstone is superseded if its id was reused by a newer note
+    live_ids = {note.id for note in notes}
+    tombstones = [
+        tombstone for tombstone in
+        NoteTombstone.query
+        .filter(NoteTombstone.user_id == user_id, NoteTombstone.change_seq > since)
+        .order_by(NoteTombstone.change_seq, NoteTombstone.id)
+        if tombstone.note_id not in live_ids
+    ]
+    return notes, tombstones, version
+
+def compact_tombstones(retention_days):
+    """Delete tombstones older than ``retention_days``.
+
+    Each affected user's sync floor is raised to the newest pruned change
+    so clients holding an older token are told to resynchronize fully.
+    Returns the number of tombstones removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = NoteTombstone.deleted_at < cutoff
+    
+    pruned = (
+        select(func.max(NoteTombstone.change_seq))
+        .where(NoteTombstone.user_id == User.id, expired)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(select(NoteTombstone.user_id).where(expired)))
+        .values(notes_sync_floor=func.max(User.notes_sync_floor, pruned)),
+        execution_options={'synchronize_session': False}
+    )
+    removed = db.session.execute(delete(NoteTombstone).where(expired)).rowcount
+    db.session.commit()
+    return removed
@@ -1,10 +1,8 @@
 import pytest
 import tempfile
 import os
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
-from flask_cors import CORS
+import shutil
+from app import create_app
 from db import db, init_db
 
 @pytest.fixture(scope='function')
@@ -12,41 +10,36 @@ def app():
     """Create and configure a new app instance for each test."""
     # Create a temporary file to serve as the database
     db_fd, db_path = tempfile.mkstemp()
+    attachments_dir = tempfile.mkdtemp()
     
-    app = Flask(__name__)
-    app.config.update({
+    # The production factory, so tests get the same wiring and error handlers
+    app = create_app({
         'TESTING': True,
         'SECRET_KEY': 'test-secret-key',
         'JWT_SECRET_KEY': 'test-jwt-secret-key',
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'JWT_ACCESS_TOKEN_EXPIRES': 86400,
-        'CORS_ORIGINS': ['http://localhost:5173']
+        'CORS_ORIGINS': ['http://localhost:5173'],
+        # Hash inline and cheaply; the pool itself is covered in test_auth.py
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        # Limits are exercised in test_admission.py
+        'RATE_LIMIT_ENABLED': False,
+        # No background sweeps against a database that is about to go away
+        'ACCOUNT_DELETION_RESUME_AFTER': 0,
+        'ATTACHMENTS_DIR': attachments_dir
     })
     
-    # Initialize extensions
-    db.init_app(app)
-    jwt = JWTManager(app)
-    CORS(app, origins=app.config['CORS_ORIGINS'])
-    
-    # Register blueprints
-    from routes.auth import auth_bp
-    from routes.notes import notes_bp
-    
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(notes_bp, url_prefix='/api/notes')
-    
-    # Health check endpoint
-    @app.route('/api/health')
-    def health_check():
-        return {'status': 'healthy'}
-    
     with app.app_context():
         init_db(app)
         yield app
+        db.session.remove()
+        db.engine.dispose()
     
     os.close(db_fd)
     os.unlink(db_path)
+    shutil.rmtree(attachments_dir)
 
 @pytest.fixture
 def client(app):
@@ -0,0 +1,71 @@
+import threading
+import time
+from admission import ConcurrencyPool, TokenBucketLimiter
+
+def test_concurrency_pool_queue_and_shedding():
+    """Test a full pool queues up to its bound and sheds the rest"""
+    pool = ConcurrencyPool(limit=1, queue=1, timeout=5)
+    assert pool.acquire()
+    
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(pool.acquire()))
+    waiter.start()
+    while pool.stats()['queued'] == 0:
+        time.sleep(0.001)
+    
+    # The queue is full now, so the next caller is turned away immediately
+    assert not pool.acquire()
+    pool.release()
+    waiter.join()
+    assert admitted == [True]
+    assert pool.stats() | {'limit': None} == {
+        'limit': None, 'in_flight': 1, 'queued': 0, 'admitted_total': 2, 'rejected_total': 1
+    }
+    
+    # Waiting is bounded by the timeout
+    pool = ConcurrencyPool(limit=1, queue=1, timeout=0.01)
+    assert pool.acquire()
+    assert not pool.acquire()
+
+def test_token_bucket():
+    """Test buckets allow a burst, then refuse with the wait until refill"""
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    assert limiter.take('a') == 0
+    assert limiter.take('a') == 0
+    assert 0 < limiter.take('a') <= 1
+    assert limiter.take('b') == 0
+    assert limiter.stats() == {'limited_total': 1, 'tracked_keys': 2}
+
+def test_rate_limit_per_user(app, client, auth_headers):
+    """Test a user over their budget gets 429 with Retry-After"""
+    app.extensions['rate_limiter'] = TokenBucketLimiter(rate=0.01, burst=2)
+    assert client.get('/api/notes', headers=auth_headers).status_code == 200
+    assert client.get('/api/notes', headers=auth_headers).status_code == 200
+    
+    response = client.get('/api/notes', headers=auth_headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    
+    # Anonymous requests have their own bucket, and health checks are exempt
+    assert client.post('/api/auth/login', json={}).status_code == 400
+    assert client.get('/api/health').status_code == 200
+    assert 'rate_limited_total 1' in client.get('/api/metrics').get_data(as_text=True)
+
+def test_saturated_pool_sheds_load(app, client, auth_headers):
+    """Test a full pool answers 503 at once while other pools keep working"""
+    app.extensions['admission']['default'] = ConcurrencyPool(limit=0, queue=0, timeout=0)
+    
+    response = client.get('/api/notes', headers=auth_headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    
+    # Login runs in the expensive pool
+    response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    assert response.status_code == 200
+    
+    metrics = client.get('/api/metrics').get_data(as_text=True)
+    assert 'admission_rejected_total{pool="default"} 1' in metrics
+    assert 'admission_in_flight{pool="expensive"} 0' in metrics
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import os
+from sqlalchemy import func, select
+from db import db
+from attachments import collect_garbage
+from models import Attachment
+
+IMAGE = bytes(range(256)) * 40
+
+def create_note(client, auth_headers, title='With files'):
+    return client.post('/api/notes', json={'title': title}, headers=auth_headers).json['id']
+
+def upload(client, auth_headers, note_id, data, filename='photo.png', content_type='image/png'):
+    return client.post(
+        f'/api/notes/{note_id}/attachments?filename={filename}',
+        data=data, content_type=content_type, headers=auth_headers
+    )
+
+def blob_files(app):
+    root = app.extensions['attachments'].root
+    return [name for _, _, names in os.walk(root) for name in names]
+
+def test_upload_is_deduplicated(client, auth_headers, app):
+    """Test uploads are stored once per content and repeats return the existing attachment"""
+    first = create_note(client, auth_headers)
+    second = create_note(client, auth_headers, 'Other')
+    digest = hashlib.sha256(IMAGE).hexdigest()
+    
+    response = upload(client, auth_headers, first, IMAGE)
+    assert response.status_code == 201
+    assert response.json['sha256'] == digest
+    assert response.json['size'] == len(IMAGE)
+    assert response.json['content_type'] == 'image/png'
+    assert response.headers['Location'] == f'/api/notes/{first}/attachments/{digest}'
+    
+    assert upload(client, auth_headers, first, IMAGE, 'copy.png').status_code == 200
+    assert upload(client, auth_headers, second, IMAGE).status_code == 201
+    assert blob_files(app) == [digest]
+    
+    listing = client.get(f'/api/notes/{first}/attachments', headers=auth_headers).json
+    assert [(item['filename'], item['sha256']) for item in listing] == [('photo.png', digest)]
+
+def test_upload_validation(client, auth_headers, app):
+    """Test missing file names, oversized bodies and other users' notes are refused"""
+    note_id = create_note(client, auth_headers)
+    response = client.post(f'/api/notes/{note_id}/attachments', data=b'x', headers=auth_headers)
+    assert response.status_code == 400
+    assert 'filename' in response.json['details']
+    
+    app.config['ATTACHMENTS_MAX_BYTES'] = 100
+    assert upload(client, auth_headers, note_id, b'x' * 101).status_code == 413
+    # Chunked bodies have no Content-Length and are cut off while streaming
+    response = client.post(
+        f'/api/notes/{note_id}/attachments?filename=big.bin', input_stream=io.BytesIO(b'x' * 120),
+        headers={**auth_headers, 'Transfer-Encoding': 'chunked'}, environ_overrides={'wsgi.input_terminated': True}
+    )
+    assert response.status_code == 413
+    assert blob_files(app) == []
+    
+    credentials = {'email': 'other@example.com', 'password': 'testpassword123'}
+    client.post('/api/auth/register', json=credentials)
+    token = client.post('/api/auth/login', json=credentials).json['access_token']
+    other = {'Authorization': f'Bearer {token}'}
+    assert upload(client, other, note_id, b'x').status_code == 404
+    assert client.get(f'/api/notes/{note_id}/attachments', headers=other).status_code == 404
+
+def test_download_conditional_and_ranges(client, auth_headers):
+    """Test downloads carry the hash as ETag and honour If-None-Match and Range"""
+    note_id = create_note(client, auth_headers)
+    url = upload(client, auth_headers, note_id, IMAGE).headers['Location']
+    
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.data == IMAGE
+    assert response.headers['ETag'] == f'"{hashlib.sha256(IMAGE).hexdigest()}"'
+    assert response.headers['Content-Disposition'].startswith('inline')
+    assert 'private' in response.headers['Cache-Control']
+    assert 'public' not in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    
+    assert client.get(url, headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+    
+    response = client.get(url, headers={**auth_headers, 'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == IMAGE[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(IMAGE)}'
+    
+    # A stale If-Range falls back to the whole file
+    response = client.get(url, headers={**auth_headers, 'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == IMAGE
+    
+    html = upload(client, auth_headers, note_id, b'<script></script>', 'page.html', 'text/html')
+    response = client.get(html.headers['Location'], headers=auth_headers)
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    response.close()
+
+def test_delete_and_garbage_collection(client, auth_headers, app):
+    """Test rows go with the attachment or note and unreferenced blobs are collected"""
+    note_id = create_note(client, auth_headers)
+    other_id = create_note(client, auth_headers, 'Other')
+    url = upload(client, auth_headers, note_id, IMAGE).headers['Location']
+    upload(client, auth_headers, note_id, b'second file')
+    upload(client, auth_headers, other_id, IMAGE)
+    
+    assert client.delete(url, headers=auth_headers).status_code == 204
+    assert client.delete(url, headers=auth_headers).status_code == 404
+    assert client.get(url, headers=auth_headers).status_code == 404
+    assert client.delete(f'/api/notes/{note_id}', headers=auth_headers).status_code == 204
+    assert db.session.scalar(select(func.count()).select_from(Attachment)) == 1
+    
+    # Recent blobs are kept for uploads whose rows are not committed yet
+    assert collect_garbage(3600) == (0, 0)
+    assert collect_garbage(0) == (1, len(b'second file'))
+    assert blob_files(app) == [hashlib.sha256(IMAGE).hexdigest()]
+    url = f'/api/notes/{other_id}/attachments/{hashlib.sha256(IMAGE).hexdigest()}'
+    assert client.get(url, headers=auth_headers).data == IMAGE
@@ -1,5 +1,7 @@
 import pytest
 import json
+from hashing import password_hasher
+from models import User
 
 def test_register_success(client):
     """Test successful user registration"""
@@ -108,3 +110,57 @@ def test_get_current_user_no_token(client):
     """Test getting current user without token"""
     response = client.get('/api/auth/me')
     assert response.status_code == 401
+
+def test_login_rehashes_outdated_hash(client, app):
+    """Test login transparently upgrades hashes made with old parameters"""
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    assert User.query.first().password_hash.startswith('pbkdf2:sha256:1000$')
+    
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    password_hasher.init_app(app)
+    
+    response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    assert response.status_code == 200
+    assert User.query.first().password_hash.startswith('pbkdf2:sha256:2000$')
+
+def test_hashing_saturated(client, app):
+    """Test a full hashing queue fails fast with 503 and Retry-After"""
+    app.config['PASSWORD_HASH_QUEUE_DEPTH'] = 0
+    password_hasher.init_app(app)
+    
+    response = client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    assert password_hasher.stats()['hash_rejected_total'] == 1
+
+def test_hashing_process_pool(client, app):
+    """Test register and login through the worker process pool"""
+    app.config['PASSWORD_HASH_WORKERS'] = 1
+    password_hasher.init_app(app)
+    try:
+        response = client.post('/api/auth/register', json={
+            'email': 'test@example.com',
+            'password': 'testpassword123'
+        })
+        assert response.status_code == 201
+        
+        response = client.post('/api/auth/login', json={
+            'email': 'test@example.com',
+            'password': 'testpassword123'
+        })
+        assert response.status_code == 200
+        
+        stats = password_hasher.stats()
+        assert stats['hash_queue_wait_seconds_count'] == 2
+        assert stats['hash_in_flight'] == 0
+    finally:
+        app.extensions['password_hasher'].shutdown()
@@ -0,0 +1,91 @@
+import pytest
+
+def test_batch_mixed_operations(client, auth_headers):
+    """Test a batch of creates, updates and deletes"""
+    keep = client.post('/api/notes', json={'title': 'Keep', 'content': 'Old'}, headers=auth_headers).json
+    drop = client.post('/api/notes', json={'title': 'Drop', 'content': 'Gone'}, headers=auth_headers).json
+    
+    response = client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': 'New 1', 'content': 'First'},
+        {'op': 'update', 'id': keep['id'], 'content': 'New'},
+        {'op': 'delete', 'id': drop['id']},
+        {'op': 'create', 'title': 'New 2'},
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['status'] for r in results] == [201, 200, 204, 201]
+    assert results[0]['note']['title'] == 'New 1'
+    assert results[1]['note']['content'] == 'New'
+    assert results[1]['note']['title'] == 'Keep'
+    assert results[3]['note']['content'] == ''
+    
+    titles = sorted(note['title'] for note in client.get('/api/notes', headers=auth_headers).json)
+    assert titles == ['Keep', 'New 1', 'New 2']
+
+def test_batch_reports_invalid_items(client, auth_headers):
+    """Test invalid items are reported per item without blocking the rest"""
+    response = client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': ''},
+        {'op': 'rename', 'id': 1},
+        {'op': 'update', 'id': 999, 'title': 'Missing'},
+        {'op': 'delete', 'id': 'abc'},
+        {'op': 'create', 'title': 'Valid'},
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['status'] for r in results] == [400, 400, 404, 400, 201]
+    assert 'title' in results[0]['details']
+    assert len(client.get('/api/notes', headers=auth_headers).json) == 1
+
+def test_batch_is_scoped_to_user(client, auth_headers):
+    """Test a batch cannot touch another user's notes"""
+    note_id = client.post('/api/notes', json={'title': 'Mine'}, headers=auth_headers).json['id']
+    
+    client.post('/api/auth/register', json={'email': 'test2@example.com', 'password': 'testpassword123'})
+    login_response = client.post('/api/auth/login', json={'email': 'test2@example.com', 'password': 'testpassword123'})
+    user2_headers = {'Authorization': f"Bearer {login_response.json['access_token']}"}
+    
+    for operation in ({'op': 'update', 'id': note_id, 'title': 'Hacked'}, {'op': 'delete', 'id': note_id}):
+        response = client.post('/api/notes/batch', json={'operations': [operation]}, headers=user2_headers)
+        assert [r['status'] for r in response.json['results']] == [404]
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).json['title'] == 'Mine'
+
+@pytest.mark.parametrize('operations', [
+    # Grouped writes would leave title B instead of C
+    [{'op': 'update', 'title': 'A'}, {'op': 'update', 'title': 'B', 'content': 'X'}, {'op': 'update', 'title': 'C'}],
+    # The update would report 200 for a note the delete removed
+    [{'op': 'delete'}, {'op': 'update', 'title': 'After'}],
+])
+def test_batch_rejects_repeated_ids(client, auth_headers, operations):
+    """Test a batch naming the same note twice is rejected before any write"""
+    note = client.post('/api/notes', json={'title': 'Original'}, headers=auth_headers).json
+    for operation in operations:
+        operation['id'] = note['id']
+    
+    response = client.post('/api/notes/batch', json={'operations': operations}, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json['details']['operations'] == [
+        f"Operation 1 references note {note['id']}, already used by operation 0."
+    ]
+    current = client.get(f"/api/notes/{note['id']}", headers=auth_headers).json
+    assert (current['title'], current['version']) == ('Original', 1)
+
+@pytest.mark.parametrize('payload', [
+    {},
+    {'operations': []},
+    {'operations': 'create'},
+])
+def test_batch_invalid_payload(client, auth_headers, payload):
+    """Test malformed batch payloads are rejected"""
+    response = client.post('/api/notes/batch', json=payload, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_batch_max_size(client, auth_headers, app):
+    """Test batches above the configured size are rejected"""
+    app.config['NOTES_BATCH_MAX_SIZE'] = 2
+    operations = [{'op': 'create', 'title': f'Note {i}'} for i in range(3)]
+    
+    response = client.post('/api/notes/batch', json={'operations': operations}, headers=auth_headers)
+    assert response.status_code == 400
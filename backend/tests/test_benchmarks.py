@@ -0,0 +1,31 @@
+from benchmarks import dataset
+from benchmarks.suite import compare
+
+def test_dataset_is_seeded_and_skewed():
+    """Test the generator is deterministic and concentrates notes on few users"""
+    first = dataset.generate(seed=7, users=20, notes=1000)
+    second = dataset.generate(seed=7, users=20, notes=1000)
+    assert first.users == second.users
+    assert dataset.generate(seed=8, users=20, notes=1000).users != first.users
+    
+    counts = sorted(first.user_weights(), reverse=True)
+    assert min(counts) >= 1
+    assert counts[0] > 10 * counts[-1]
+
+def test_dataset_load(app):
+    """Test a generated dataset loads with note ids recorded per user"""
+    data = dataset.generate(seed=1, users=3, notes=30)
+    dataset.load(data)
+    assert sum(len(ids) for ids in data.note_ids.values()) == data.note_count
+
+def test_compare_flags_regressions():
+    """Test latency, throughput, SQL count and error regressions are reported"""
+    def result(p95, rps, sql, errors=0):
+        return {'p95_ms': p95, 'requests_per_second': rps, 'sql_per_request': sql, 'errors': errors}
+    
+    baseline = {'results': {'list': result(10, 100, 2), 'get': result(5, 200, 2)}}
+    assert compare(baseline, {'results': {'list': result(11, 95, 2), 'get': result(5, 200, 2)}}, 0.2) == []
+    
+    regressions = compare(baseline, {'results': {'list': result(20, 50, 3, errors=1)}}, 0.2)
+    assert len(regressions) == 4
+    assert all(regression.startswith('list:') for regression in regressions)
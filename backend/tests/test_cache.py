@@ -0,0 +1,111 @@
+from datetime import datetime
+from sqlalchemy import update
+from cache import LRUCache, RedisCache, ResponseCache
+from db import db
+from models import User
+
+class FakeRedis:
+    """Local stand-in for a redis client: get and set with expiry"""
+    
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+def test_lru_evicts_by_bytes():
+    """Test least recently used entries go first once the byte budget is hit"""
+    lru = LRUCache(max_bytes=25)
+    lru.set('a', b'x' * 9)
+    lru.set('b', b'x' * 9)
+    assert lru.get('a') == b'x' * 9
+    lru.set('c', b'x' * 9)
+    
+    assert lru.get('b') is None
+    assert lru.get('a') is not None and lru.get('c') is not None
+    assert lru.stats() == {'entries': 2, 'bytes': 20, 'evictions_total': 1}
+    
+    # Anything bigger than the whole budget is simply not cached
+    lru.set('d', b'x' * 100)
+    assert lru.get('d') is None
+
+def test_note_reads_are_cached_until_a_write(app, client, auth_headers):
+    """Test list and note reads hit the cache and any write invalidates them"""
+    cache = app.extensions['response_cache']
+    note_id = client.post('/api/notes', json={'title': 'One'}, headers=auth_headers).json['id']
+    
+    first = client.get('/api/notes?limit=10', headers=auth_headers)
+    second = client.get('/api/notes?limit=10', headers=auth_headers)
+    assert second.json == first.json
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert cache.stats()['hits_total'] == 1
+    
+    # The streamed full listing is cached once it has been sent
+    assert client.get('/api/notes', headers=auth_headers).json[0]['title'] == 'One'
+    assert client.get('/api/notes', headers=auth_headers).json[0]['title'] == 'One'
+    assert cache.stats()['hits_total'] == 2
+    
+    note = client.get(f'/api/notes/{note_id}', headers=auth_headers)
+    cached = client.get(f'/api/notes/{note_id}', headers=auth_headers)
+    assert cached.json == note.json
+    assert cached.headers['ETag'] == note.headers['ETag']
+    response = client.get(f'/api/notes/{note_id}', headers={**auth_headers, 'If-None-Match': note.headers['ETag']})
+    assert response.status_code == 304
+    assert cache.stats()['hits_total'] == 4
+    
+    client.put(f'/api/notes/{note_id}', json={'title': 'Changed'}, headers=auth_headers)
+    assert client.get('/api/notes?limit=10', headers=auth_headers).json['notes'][0]['title'] == 'Changed'
+    assert client.get('/api/notes', headers=auth_headers).json[0]['title'] == 'Changed'
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).json['title'] == 'Changed'
+    assert cache.stats()['hits_total'] == 4
+    
+    metrics = client.get('/api/metrics').get_data(as_text=True)
+    assert 'cache_hits_total 4' in metrics
+
+def test_recreated_account_misses_the_cache(app, client, auth_headers):
+    """Test a new account holding an old id at the same version gets none of its cached reads"""
+    note_id = client.post('/api/notes', json={'title': 'Private'}, headers=auth_headers).json['id']
+    listing = client.get('/api/notes?limit=10', headers=auth_headers)
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).status_code == 200
+    
+    # What a database from before ids stopped being reused could end up with
+    user = User.query.filter_by(email='test@example.com').first()
+    db.session.execute(update(User).where(User.id == user.id).values(created_at=datetime.utcnow()))
+    db.session.commit()
+    db.session.expire_all()
+    
+    response = client.get('/api/notes?limit=10', headers={**auth_headers, 'If-None-Match': listing.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != listing.headers['ETag']
+    assert app.extensions['response_cache'].stats()['hits_total'] == 0
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).status_code == 200
+    assert app.extensions['response_cache'].stats()['hits_total'] == 0
+
+def test_shared_backend(app, client, auth_headers):
+    """Test the redis backend against a local stand-in"""
+    fake = FakeRedis()
+    app.extensions['response_cache'] = ResponseCache(RedisCache(fake, ttl=60), max_entry_bytes=1024)
+    note_id = client.post('/api/notes', json={'title': 'One'}, headers=auth_headers).json['id']
+    
+    first = client.get(f'/api/notes/{note_id}', headers=auth_headers)
+    assert len(fake.data) == 1
+    assert all(key.startswith('notes-cache:note:') for key in fake.data)
+    assert set(fake.expiry.values()) == {60}
+    
+    second = client.get(f'/api/notes/{note_id}', headers=auth_headers)
+    assert second.json == first.json
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Last-Modified'] == first.headers['Last-Modified']
+    
+    # Entries over the size limit are served but not stored
+    client.put(f'/api/notes/{note_id}', json={'content': 'x' * 2000}, headers=auth_headers)
+    assert len(client.get(f'/api/notes/{note_id}', headers=auth_headers).json['content']) == 2000
+    assert len(fake.data) == 1
+    assert app.extensions['response_cache'].stats() == {
+        'hits_total': 1, 'misses_total': 2, 'stores_total': 1, 'errors_total': 0
+    }
@@ -0,0 +1,118 @@
+import gzip
+import json
+import zlib
+import pytest
+
+def _create_notes(client, auth_headers, count=5, size=500):
+    client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': f'Note {i}', 'content': 'compressible text ' * size} for i in range(count)
+    ]}, headers=auth_headers)
+
+def test_gzip_response(client, auth_headers):
+    """Test large JSON responses are gzipped when the client accepts it"""
+    _create_notes(client, auth_headers)
+    plain = client.get('/api/notes?limit=10', headers=auth_headers)
+    assert 'Content-Encoding' not in plain.headers
+    
+    response = client.get('/api/notes?limit=10', headers={**auth_headers, 'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) < len(plain.data) / 10
+    assert json.loads(gzip.decompress(response.data)) == plain.json
+
+def test_deflate_negotiation(client, auth_headers):
+    """Test q-values are honoured when choosing an encoding"""
+    _create_notes(client, auth_headers, count=1)
+    response = client.get('/api/notes?limit=10', headers={**auth_headers, 'Accept-Encoding': 'gzip;q=0, deflate'})
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert json.loads(zlib.decompress(response.data))['notes'][0]['title'] == 'Note 0'
+
+def test_small_response_not_compressed(client, auth_headers, app):
+    """Test responses under the size threshold are sent as is"""
+    response = client.get('/api/auth/me', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert len(response.data) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+
+def test_streamed_response_compressed(client, auth_headers, app):
+    """Test streamed listings are compressed chunk by chunk"""
+    app.config['NOTES_STREAM_BATCH_SIZE'] = 2
+    _create_notes(client, auth_headers)
+    
+    response = client.get('/api/notes', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert len(json.loads(gzip.decompress(response.data))) == 5
+
+def test_compressed_etag_revalidates(client, auth_headers):
+    """Test the encoding-specific ETag still yields 304"""
+    _create_notes(client, auth_headers, count=1)
+    headers = {**auth_headers, 'Accept-Encoding': 'gzip'}
+    
+    etag = client.get('/api/notes', headers=headers).headers['ETag']
+    assert etag.endswith('-gzip"')
+    
+    response = client.get('/api/notes', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert 'Accept-Encoding' in response.headers['Vary']
+    
+    # Without compression the 304 carries the plain ETag, like the 200
+    plain = client.get('/api/notes', headers=auth_headers).headers['ETag']
+    response = client.get('/api/notes', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == plain
+
+def test_small_response_etag_matches_304(client, auth_headers, app):
+    """Test a body too small to compress still gets the ETag its 304 will carry"""
+    note_id = client.post('/api/notes', json={'title': 'Tiny'}, headers=auth_headers).json['id']
+    headers = {**auth_headers, 'Accept-Encoding': 'gzip'}
+    
+    response = client.get(f'/api/notes/{note_id}', headers=headers)
+    assert len(response.data) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+    
+    revalidated = client.get(f'/api/notes/{note_id}', headers={**headers, 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == response.headers['ETag']
+
+def test_gzip_request_body(client, auth_headers):
+    """Test write endpoints accept gzip-compressed bodies"""
+    body = gzip.compress(json.dumps({'title': 'Zipped', 'content': 'x' * 1000}).encode('utf-8'))
+    response = client.post('/api/notes', data=body, headers={
+        **auth_headers, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'
+    })
+    assert response.status_code == 201
+    assert response.json['content'] == 'x' * 1000
+    
+    lines = b''.join(json.dumps({'title': f'Line {i}'}).encode('utf-8') + b'\n' for i in range(100))
+    response = client.post('/api/notes/import', data=zlib.compress(lines), headers={
+        **auth_headers, 'Content-Encoding': 'deflate'
+    })
+    assert response.json['imported'] == 100
+
+def test_request_body_limits(client, auth_headers, app):
+    """Test unknown encodings and oversized decoded bodies are rejected"""
+    response = client.post('/api/notes', data=b'abc', headers={**auth_headers, 'Content-Encoding': 'lzma'})
+    assert response.status_code == 415
+    
+    app.wsgi_app.max_size = 1024
+    body = gzip.compress(json.dumps({'title': 'Bomb', 'content': '0' * 100000}).encode('utf-8'))
+    response = client.post('/api/notes', data=body, headers={
+        **auth_headers, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'
+    })
+    assert response.status_code == 413
+
+@pytest.mark.parametrize('body, encoding', [
+    (b'not gzip', 'gzip'),
+    (b'not deflate', 'deflate'),
+    # Valid start, cut off before the end of the stream
+    (gzip.compress(b'{"title": "Cut"}')[:-8], 'gzip'),
+])
+def test_malformed_request_body(client, auth_headers, body, encoding):
+    """Test corrupt or truncated compressed bodies are a 400, not a server error"""
+    response = client.post('/api/notes', data=body, headers={
+        **auth_headers, 'Content-Type': 'application/json', 'Content-Encoding': encoding
+    })
+    assert response.status_code == 400
+    assert client.get('/api/notes', headers=auth_headers).json == []
@@ -0,0 +1,63 @@
+import pytest
+from db import db, validate_sqlite_pragmas
+
+def test_sqlite_pragmas_applied(app):
+    """Test the configured pragma profile is set on pooled connections"""
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA foreign_keys').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['SQLITE_PRAGMAS']['busy_timeout']
+        assert conn.exec_driver_sql('PRAGMA temp_store').scalar() == 2
+
+def test_readers_not_blocked_during_writes(app):
+    """Test readers proceed while a write transaction is open and committing"""
+    writer_proxy = db.engine.raw_connection()
+    reader_proxy = db.engine.raw_connection()
+    other_proxy = db.engine.raw_connection()
+    writer = writer_proxy.driver_connection
+    reader = reader_proxy.driver_connection
+    other = other_proxy.driver_connection
+    try:
+        for conn in (writer, reader, other):
+            conn.isolation_level = None
+            # Fail fast instead of waiting if anything does block
+            conn.execute('PRAGMA busy_timeout=50')
+        
+        reader.execute('BEGIN')
+        assert reader.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+        
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("INSERT INTO users (email, password_hash) VALUES ('w@example.com', 'x')")
+        
+        # A fresh reader is not blocked by the uncommitted write
+        assert other.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+        
+        # The writer commits although a read transaction is still open
+        writer.execute('COMMIT')
+        assert other.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
+        
+        # The open reader keeps its consistent snapshot until it ends
+        assert reader.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+        reader.execute('COMMIT')
+        assert reader.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
+    finally:
+        for proxy in (writer_proxy, reader_proxy, other_proxy):
+            proxy.close()
+
+@pytest.mark.parametrize('pragmas', [
+    {'journal_mode': 'FAST'},
+    {'synchronous': 'SOMETIMES'},
+    {'busy_timeout': '5000'},
+    {'mmap_size': -1},
+    {'page_size': 4096},
+])
+def test_invalid_sqlite_pragmas(pragmas):
+    """Test bad pragma profiles are rejected at startup"""
+    with pytest.raises(ValueError):
+        validate_sqlite_pragmas(pragmas)
+
+def test_valid_sqlite_pragmas_normalized():
+    """Test pragma values are normalized"""
+    assert validate_sqlite_pragmas({'journal_mode': 'wal', 'foreign_keys': True}) == {
+        'journal_mode': 'WAL', 'foreign_keys': 'ON'
+    }
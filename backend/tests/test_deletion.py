@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, func, select, text, update
+from db import db
+from deletion import claim_abandoned_jobs, request_account_deletion, resume_deletions, run_deletion
+from models import AccountDeletion, Note, NoteTombstone, User
+
+def create_notes(client, auth_headers, count):
+    operations = [{'op': 'create', 'title': f'Note {n}', 'content': f'searchable {n}'} for n in range(count)]
+    response = client.post('/api/notes/batch', json={'operations': operations}, headers=auth_headers)
+    assert response.status_code == 200
+
+def test_delete_account(client, auth_headers, app):
+    """Test the account and all of its data are removed in the background"""
+    create_notes(client, auth_headers, 5)
+    note_id = client.get('/api/notes', headers=auth_headers).json[0]['id']
+    client.delete(f'/api/notes/{note_id}', headers=auth_headers)
+    
+    response = client.delete('/api/auth/me', headers=auth_headers)
+    assert response.status_code == 202
+    assert response.headers['Location'] == '/api/auth/me/deletion'
+    assert response.json['notes_total'] == 4
+    app.extensions['account_deletion'].join()
+    
+    status = client.get('/api/auth/me/deletion', headers=auth_headers).json
+    assert status['status'] == 'done'
+    assert status['notes_deleted'] == 4
+    assert status['finished_at'] is not None
+    
+    db.session.expire_all()
+    assert db.session.scalar(select(func.count()).select_from(User)) == 0
+    assert db.session.scalar(select(func.count()).select_from(Note)) == 0
+    assert db.session.scalar(select(func.count()).select_from(NoteTombstone)) == 0
+    assert db.session.execute(text("SELECT count(*) FROM notes_fts WHERE notes_fts MATCH 'searchable'")).scalar() == 0
+    
+    response = client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'testpassword123'})
+    assert response.status_code == 401
+
+def test_deleted_account_is_hidden_at_once(client, auth_headers, app):
+    """Test login and /me refuse the account before the job has run"""
+    user = User.query.filter_by(email='test@example.com').first()
+    job = request_account_deletion(user)
+    assert request_account_deletion(user).id == job.id
+    
+    assert client.get('/api/auth/me', headers=auth_headers).status_code == 404
+    response = client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'testpassword123'})
+    assert response.status_code == 401
+    assert client.get('/api/auth/me/deletion', headers=auth_headers).json['status'] == 'pending'
+
+def test_deleted_account_cannot_write(client, auth_headers, app):
+    """Test note writes are refused while deletion is pending and after it finished"""
+    create_notes(client, auth_headers, 1)
+    note_id = client.get('/api/notes', headers=auth_headers).json[0]['id']
+    
+    # The check rides on the version bump: an accepted write is still two statements
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert client.put(f'/api/notes/{note_id}', json={'title': 'Kept'}, headers=auth_headers).status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert [statement.split()[:2] for statement in statements] == [['UPDATE', 'users'], ['UPDATE', 'notes']]
+    
+    user = User.query.filter_by(email='test@example.com').first()
+    job = request_account_deletion(user)
+    
+    writes = [
+        lambda: client.post('/api/notes', json={'title': 'Late'}, headers=auth_headers),
+        lambda: client.put(f'/api/notes/{note_id}', json={'title': 'Late'}, headers=auth_headers),
+        lambda: client.post('/api/notes/batch', json={'operations': [{'op': 'create', 'title': 'Late'}]},
+                            headers=auth_headers),
+    ]
+    assert [write().status_code for write in writes] == [404, 404, 404]
+    assert client.get('/api/notes', headers=auth_headers).status_code == 200
+    
+    run_deletion(job.id, chunk_size=100)
+    assert [write().status_code for write in writes] == [404, 404, 404]
+    assert db.session.scalar(select(func.count()).select_from(Note)) == 0
+
+def test_deletion_is_chunked_and_resumable(client, auth_headers, app):
+    """Test each chunk commits its progress and an interrupted job resumes"""
+    create_notes(client, auth_headers, 7)
+    user = User.query.filter_by(email='test@example.com').first()
+    user_id = user.id
+    job = request_account_deletion(user)
+    
+    statements = []
+    
+    def count_deletes(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('DELETE FROM notes '):
+            statements.append(statement)
+            if len(statements) == 2:
+                raise RuntimeError('interrupted')
+    
+    event.listen(db.engine, 'before_cursor_execute', count_deletes)
+    try:
+        run_deletion(job.id, chunk_size=3)
+    except Exception:
+        pass
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_deletes)
+    
+    db.session.expire_all()
+    job = db.session.get(AccountDeletion, job.id)
+    assert job.status == 'failed'
+    assert 'interrupted' in job.error
+    assert job.notes_deleted == 3
+    assert db.session.scalar(select(func.count()).where(Note.user_id == user_id)) == 4
+    
+    assert resume_deletions(chunk_size=3) == 1
+    db.session.expire_all()
+    job = db.session.get(AccountDeletion, job.id)
+    assert job.status == 'done'
+    assert job.notes_deleted == 7
+    assert job.error is None
+    assert db.session.get(User, user_id) is None
+    assert resume_deletions(chunk_size=3) == 0
+
+def test_deletion_status_without_request(client, auth_headers):
+    """Test status is 404 when no deletion was requested"""
+    assert client.get('/api/auth/me/deletion', headers=auth_headers).status_code == 404
+
+def test_abandoned_jobs_are_claimed_once(client, auth_headers):
+    """Test jobs left idle by a restart are claimed by one caller, busy ones by none"""
+    user = User.query.filter_by(email='test@example.com').first()
+    job_id = request_account_deletion(user).id
+    assert claim_abandoned_jobs(300) == []
+    
+    db.session.execute(update(AccountDeletion).values(
+        status='running', updated_at=datetime.utcnow() - timedelta(minutes=10)
+    ))
+    db.session.commit()
+    assert claim_abandoned_jobs(300) == [job_id]
+    assert claim_abandoned_jobs(300) == []
+    
+    run_deletion(job_id, chunk_size=100)
+    assert db.session.get(AccountDeletion, job_id).status == 'done'
+
+def test_deleted_id_is_not_reused(client, auth_headers, app):
+    """Test a new account never gets a deleted account's id or its tokens' access"""
+    create_notes(client, auth_headers, 1)
+    old_id = User.query.filter_by(email='test@example.com').first().id
+    assert client.delete('/api/auth/me', headers=auth_headers).status_code == 202
+    app.extensions['account_deletion'].join()
+    
+    credentials = {'email': 'next@example.com', 'password': 'testpassword123'}
+    assert client.post('/api/auth/register', json=credentials).status_code == 201
+    token = client.post('/api/auth/login', json=credentials).json['access_token']
+    new_headers = {'Authorization': f'Bearer {token}'}
+    client.post('/api/notes', json={'title': 'Mine'}, headers=new_headers)
+    assert User.query.filter_by(email='next@example.com').first().id > old_id
+    
+    assert client.get('/api/auth/me', headers=auth_headers).status_code == 404
+    assert client.post('/api/notes', json={'title': 'Stale'}, headers=auth_headers).status_code == 404
+    assert client.get('/api/notes', headers=auth_headers).json == []
+    assert [note['title'] for note in client.get('/api/notes', headers=new_headers).json] == ['Mine']
+
+def test_token_older_than_account_is_refused(client, auth_headers):
+    """Test a token issued before the account it names existed is not accepted"""
+    user = User.query.filter_by(email='test@example.com').first()
+    issued = int((user.created_at - timedelta(hours=1) - datetime(1970, 1, 1)).total_seconds())
+    stale = {'Authorization': f"Bearer {create_access_token(str(user.id), additional_claims={'iat': issued, 'nbf': issued})}"}
+    
+    assert client.get('/api/auth/me', headers=stale).status_code == 404
+    assert client.post('/api/notes', json={'title': 'Stale'}, headers=stale).status_code == 404
+    assert client.post('/api/notes', json={'title': 'Fresh'}, headers=auth_headers).status_code == 201
@@ -0,0 +1,93 @@
+import io
+import json
+import tracemalloc
+import zipfile
+from sqlalchemy import insert
+from db import db
+from models import Note, User
+
+def _seed_notes(count, content_size=2000):
+    """Insert ``count`` notes for the test user straight into the database"""
+    user_id = User.query.filter_by(email='test@example.com').one().id
+    db.session.execute(insert(Note), [
+        {'title': f'Note {i}', 'content': 'x' * content_size, 'user_id': user_id}
+        for i in range(count)
+    ])
+    db.session.commit()
+    db.session.expunge_all()
+
+def test_export_ndjson(client, auth_headers):
+    """Test NDJSON export has one note per line matching the API"""
+    created = client.post('/api/notes', json={'title': 'One', 'content': 'First'}, headers=auth_headers).json
+    client.post('/api/notes', json={'title': 'Two', 'content': None}, headers=auth_headers)
+    
+    response = client.get('/api/notes/export?format=ndjson', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'attachment' in response.headers['Content-Disposition']
+    
+    lines = response.data.decode('utf-8').splitlines()
+    assert [json.loads(line)['title'] for line in lines] == ['One', 'Two']
+    assert json.loads(lines[0]) == created
+
+def test_export_zip(client, auth_headers):
+    """Test ZIP export holds one Markdown file per note"""
+    client.post('/api/notes', json={'title': 'Shopping / List', 'content': 'Milk'}, headers=auth_headers)
+    client.post('/api/notes', json={'title': '???', 'content': 'Eggs'}, headers=auth_headers)
+    
+    response = client.get('/api/notes/export?format=zip', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        assert names[0].endswith('-Shopping-List.md')
+        assert names[1].endswith('-note.md')
+        assert archive.read(names[0]).decode('utf-8') == '# Shopping / List\n\nMilk\n'
+
+def test_export_invalid_format(client, auth_headers):
+    """Test unknown export formats are rejected"""
+    response = client.get('/api/notes/export?format=csv', headers=auth_headers)
+    assert response.status_code == 400
+
+def _export_peak_memory(client, auth_headers, export_format='ndjson'):
+    """Consume an export chunk by chunk and return its line count and peak allocation"""
+    tracemalloc.start()
+    try:
+        response = client.get(f'/api/notes/export?format={export_format}', headers=auth_headers, buffered=False)
+        lines = 0
+        for chunk in response.iter_encoded():
+            lines += chunk.count(b'\n')
+        response.close()
+        return lines, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_export_memory_is_flat(client, auth_headers, app):
+    """Test export peak memory does not grow with the number of notes"""
+    app.config['NOTES_STREAM_BATCH_SIZE'] = 50
+    
+    _seed_notes(200)
+    lines, small_peak = _export_peak_memory(client, auth_headers)
+    assert lines == 200
+    
+    _seed_notes(1800)
+    lines, large_peak = _export_peak_memory(client, auth_headers)
+    assert lines == 2000
+    
+    # Ten times the notes (about 4 MB of content) must not cost ten times the memory
+    assert large_peak < small_peak * 2
+
+def test_zip_export_memory_excludes_content(client, auth_headers, app):
+    """Test ZIP export only keeps the central directory, not the notes, in memory"""
+    app.config['NOTES_STREAM_BATCH_SIZE'] = 50
+    
+    _seed_notes(100, content_size=10000)
+    _, small_peak = _export_peak_memory(client, auth_headers, 'zip')
+    _seed_notes(900, content_size=10000)
+    _, large_peak = _export_peak_memory(client, auth_headers, 'zip')
+    
+    # About 1 KB of central directory entry per note; 10 KB of content each is not retained
+    assert (large_peak - small_peak) / 900 < 2048
@@ -0,0 +1,141 @@
+import io
+import json
+import struct
+import zipfile
+
+def _ndjson(*records):
+    return b''.join(
+        (record if isinstance(record, bytes) else json.dumps(record).encode('utf-8')) + b'\n'
+        for record in records
+    )
+
+def test_import_ndjson(client, auth_headers, app):
+    """Test NDJSON import inserts valid lines and reports rejected ones"""
+    app.config['NOTES_IMPORT_BATCH_SIZE'] = 2
+    body = _ndjson(
+        {'title': 'One', 'content': 'First'},
+        {'title': 'Two'},
+        b'{not json',
+        {'content': 'No title'},
+        b'',
+        {'title': 'Three', 'content': None},
+        [1, 2],
+    )
+    
+    response = client.post('/api/notes/import', data=body,
+        content_type='application/x-ndjson', headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json
+    assert data['imported'] == 3
+    assert data['rejected_count'] == 3
+    assert [r['line'] for r in data['rejected']] == [3, 4, 7]
+    assert 'title' in data['rejected'][1]['errors']
+    
+    notes = client.get('/api/notes', headers=auth_headers).json
+    assert sorted(note['title'] for note in notes) == ['One', 'Three', 'Two']
+
+def test_import_ndjson_line_too_long(client, auth_headers, app):
+    """Test oversized lines are skipped without stopping the import"""
+    app.config['NOTES_IMPORT_MAX_RECORD_BYTES'] = 100
+    body = _ndjson({'title': 'Big', 'content': 'x' * 500}, {'title': 'Small'})
+    
+    response = client.post('/api/notes/import', data=body, headers=auth_headers)
+    assert response.json['imported'] == 1
+    assert response.json['rejected'] == [{'line': 1, 'errors': {'_schema': ['Line too long.']}}]
+
+def test_import_ndjson_round_trip(client, auth_headers):
+    """Test an NDJSON export can be imported back, while unknown keys are still rejected"""
+    client.post('/api/notes', json={'title': 'Recipe', 'content': 'Line 1\n\nLine 2'}, headers=auth_headers)
+    client.post('/api/notes', json={'title': 'Empty', 'content': ''}, headers=auth_headers)
+    export = client.get('/api/notes/export', headers=auth_headers).data
+    
+    response = client.post('/api/notes/import', data=export + _ndjson({'title': 'Typo', 'conten': 'x'}),
+        content_type='application/x-ndjson', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['imported'] == 2
+    assert response.json['rejected'] == [{'line': 3, 'errors': {'conten': ['Unknown field.']}}]
+    
+    notes = client.get('/api/notes', headers=auth_headers).json
+    pairs = sorted((note['title'], note['content']) for note in notes)
+    assert pairs == [('Empty', ''), ('Empty', ''), ('Recipe', 'Line 1\n\nLine 2'), ('Recipe', 'Line 1\n\nLine 2')]
+
+def test_import_zip_round_trip(client, auth_headers):
+    """Test a ZIP export can be imported back"""
+    client.post('/api/notes', json={'title': 'Recipe', 'content': 'Line 1\n\nLine 2'}, headers=auth_headers)
+    client.post('/api/notes', json={'title': 'Empty', 'content': ''}, headers=auth_headers)
+    archive = client.get('/api/notes/export?format=zip', headers=auth_headers).data
+    
+    response = client.post('/api/notes/import', data=archive,
+        content_type='application/zip', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['imported'] == 2
+    
+    notes = client.get('/api/notes', headers=auth_headers).json
+    pairs = sorted((note['title'], note['content']) for note in notes)
+    assert pairs == [('Empty', ''), ('Empty', ''), ('Recipe', 'Line 1\n\nLine 2'), ('Recipe', 'Line 1\n\nLine 2')]
+
+def test_import_zip_plain_markdown(client, auth_headers):
+    """Test Markdown files without a heading take their title from the file name"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('folder/ideas.md', 'Just a body\n')
+        archive.writestr('image.png', b'\x89PNG')
+    
+    response = client.post('/api/notes/import?format=zip', data=buffer.getvalue(), headers=auth_headers)
+    assert response.json['imported'] == 1
+    note = client.get('/api/notes', headers=auth_headers).json[0]
+    assert (note['title'], note['content']) == ('ideas', 'Just a body')
+
+def test_import_invalid_zip(client, auth_headers):
+    """Test a corrupt archive is reported instead of crashing"""
+    response = client.post('/api/notes/import?format=zip', data=b'not a zip', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['imported'] == 0
+    assert response.json['rejected_count'] == 1
+
+def _patch_central_entry(data, name, flags=None, method=None):
+    """Rewrite the general purpose flags or compression method recorded for ``name``"""
+    data = bytearray(data)
+    offset = data.find(b'PK\x01\x02')
+    while offset != -1:
+        name_length = struct.unpack_from('<H', data, offset + 28)[0]
+        if data[offset + 46:offset + 46 + name_length] == name.encode('utf-8'):
+            if flags is not None:
+                struct.pack_into('<H', data, offset + 8, flags)
+            if method is not None:
+                struct.pack_into('<H', data, offset + 10, method)
+        offset = data.find(b'PK\x01\x02', offset + 1)
+    return bytes(data)
+
+def test_import_zip_unreadable_members(client, auth_headers):
+    """Test corrupt, encrypted and oddly compressed members are rejected one by one"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('good.md', '# Good\n\nkept')
+        archive.writestr('crc.md', 'checksum' * 4)
+        archive.writestr('deflate.md', 'squeezed ' * 200, compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr('locked.md', 'secret')
+        archive.writestr('method.md', 'odd')
+    data = buffer.getvalue()
+    data = data.replace(b'checksum' * 4, b'CHECKSUM' * 4)
+    deflated = zipfile.ZipFile(io.BytesIO(data)).getinfo('deflate.md')
+    start = deflated.header_offset + 30 + len('deflate.md')
+    data = data[:start] + b'\xff' * 8 + data[start + 8:]
+    data = _patch_central_entry(data, 'locked.md', flags=0x1)
+    data = _patch_central_entry(data, 'method.md', method=99)
+    
+    response = client.post('/api/notes/import?format=zip', data=data, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['imported'] == 1
+    assert {entry['file']: entry['errors']['_schema'][0] for entry in response.json['rejected']} == {
+        'crc.md': 'File is corrupt.',
+        'deflate.md': 'File is corrupt.',
+        'locked.md': 'File is encrypted.',
+        'method.md': 'Unsupported compression method.'
+    }
+    assert [note['title'] for note in client.get('/api/notes', headers=auth_headers).json] == ['Good']
+
+def test_import_invalid_format(client, auth_headers):
+    """Test unknown import formats are rejected"""
+    response = client.post('/api/notes/import?format=csv', data=b'a,b', headers=auth_headers)
+    assert response.status_code == 400
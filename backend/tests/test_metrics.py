@@ -0,0 +1,63 @@
+import logging
+
+def metric_lines(client):
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    return response.get_data(as_text=True).splitlines()
+
+def test_metrics_count_requests_and_sql(client, auth_headers):
+    """Test per-endpoint status counts, latency and SQL histograms are exported"""
+    client.post('/api/notes', json={'title': 'One'}, headers=auth_headers)
+    assert client.get('/api/notes', headers=auth_headers).json[0]['title'] == 'One'
+    client.get('/api/notes/999', headers=auth_headers)
+    
+    lines = metric_lines(client)
+    assert 'http_requests_total{method="GET",endpoint="notes.get_notes",status="200"} 1' in lines
+    assert 'http_requests_total{method="GET",endpoint="notes.get_note",status="404"} 1' in lines
+    assert 'http_requests_total{method="POST",endpoint="notes.create_note",status="201"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",endpoint="notes.get_notes"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",endpoint="notes.get_notes",le="+Inf"} 1' in lines
+    # The streamed listing's statements are counted after the body is sent
+    sql_sum = next(line for line in lines
+                   if line.startswith('http_request_sql_statements_sum{method="GET",endpoint="notes.get_notes"}'))
+    assert float(sql_sum.split()[-1]) >= 2
+    # Only the metrics request itself is in flight
+    assert 'http_requests_in_flight 1' in lines
+    assert any(line.startswith('db_statement_duration_seconds_count ') for line in lines)
+    assert any(line.startswith('password_hash_in_flight ') for line in lines)
+
+def test_slow_request_and_query_log(app, client, auth_headers, caplog):
+    """Test requests and statements over the thresholds are logged and counted"""
+    state = app.extensions['metrics']
+    state.slow_request_seconds = 0
+    state.slow_query_seconds = 0
+    
+    with caplog.at_level(logging.WARNING):
+        client.get('/api/notes?limit=5', headers=auth_headers)
+        client.get('/api/notes/search?q=secret', headers=auth_headers)
+    
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('Slow request: GET /api/notes 200') for message in messages)
+    assert any(message.startswith('Slow request: GET /api/notes/search 200') for message in messages)
+    # Query strings carry user input and are never logged
+    assert not any('secret' in message or 'limit=5' in message for message in messages)
+    assert any(message.startswith('Slow query:') and 'FROM notes' in message for message in messages)
+    
+    lines = metric_lines(client)
+    assert 'http_slow_requests_total 0' not in lines
+    assert 'db_slow_statements_total 0' not in lines
+
+def test_metrics_access(app, client):
+    """Test scrapes need the token when one is set and a loopback client otherwise"""
+    remote = {'REMOTE_ADDR': '10.0.0.7'}
+    assert client.get('/api/metrics', environ_overrides=remote).status_code == 403
+    
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    assert client.get('/api/metrics').status_code == 401
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 401
+    assert response.json == {'error': 'Unauthorized'}
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-token'},
+                          environ_overrides=remote)
+    assert response.status_code == 200
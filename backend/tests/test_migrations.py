@@ -0,0 +1,105 @@
+import sqlite3
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app
+from db import db, init_db
+from migrations import upgrade_schema
+
+# Schema written by the first release, before any column was added
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    email VARCHAR(120) NOT NULL,
+    password_hash VARCHAR(128) NOT NULL,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE TABLE notes (
+    id INTEGER NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    content TEXT,
+    user_id INTEGER NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+"""
+
+def make_baseline(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.execute(
+        "INSERT INTO users (email, password_hash, created_at) VALUES (?, ?, '2024-01-01 00:00:00')",
+        ('old@example.com', generate_password_hash('testpassword123', 'pbkdf2:sha256:1000'))
+    )
+    connection.executemany(
+        "INSERT INTO notes (title, content, user_id, created_at, updated_at) "
+        "VALUES (?, ?, 1, '2024-01-02 00:00:00', '2024-01-02 00:00:00')",
+        [('Groceries', 'eggs and milk'), ('Plans', 'climb a hill')]
+    )
+    connection.commit()
+    connection.close()
+
+@pytest.fixture
+def upgraded(tmp_path):
+    """An app whose database was created by the first release"""
+    path = tmp_path / 'old.db'
+    make_baseline(path)
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret-key',
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATE_LIMIT_ENABLED': False,
+        'ATTACHMENTS_DIR': str(tmp_path / 'attachments')
+    })
+    init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def test_baseline_database_is_upgraded(upgraded):
+    """Test an old database gets the new columns, counters and search index"""
+    client = upgraded.test_client()
+    response = client.post('/api/auth/login', json={'email': 'old@example.com', 'password': 'testpassword123'})
+    assert response.status_code == 200
+    headers = {'Authorization': f"Bearer {response.json['access_token']}"}
+    
+    notes = client.get('/api/notes', headers=headers).json
+    assert sorted(note['title'] for note in notes) == ['Groceries', 'Plans']
+    assert all(note['version'] == 1 for note in notes)
+    stats = client.get('/api/notes/stats', headers=headers).json
+    assert stats['note_count'] == 2
+    assert stats['content_bytes'] == len('eggs and milk') + len('climb a hill')
+    assert client.get('/api/notes/search?q=milk', headers=headers).json['results'][0]['title'] == 'Groceries'
+    
+    created = client.post('/api/notes', json={'title': 'New', 'content': 'after the upgrade'}, headers=headers)
+    assert created.status_code == 201
+    assert client.get('/api/notes/search?q=upgrade', headers=headers).json['results'][0]['id'] == created.json['id']
+    assert client.get('/api/notes/stats', headers=headers).json['note_count'] == 3
+
+def test_upgrade_is_idempotent(upgraded):
+    """Test running the upgrade again adds nothing and keeps the data"""
+    assert upgrade_schema(db.engine) == []
+    init_db(upgraded)
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT count(*) FROM notes_fts').scalar() == 2
+        assert connection.exec_driver_sql('SELECT note_count FROM users').scalar() == 2
+
+def test_user_ids_are_not_reused_after_upgrade(upgraded):
+    """Test the rebuilt users table hands out ids past any deleted account's"""
+    with db.engine.begin() as connection:
+        schema = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'users'").scalar()
+        assert 'AUTOINCREMENT' in schema
+        connection.exec_driver_sql("DELETE FROM notes")
+        connection.exec_driver_sql("DELETE FROM users")
+    
+    client = upgraded.test_client()
+    assert client.post('/api/auth/register', json={'email': 'new@example.com', 'password': 'testpassword123'}).status_code == 201
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT id FROM users').scalar() == 2
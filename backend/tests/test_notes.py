@@ -164,3 +164,237 @@ def test_user_isolation(client, auth_headers):
     # Try to delete first user's note
     response = client.delete(f'/api/notes/{note_id}', headers=user2_headers)
     assert response.status_code == 404
+
+def test_get_notes_paginated(client, auth_headers):
+    """Test keyset pagination over the notes list"""
+    for i in range(5):
+        client.post('/api/notes',
+            json={'title': f'Note {i}', 'content': f'Content {i}'},
+            headers=auth_headers
+        )
+    
+    titles = []
+    cursor = None
+    pages = 0
+    while True:
+        query = {'limit': 2}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/notes', query_string=query, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json
+        assert len(data['notes']) <= 2
+        titles.extend(note['title'] for note in data['notes'])
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    
+    assert pages == 3
+    assert titles == ['Note 4', 'Note 3', 'Note 2', 'Note 1', 'Note 0']
+
+def test_get_notes_paginated_invalid_params(client, auth_headers):
+    """Test pagination with a bad limit or cursor"""
+    response = client.get('/api/notes?limit=0', headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.get('/api/notes?limit=abc', headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.get('/api/notes?cursor=not-a-cursor', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_get_notes_summary_view(client, auth_headers, app):
+    """Test the summary listing returns a bounded snippet instead of content"""
+    app.config['NOTES_SNIPPET_LENGTH'] = 10
+    client.post('/api/notes',
+        json={'title': 'Long Note', 'content': 'abcdefghij' * 50},
+        headers=auth_headers
+    )
+    
+    response = client.get('/api/notes?view=summary', headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json
+    assert len(data) == 1
+    assert data[0]['title'] == 'Long Note'
+    assert data[0]['snippet'] == 'abcdefghij'
+    assert 'content' not in data[0]
+    
+    response = client.get('/api/notes?fields=summary&limit=5', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['notes'][0]['snippet'] == 'abcdefghij'
+    
+    response = client.get('/api/notes?view=bogus', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_search_notes(client, auth_headers):
+    """Test full-text search ranks, highlights and follows edits and deletes"""
+    first = client.post('/api/notes',
+        json={'title': 'Grocery list', 'content': 'Buy apples and bread'},
+        headers=auth_headers
+    ).json
+    client.post('/api/notes',
+        json={'title': 'Apples', 'content': 'Varieties of apples worth trying'},
+        headers=auth_headers
+    )
+    client.post('/api/notes',
+        json={'title': 'Unrelated', 'content': 'Nothing to see here'},
+        headers=auth_headers
+    )
+    
+    response = client.get('/api/notes/search?q=apples', headers=auth_headers)
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['title'] for r in results] == ['Apples', 'Grocery list']
+    assert '<mark>' in results[0]['highlight']
+    assert '<mark>' not in results[0]['snippet']
+    assert 'content' not in results[0]
+    
+    response = client.get('/api/notes/search?q=apples&limit=1', headers=auth_headers)
+    assert len(response.json['results']) == 1
+    assert response.json['next_offset'] == 1
+    
+    client.put(f"/api/notes/{first['id']}", json={'content': 'Buy pears'}, headers=auth_headers)
+    response = client.get('/api/notes/search?q=pears', headers=auth_headers)
+    assert [r['id'] for r in response.json['results']] == [first['id']]
+    
+    client.delete(f"/api/notes/{first['id']}", headers=auth_headers)
+    response = client.get('/api/notes/search?q=pears', headers=auth_headers)
+    assert response.json['results'] == []
+
+def test_search_snippet_is_escaped(client, auth_headers):
+    """Test the highlight is HTML-escaped with only matches marked, the snippet plain text"""
+    content = 'Try <img src=x onerror="alert(1)"> and findme & more'
+    client.post('/api/notes', json={'title': 'Markup', 'content': content}, headers=auth_headers)
+    
+    result = client.get('/api/notes/search?q=findme', headers=auth_headers).json['results'][0]
+    assert '<img' not in result['highlight']
+    assert '&lt;img src=x onerror=&quot;alert(1)&quot;&gt;' in result['highlight']
+    assert '<mark>findme</mark> &amp; more' in result['highlight']
+    # The same format as the summary listing's snippet
+    assert result['snippet'] == content
+    summary = client.get('/api/notes?view=summary', headers=auth_headers).json[0]
+    assert summary['snippet'] == content
+
+def test_search_notes_scoped_to_user(client, auth_headers):
+    """Test search never returns another user's notes"""
+    client.post('/api/notes',
+        json={'title': 'Secret', 'content': 'classified plans'},
+        headers=auth_headers
+    )
+    
+    client.post('/api/auth/register', json={
+        'email': 'test2@example.com',
+        'password': 'testpassword123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test2@example.com',
+        'password': 'testpassword123'
+    })
+    user2_headers = {'Authorization': f"Bearer {login_response.json['access_token']}"}
+    
+    response = client.get('/api/notes/search?q=classified', headers=user2_headers)
+    assert response.status_code == 200
+    assert response.json['results'] == []
+
+def test_search_notes_invalid_query(client, auth_headers):
+    """Test search validation and FTS syntax characters in the query"""
+    response = client.get('/api/notes/search?q=', headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.get('/api/notes/search', query_string={'q': 'foo" OR (bar*'}, headers=auth_headers)
+    assert response.status_code == 200
+
+def test_get_notes_conditional(client, auth_headers):
+    """Test ETag revalidation of the notes list"""
+    client.post('/api/notes',
+        json={'title': 'Note', 'content': 'Content'},
+        headers=auth_headers
+    )
+    
+    response = client.get('/api/notes', headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    
+    response = client.get('/api/notes', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    
+    # Different query parameters produce a different representation
+    response = client.get('/api/notes?view=summary', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json[0]['snippet'] == 'Content'
+    
+    # Any write invalidates the list ETag
+    client.post('/api/notes',
+        json={'title': 'Another', 'content': 'Content'},
+        headers=auth_headers
+    )
+    response = client.get('/api/notes', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json) == 2
+
+def test_get_note_conditional(client, auth_headers):
+    """Test ETag and If-Modified-Since revalidation of a single note"""
+    note_id = client.post('/api/notes',
+        json={'title': 'Note', 'content': 'Content'},
+        headers=auth_headers
+    ).json['id']
+    
+    response = client.get(f'/api/notes/{note_id}', headers=auth_headers)
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    
+    response = client.get(f'/api/notes/{note_id}', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    
+    response = client.get(f'/api/notes/{note_id}', headers={**auth_headers, 'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    
+    client.put(f'/api/notes/{note_id}', json={'title': 'Changed'}, headers=auth_headers)
+    response = client.get(f'/api/notes/{note_id}', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['title'] == 'Changed'
+    assert response.headers['ETag'] != etag
+
+def test_update_note_if_match(client, auth_headers):
+    """Test If-Match guards updates and a stale ETag gets 412"""
+    note_id = client.post('/api/notes', json={'title': 'Note'}, headers=auth_headers).json['id']
+    etag = client.get(f'/api/notes/{note_id}', headers=auth_headers).headers['ETag']
+    
+    response = client.put(f'/api/notes/{note_id}', json={'title': 'Tab one'},
+                          headers={**auth_headers, 'If-Match': etag})
+    assert response.status_code == 200
+    assert response.json['version'] == 2
+    assert response.headers['ETag'] != etag
+    
+    # A second tab still holding the old ETag must not overwrite the edit
+    response = client.put(f'/api/notes/{note_id}', json={'title': 'Tab two'},
+                          headers={**auth_headers, 'If-Match': etag})
+    assert response.status_code == 412
+    assert response.json['version'] == 2
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).json['title'] == 'Tab one'
+    
+    response = client.put(f'/api/notes/{note_id}', json={'title': 'Any'},
+                          headers={**auth_headers, 'If-Match': '*'})
+    assert response.status_code == 200
+    
+    response = client.put('/api/notes/999', json={'title': 'Missing'},
+                          headers={**auth_headers, 'If-Match': etag})
+    assert response.status_code == 404
+
+def test_delete_note_if_match(client, auth_headers):
+    """Test If-Match guards deletes"""
+    note_id = client.post('/api/notes', json={'title': 'Note'}, headers=auth_headers).json['id']
+    etag = client.get(f'/api/notes/{note_id}', headers=auth_headers).headers['ETag']
+    client.put(f'/api/notes/{note_id}', json={'content': 'Edited'}, headers=auth_headers)
+    
+    response = client.delete(f'/api/notes/{note_id}', headers={**auth_headers, 'If-Match': etag})
+    assert response.status_code == 412
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).status_code == 200
+    
+    etag = client.get(f'/api/notes/{note_id}', headers=auth_headers).headers['ETag']
+    response = client.delete(f'/api/notes/{note_id}', headers={**auth_headers, 'If-Match': etag})
+    assert response.status_code == 204
+    assert client.get(f'/api/notes/{note_id}', headers=auth_headers).status_code == 404
@@ -0,0 +1,93 @@
+import pytest
+from patching import PatchError, apply_patches
+
+def test_apply_patches():
+    """Test splices are applied against base-text offsets in any order"""
+    base = 'Hello world, hello notes'
+    patches = [
+        {'start': 19, 'end': 24, 'text': 'edits'},
+        {'start': 0, 'end': 5, 'text': 'Goodbye'},
+        {'start': 11, 'end': 11, 'text': '!'},
+    ]
+    assert apply_patches(base, patches) == 'Goodbye world!, hello edits'
+    assert apply_patches(base, []) == base
+
+def test_apply_patches_counts_utf16_units():
+    """Test offsets after an astral character count it as two units, like JavaScript"""
+    base = 'Trip \U0001F3D4\ufe0f plan: day one'
+    # 'Trip ' + mountain (2 units) + variation selector (1) + ' plan: ' puts 'day' at 15
+    assert apply_patches(base, [{'start': 15, 'end': 18, 'text': 'night'}]) == 'Trip \U0001F3D4\ufe0f plan: night one'
+    assert apply_patches(base, [{'start': 5, 'end': 7, 'text': '\U0001F30A'}]) == 'Trip \U0001F30A\ufe0f plan: day one'
+    with pytest.raises(PatchError):
+        apply_patches(base, [{'start': 6, 'end': 7, 'text': ''}])
+
+@pytest.mark.parametrize('patches', [
+    [{'start': 5, 'end': 3, 'text': ''}],
+    [{'start': 0, 'end': 5, 'text': ''}, {'start': 3, 'end': 6, 'text': ''}],
+    [{'start': 0, 'end': 100, 'text': ''}],
+])
+def test_apply_patches_invalid(patches):
+    """Test inverted, overlapping and out-of-range patches are rejected"""
+    with pytest.raises(PatchError):
+        apply_patches('Hello world', patches)
+
+def test_patch_note(client, auth_headers):
+    """Test PATCH applies edits and returns only the new version"""
+    note = client.post('/api/notes', json={'title': 'Draft', 'content': 'The quick fox'}, headers=auth_headers).json
+    assert note['version'] == 1
+    
+    response = client.patch(f"/api/notes/{note['id']}", json={
+        'base_version': 1,
+        'patches': [{'start': 10, 'end': 10, 'text': 'brown '}],
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['version'] == 2
+    assert 'content' not in response.json
+    
+    response = client.patch(f"/api/notes/{note['id']}", json={
+        'base_version': 2,
+        'title': 'Final',
+        'patches': [{'start': 0, 'end': 3, 'text': 'A'}],
+    }, headers=auth_headers)
+    assert response.json['version'] == 3
+    
+    current = client.get(f"/api/notes/{note['id']}", headers=auth_headers).json
+    assert current['content'] == 'A quick brown fox'
+    assert current['title'] == 'Final'
+    assert current['version'] == 3
+
+def test_patch_note_stale_base(client, auth_headers):
+    """Test a patch against an outdated version is rejected with 409"""
+    note = client.post('/api/notes', json={'title': 'Draft', 'content': 'abc'}, headers=auth_headers).json
+    client.put(f"/api/notes/{note['id']}", json={'content': 'changed elsewhere'}, headers=auth_headers)
+    
+    response = client.patch(f"/api/notes/{note['id']}", json={
+        'base_version': 1,
+        'patches': [{'start': 0, 'end': 1, 'text': 'X'}],
+    }, headers=auth_headers)
+    assert response.status_code == 409
+    assert response.json['version'] == 2
+    assert client.get(f"/api/notes/{note['id']}", headers=auth_headers).json['content'] == 'changed elsewhere'
+
+def test_patch_note_invalid(client, auth_headers):
+    """Test malformed patch requests"""
+    note_id = client.post('/api/notes', json={'title': 'Draft', 'content': 'abc'}, headers=auth_headers).json['id']
+    
+    response = client.patch(f'/api/notes/{note_id}', json={'patches': []}, headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.patch(f'/api/notes/{note_id}', json={
+        'base_version': 1, 'patches': [{'start': 0, 'end': 10, 'text': 'X'}]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.patch('/api/notes/999', json={'base_version': 1}, headers=auth_headers)
+    assert response.status_code == 404
+
+def test_batch_update_bumps_version(client, auth_headers):
+    """Test batch updates increment the note version"""
+    note_id = client.post('/api/notes', json={'title': 'Draft'}, headers=auth_headers).json['id']
+    for operation in ({'op': 'update', 'id': note_id, 'title': 'One'}, {'op': 'update', 'id': note_id, 'content': 'Two'}):
+        results = client.post('/api/notes/batch', json={'operations': [operation]}, headers=auth_headers).json['results']
+    assert results[0]['note']['version'] == 3
+    assert (results[0]['note']['title'], results[0]['note']['content']) == ('One', 'Two')
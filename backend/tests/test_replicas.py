@@ -0,0 +1,135 @@
+import sqlite3
+import pytest
+from sqlalchemy import text
+from app import create_app
+from db import db
+
+def make_app(primary_path, replica_url):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret-key',
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary_path}',
+        'SQLALCHEMY_BINDS': {'replica_0': replica_url},
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATE_LIMIT_ENABLED': False,
+        'CACHE_BACKEND': 'none'
+    })
+    return app
+
+@pytest.fixture
+def replica_setup(tmp_path):
+    """An app on a primary SQLite file with a second file as its replica"""
+    primary_path = tmp_path / 'primary.db'
+    replica_path = tmp_path / 'replica.db'
+    app = make_app(primary_path, f'sqlite:///{replica_path}')
+    
+    with app.app_context():
+        db.create_all(bind_key=None)
+        yield app, primary_path, replica_path
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+def login(client):
+    credentials = {'email': 'replica@example.com', 'password': 'testpassword123'}
+    client.post('/api/auth/register', json=credentials)
+    token = client.post('/api/auth/login', json=credentials).json['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def replicate(primary_path, replica_path):
+    """Stand-in for replication: copy the primary over the replica file"""
+    db.engines['replica_0'].dispose()
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+def mark_replica():
+    """Change the replica's titles so reads from it can be told apart"""
+    with db.engines['replica_0'].begin() as connection:
+        connection.execute(text("UPDATE notes SET title = 'Replica'"))
+
+def test_reads_use_replica_with_read_your_writes(replica_setup):
+    """Test GETs go to the replica unless it is behind the user's writes"""
+    app, primary_path, replica_path = replica_setup
+    router = app.extensions['replicas']
+    client = app.test_client()
+    headers = login(client)
+    replicate(primary_path, replica_path)
+    note_id = client.post('/api/notes', json={'title': 'Primary'}, headers=headers).json['id']
+    
+    # The replica has not seen the note yet
+    assert client.get(f'/api/notes/{note_id}', headers=headers).json['title'] == 'Primary'
+    
+    replicate(primary_path, replica_path)
+    mark_replica()
+    assert client.get(f'/api/notes/{note_id}', headers=headers).json['title'] == 'Replica'
+    assert client.get('/api/notes', headers=headers).json[0]['title'] == 'Replica'
+    
+    # Writes go to the primary and are read back until the replica catches up
+    response = client.put(f'/api/notes/{note_id}', json={'title': 'Changed'}, headers=headers)
+    assert response.status_code == 200
+    assert client.get(f'/api/notes/{note_id}', headers=headers).json['title'] == 'Changed'
+    
+    # The check needs no state in the process that took the write
+    other_worker = make_app(primary_path, f'sqlite:///{replica_path}')
+    assert other_worker.test_client().get(f'/api/notes/{note_id}', headers=headers).json['title'] == 'Changed'
+    with other_worker.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    
+    replicate(primary_path, replica_path)
+    mark_replica()
+    assert client.get(f'/api/notes/{note_id}', headers=headers).json['title'] == 'Replica'
+    
+    stats = router.stats()
+    assert stats['reads'] == {'replica_0': 3}
+    assert stats['stale_reads_total'] == 2
+    assert stats['fallbacks_total'] == 0
+
+def test_changes_after_write_are_not_ahead_of_replica(replica_setup):
+    """Test a sync token from the primary is never checked against a lagging replica"""
+    app, primary_path, replica_path = replica_setup
+    client = app.test_client()
+    headers = login(client)
+    note_id = client.post('/api/notes', json={'title': 'First'}, headers=headers).json['id']
+    replicate(primary_path, replica_path)
+    
+    client.post('/api/notes', json={'title': 'Second'}, headers=headers)
+    token = client.get('/api/notes/changes', headers=headers).json['sync_token']
+    response = client.get(f'/api/notes/changes?since={token}', headers=headers)
+    assert response.status_code == 200
+    assert response.json['sync_token'] == token
+    
+    # Attachment writes move the counter too, so the listing is not stale
+    replicate(primary_path, replica_path)
+    client.post(f'/api/notes/{note_id}/attachments?filename=a.txt', data=b'attached', headers=headers)
+    listing = client.get(f'/api/notes/{note_id}/attachments', headers=headers).json
+    assert [item['filename'] for item in listing] == ['a.txt']
+    assert app.extensions['replicas'].stats()['stale_reads_total'] == 3
+
+def test_unavailable_replica_falls_back_to_primary(tmp_path):
+    """Test reads fall back to the primary when the replica cannot be opened"""
+    app = make_app(tmp_path / 'primary.db', f'sqlite:///{tmp_path}/missing/replica.db')
+    with app.app_context():
+        db.create_all(bind_key=None)
+        router = app.extensions['replicas']
+        client = app.test_client()
+        headers = login(client)
+        client.post('/api/notes', json={'title': 'Primary'}, headers=headers)
+        
+        assert client.get('/api/notes', headers=headers).json[0]['title'] == 'Primary'
+        assert client.get('/api/notes', headers=headers).status_code == 200
+        
+        stats = router.stats()
+        assert stats['failures'] == {'replica_0': 1}
+        assert stats['down'] == {'replica_0': 1}
+        assert stats['fallbacks_total'] == 2
+        
+        metrics = client.get('/api/metrics').get_data(as_text=True)
+        assert 'replica_failures_total{bind="replica_0"} 1' in metrics
+        db.session.remove()
+        db.engine.dispose()
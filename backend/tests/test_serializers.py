@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+import pytest
+import serializers
+from models import Note, User
+from schemas import NoteSchema, NoteSummarySchema, UserSchema
+from serializers import dump_note, dump_note_summary, dump_user, dumps, iter_json_array
+
+@pytest.mark.parametrize('note', [
+    Note(id=1, title='Title', content='Body', user_id=7,
+         created_at=datetime(2024, 1, 2, 3, 4, 5, 678901), updated_at=datetime(2024, 1, 2, 3, 4, 6)),
+    Note(id=2, title='Empty', content=None, user_id=7, created_at=None, updated_at=None),
+])
+def test_dump_note_matches_schema(note):
+    """Test the fast note serializers match the marshmallow schemas"""
+    assert dump_note(note) == NoteSchema().dump(note)
+    note.snippet = 'Bo'
+    assert dump_note_summary(note) == NoteSummarySchema().dump(note)
+
+def test_dump_user_matches_schema():
+    """Test the fast user serializer matches UserSchema"""
+    user = User(id=3, email='a@example.com', password_hash='x', created_at=datetime(2024, 5, 6, 7, 8, 9))
+    assert dump_user(user) == UserSchema().dump(user)
+
+def test_dumps_without_orjson(monkeypatch):
+    """Test the stdlib fallback encoder produces the same JSON"""
+    payload = {'b': 'ünïcode', 'a': [1, None]}
+    expected = '{"a":[1,null],"b":"ünïcode"}'.encode('utf-8')
+    assert dumps(payload) == expected
+    monkeypatch.setattr(serializers, 'orjson', None)
+    assert dumps(payload) == expected
+
+def test_iter_json_array():
+    """Test chunked array output is valid JSON for any batch boundary"""
+    for count in (0, 1, 2, 3, 7):
+        body = b''.join(iter_json_array(range(count), lambda n: {'n': n}, 2))
+        assert json.loads(body) == [{'n': n} for n in range(count)]
+
+def test_get_notes_streamed(client, auth_headers, app):
+    """Test the full listing is streamed across several fetch batches"""
+    app.config['NOTES_STREAM_BATCH_SIZE'] = 2
+    client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': f'Note {i}', 'content': f'Content {i}'} for i in range(5)
+    ]}, headers=auth_headers)
+    
+    response = client.get('/api/notes', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    assert len(response.json) == 5
+    assert response.json[0] == client.get(f"/api/notes/{response.json[0]['id']}", headers=auth_headers).json
@@ -0,0 +1,290 @@
+import sqlite3
+import pytest
+from sqlalchemy import update
+from app import create_app
+from db import db, init_db
+from deletion import request_account_deletion
+from migrations import upgrade_schema
+import sharding
+from models import User
+from sharding import (
+    NOTE_ID_RANGE, ShardMoveError, UserMoving, move_user, placement, rebalance, shard_engine, use_shard
+)
+from versioning import bump_notes_version
+
+def make_app(tmp_path, shards=2):
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret-key',
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'directory.db'}",
+        'SQLALCHEMY_BINDS': {f'shard_{index}': f"sqlite:///{tmp_path / f'shard_{index}.db'}" for index in range(shards)},
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATE_LIMIT_ENABLED': False,
+        'ATTACHMENTS_DIR': str(tmp_path / 'attachments')
+    })
+
+@pytest.fixture
+def shard_setup(tmp_path):
+    """An app with a directory database and two shard files"""
+    app = make_app(tmp_path)
+    init_db(app)
+    with app.app_context():
+        yield app, tmp_path
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+def login(client, email):
+    credentials = {'email': email, 'password': 'testpassword123'}
+    client.post('/api/auth/register', json=credentials)
+    token = client.post('/api/auth/login', json=credentials).json['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def count(path, sql, *params):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(sql, params).fetchone()[0]
+    finally:
+        connection.close()
+
+def user_shard(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).shard
+
+def test_placement_is_stable():
+    """Test placement spreads users and a new shard only claims users for itself"""
+    two = ['shard_0', 'shard_1']
+    three = two + ['shard_2']
+    before = {user_id: placement(user_id, two) for user_id in range(1, 1001)}
+    after = {user_id: placement(user_id, three) for user_id in range(1, 1001)}
+    
+    assert before == {user_id: placement(user_id, two) for user_id in range(1, 1001)}
+    assert 400 < list(before.values()).count('shard_0') < 600
+    moved = [user_id for user_id in before if before[user_id] != after[user_id]]
+    assert all(after[user_id] == 'shard_2' for user_id in moved)
+    assert 200 < len(moved) < 470
+
+def test_notes_live_on_the_users_shard(shard_setup):
+    """Test note routes read and write the shard, with ids from its range"""
+    app, tmp_path = shard_setup
+    client = app.test_client()
+    headers = login(client, 'one@example.com')
+    user = User.query.filter_by(email='one@example.com').first()
+    index = int(user.shard.split('_')[1])
+    
+    note = client.post('/api/notes', json={'title': 'Sharded', 'content': 'findme'}, headers=headers).json
+    assert (index + 1) * NOTE_ID_RANGE < note['id'] < (index + 2) * NOTE_ID_RANGE
+    client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': 'Second'}, {'op': 'create', 'title': 'Third'},
+    ]}, headers=headers)
+    
+    shard_path = tmp_path / f'{user.shard}.db'
+    assert count(shard_path, 'SELECT count(*) FROM notes') == 3
+    assert count(tmp_path / 'directory.db', 'SELECT count(*) FROM notes') == 0
+    assert count(tmp_path / 'directory.db', 'SELECT password_hash FROM users') != ''
+    assert count(shard_path, 'SELECT password_hash FROM users') == ''
+    
+    assert len(client.get('/api/notes', headers=headers).json) == 3
+    assert client.get(f"/api/notes/{note['id']}", headers=headers).json['title'] == 'Sharded'
+    assert client.get('/api/notes/search?q=findme', headers=headers).json['results'][0]['id'] == note['id']
+    assert client.get('/api/notes/stats', headers=headers).json['note_count'] == 3
+    assert client.delete(f"/api/notes/{note['id']}", headers=headers).status_code == 204
+    assert client.get('/api/notes/changes?since=1', headers=headers).json['deleted'][0]['id'] == note['id']
+
+def test_move_user_between_shards(shard_setup):
+    """Test a move keeps ids, versions, search, tombstones and attachments, and frees the source"""
+    app, tmp_path = shard_setup
+    client = app.test_client()
+    headers = login(client, 'mover@example.com')
+    user = User.query.filter_by(email='mover@example.com').first()
+    user_id, source = user.id, user.shard
+    target = 'shard_1' if source == 'shard_0' else 'shard_0'
+    
+    notes = [client.post('/api/notes', json={'title': f'Note {n}', 'content': f'word{n}'}, headers=headers).json
+             for n in range(3)]
+    client.delete(f"/api/notes/{notes[0]['id']}", headers=headers)
+    attachments_url = f"/api/notes/{notes[1]['id']}/attachments"
+    client.post(f'{attachments_url}?filename=a.txt', data=b'attached', headers=headers)
+    attachments = client.get(attachments_url, headers=headers).json
+    listing = client.get('/api/notes', headers=headers)
+    listed = listing.json
+    changes = client.get('/api/notes/changes?since=0', headers=headers).json
+    
+    assert move_user(user_id, target, batch_size=1) == 2
+    assert user_shard(user_id) == target
+    assert count(tmp_path / f'{source}.db', 'SELECT count(*) FROM notes') == 0
+    assert count(tmp_path / f'{source}.db', 'SELECT count(*) FROM users') == 0
+    
+    moved = client.get('/api/notes', headers=headers)
+    assert moved.json == listed
+    assert moved.headers['ETag'] == listing.headers['ETag']
+    assert client.get('/api/notes/changes?since=0', headers=headers).json == changes
+    assert client.get('/api/notes/search?q=word2', headers=headers).json['results'][0]['id'] == notes[2]['id']
+    assert client.get('/api/notes/stats', headers=headers).json['note_count'] == 2
+    assert client.get(attachments_url, headers=headers).json == attachments
+    assert count(tmp_path / f'{source}.db', 'SELECT count(*) FROM attachments') == 0
+    
+    # New notes keep coming from the target's own range
+    index = int(target.split('_')[1])
+    new_id = client.post('/api/notes', json={'title': 'After'}, headers=headers).json['id']
+    assert (index + 1) * NOTE_ID_RANGE < new_id < (index + 2) * NOTE_ID_RANGE
+    
+    # Back to the directory, which keeps the login row
+    assert move_user(user_id, None) == 3
+    assert user_shard(user_id) is None
+    assert len(client.get('/api/notes', headers=headers).json) == 3
+    assert count(tmp_path / 'directory.db', 'SELECT count(*) FROM notes') == 3
+    assert client.post('/api/auth/login', json={
+        'email': 'mover@example.com', 'password': 'testpassword123'
+    }).status_code == 200
+
+def test_note_ids_are_not_reused_after_a_move(shard_setup):
+    """Test a shard keeps counting past ids that moved away, so the user can come back"""
+    app, tmp_path = shard_setup
+    client = app.test_client()
+    mover_headers = login(client, 'away@example.com')
+    stayer_headers = login(client, 'stays@example.com')
+    mover = User.query.filter_by(email='away@example.com').first()
+    mover_id, home = mover.id, mover.shard
+    away = 'shard_1' if home == 'shard_0' else 'shard_0'
+    stayer_id = User.query.filter_by(email='stays@example.com').first().id
+    move_user(stayer_id, home)
+    
+    mover_ids = {client.post('/api/notes', json={'title': f'Mine {n}'}, headers=mover_headers).json['id']
+                 for n in range(2)}
+    move_user(mover_id, away)
+    stayer_note = client.post('/api/notes', json={'title': 'Theirs'}, headers=stayer_headers).json['id']
+    assert stayer_note > max(mover_ids)
+    
+    assert move_user(mover_id, home) == 2
+    assert {note['id'] for note in client.get('/api/notes', headers=mover_headers).json} == mover_ids
+    assert count(tmp_path / f'{home}.db', 'SELECT count(*) FROM notes') == 3
+    
+    # A database upgraded from the max(id) allocation starts past the ids on record
+    with shard_engine(home).begin() as connection:
+        connection.exec_driver_sql('UPDATE shard_info SET next_id = NULL')
+    upgrade_schema(shard_engine(home))
+    assert count(tmp_path / f'{home}.db', 'SELECT next_id FROM shard_info') == stayer_note + 1
+
+def test_writes_refused_while_moving(shard_setup):
+    """Test note writes get 503 while a move is in progress, reads still work"""
+    app, _ = shard_setup
+    client = app.test_client()
+    headers = login(client, 'frozen@example.com')
+    user = User.query.filter_by(email='frozen@example.com').first()
+    user.shard_moving = True
+    db.session.commit()
+    
+    response = client.post('/api/notes', json={'title': 'Blocked'}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert client.get('/api/notes', headers=headers).status_code == 200
+    
+    with pytest.raises(ShardMoveError):
+        move_user(user.id, 'shard_9')
+
+def late_write(user_id, name):
+    """A write by a request routed to ``name`` before a move froze the user"""
+    try:
+        with use_shard(name):
+            bump_notes_version(user_id)
+            db.session.commit()
+    except UserMoving:
+        return False
+    finally:
+        db.session.rollback()
+    return True
+
+def test_move_refuses_writes_admitted_before_it(shard_setup, monkeypatch):
+    """Test writers still routed to the source cannot write once a move starts"""
+    app, tmp_path = shard_setup
+    client = app.test_client()
+    headers = login(client, 'late@example.com')
+    user = User.query.filter_by(email='late@example.com').first()
+    user_id, source = user.id, user.shard
+    target = 'shard_1' if source == 'shard_0' else 'shard_0'
+    client.post('/api/notes', json={'title': 'Before'}, headers=headers)
+    
+    copy_user = sharding._copy_user
+    during_copy = []
+    def copy_after_late_write(*args):
+        during_copy.append(late_write(user_id, user_shard(user_id)))
+        return copy_user(*args)
+    monkeypatch.setattr(sharding, '_copy_user', copy_after_late_write)
+    
+    assert move_user(user_id, target) == 1
+    assert during_copy == [False]
+    assert late_write(user_id, source) is False
+    assert count(tmp_path / f'{source}.db', 'SELECT count(*) FROM users') == 0
+    
+    # Off the directory: its row is the login row and stays behind
+    assert move_user(user_id, None) == 1
+    assert move_user(user_id, source) == 1
+    assert during_copy == [False, False, False]
+    assert late_write(user_id, None) is False
+    assert late_write(user_id, source) is True
+    
+    # Requests that reach a frozen row are answered like the directory freeze
+    with shard_engine(source).begin() as connection:
+        connection.execute(update(User).where(User.id == user_id).values(shard_moving=True))
+    response = client.post('/api/notes', json={'title': 'Late'}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert len(client.get('/api/notes', headers=headers).json) == 1
+
+def test_rebalance_and_delete(shard_setup):
+    """Test rebalance returns users to their placement and deletion empties the shard"""
+    app, tmp_path = shard_setup
+    client = app.test_client()
+    headers = login(client, 'home@example.com')
+    user = User.query.filter_by(email='home@example.com').first()
+    user_id, home = user.id, user.shard
+    client.post('/api/notes', json={'title': 'Travelling'}, headers=headers)
+    
+    move_user(user_id, None)
+    assert rebalance(dry_run=True) == ([(user_id, None, home)], [])
+    assert user_shard(user_id) is None
+    assert rebalance() == ([(user_id, None, home)], [])
+    assert user_shard(user_id) == home
+    assert rebalance() == ([], [])
+    
+    # The flag is copied to the tenant row, which note writes check
+    request_account_deletion(User.query.get(user_id))
+    assert client.post('/api/notes', json={'title': 'Late'}, headers=headers).status_code == 404
+    
+    assert client.delete('/api/auth/me', headers=headers).status_code == 202
+    app.extensions['account_deletion'].join()
+    assert client.get('/api/auth/me/deletion', headers=headers).json['status'] == 'done'
+    assert count(tmp_path / f'{home}.db', 'SELECT count(*) FROM notes') == 0
+    assert count(tmp_path / f'{home}.db', 'SELECT count(*) FROM users') == 0
+    assert count(tmp_path / 'directory.db', 'SELECT count(*) FROM users') == 0
+
+def test_rebalance_continues_past_a_failed_move(shard_setup, monkeypatch):
+    """Test a move that fails is reported and the remaining users are still moved"""
+    app, _ = shard_setup
+    client = app.test_client()
+    login(client, 'first@example.com')
+    login(client, 'second@example.com')
+    first, second = (User.query.filter_by(email=email).first().id
+                     for email in ('first@example.com', 'second@example.com'))
+    homes = {first: user_shard(first), second: user_shard(second)}
+    move_user(first, None)
+    move_user(second, None)
+    
+    copy_user = sharding._copy_user
+    def copy_failing_first(source, target, user_id, batch_size):
+        if user_id == first:
+            raise RuntimeError('disk full')
+        return copy_user(source, target, user_id, batch_size)
+    monkeypatch.setattr(sharding, '_copy_user', copy_failing_first)
+    
+    moves, failures = rebalance()
+    assert moves == [(second, None, homes[second])]
+    assert [user_id for user_id, _ in failures] == [first]
+    assert isinstance(failures[0][1], ShardMoveError)
+    assert 'disk full' in str(failures[0][1])
+    assert user_shard(first) is None
+    assert user_shard(second) == homes[second]
+    assert not db.session.get(User, first).shard_moving
@@ -0,0 +1,69 @@
+from sqlalchemy import update
+from db import db
+from models import User
+from stats import reconcile_stats
+
+def stats(client, auth_headers):
+    response = client.get('/api/notes/stats', headers=auth_headers)
+    assert response.status_code == 200
+    return response.json
+
+def test_stats_follow_every_write(client, auth_headers):
+    """Test counters track creates, updates, patches, deletes and batches"""
+    assert stats(client, auth_headers) == {'note_count': 0, 'content_bytes': 0, 'last_modified': None}
+    
+    first = client.post('/api/notes', json={'title': 'One', 'content': 'héllo'}, headers=auth_headers).json
+    client.post('/api/notes', json={'title': 'Two'}, headers=auth_headers)
+    current = stats(client, auth_headers)
+    assert current['note_count'] == 2
+    assert current['content_bytes'] == 6
+    assert current['last_modified'] is not None
+    
+    client.put(f"/api/notes/{first['id']}", json={'content': 'hello world'}, headers=auth_headers)
+    assert stats(client, auth_headers)['content_bytes'] == 11
+    
+    client.patch(f"/api/notes/{first['id']}", json={
+        'base_version': 2,
+        'patches': [{'start': 5, 'end': 11, 'text': ''}],
+    }, headers=auth_headers)
+    assert stats(client, auth_headers)['content_bytes'] == 5
+    
+    client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': 'Three', 'content': 'abc'},
+        {'op': 'delete', 'id': first['id']},
+    ]}, headers=auth_headers)
+    assert stats(client, auth_headers) | {'last_modified': None} == {
+        'note_count': 2, 'content_bytes': 3, 'last_modified': None
+    }
+    
+    client.post('/api/notes/import', data=b'{"title": "Four", "content": "1234"}\n',
+                content_type='application/x-ndjson', headers=auth_headers)
+    assert stats(client, auth_headers)['note_count'] == 3
+    assert stats(client, auth_headers)['content_bytes'] == 7
+
+def test_stats_conditional(client, auth_headers):
+    """Test stats revalidate with the notes version ETag"""
+    client.post('/api/notes', json={'title': 'One'}, headers=auth_headers)
+    etag = client.get('/api/notes/stats', headers=auth_headers).headers['ETag']
+    
+    response = client.get('/api/notes/stats', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    
+    client.post('/api/notes', json={'title': 'Two'}, headers=auth_headers)
+    response = client.get('/api/notes/stats', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['note_count'] == 2
+
+def test_reconcile_stats(app, client, auth_headers):
+    """Test reconciliation repairs drifted counters and leaves good ones alone"""
+    client.post('/api/notes', json={'title': 'One', 'content': 'abcd'}, headers=auth_headers)
+    assert reconcile_stats() == 0
+    
+    db.session.execute(update(User).values(note_count=42, notes_content_bytes=-1))
+    db.session.commit()
+    assert stats(client, auth_headers)['note_count'] == 42
+    
+    assert reconcile_stats() == 1
+    assert stats(client, auth_headers) | {'last_modified': None} == {
+        'note_count': 1, 'content_bytes': 4, 'last_modified': None
+    }
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from sqlalchemy import text
+from db import db
+from storage import init_content_storage, migrate_content
+from tests.test_migrations import make_baseline
+
+LARGE = 'The quick brown fox jumps over the lazy dog. ' * 200
+
+@pytest.fixture
+def compressed(app):
+    """Enable content compression at rest for one test"""
+    app.config['NOTES_COMPRESS_CONTENT'] = True
+    app.config['NOTES_COMPRESS_THRESHOLD'] = 1024
+    init_content_storage(app)
+    return app
+
+def _raw(note_id):
+    return db.session.execute(text(
+        'SELECT typeof(content) AS type, content_size, stored_size FROM notes WHERE id = :id'
+    ), {'id': note_id}).one()
+
+def test_large_content_stored_compressed(client, auth_headers, compressed):
+    """Test large content is compressed on disk but unchanged through the API"""
+    large = client.post('/api/notes', json={'title': 'Large', 'content': LARGE}, headers=auth_headers).json
+    small = client.post('/api/notes', json={'title': 'Small', 'content': 'short'}, headers=auth_headers).json
+    assert large['content'] == LARGE
+    
+    row = _raw(large['id'])
+    assert row.type == 'blob'
+    assert row.content_size == len(LARGE)
+    assert row.stored_size < len(LARGE) / 10
+    assert _raw(small['id']).type == 'text'
+    
+    assert client.get(f"/api/notes/{large['id']}", headers=auth_headers).json['content'] == LARGE
+    summaries = client.get('/api/notes?view=summary', headers=auth_headers).json
+    assert summaries[1]['snippet'] == LARGE[:200]
+    assert summaries[1]['content_size'] == len(LARGE)
+    assert summaries[0]['content_size'] == 5
+
+def test_compressed_content_is_searchable(client, auth_headers, compressed):
+    """Test the search index sees through compression, including edits"""
+    note_id = client.post('/api/notes', json={'title': 'Animals', 'content': LARGE}, headers=auth_headers).json['id']
+    
+    results = client.get('/api/notes/search?q=lazy', headers=auth_headers).json['results']
+    assert [r['id'] for r in results] == [note_id]
+    assert '<mark>lazy</mark>' in results[0]['highlight']
+    
+    client.put(f'/api/notes/{note_id}', json={'content': LARGE.replace('fox', 'cat')}, headers=auth_headers)
+    assert client.get('/api/notes/search?q=fox', headers=auth_headers).json['results'] == []
+    assert len(client.get('/api/notes/search?q=cat', headers=auth_headers).json['results']) == 1
+    
+    client.delete(f'/api/notes/{note_id}', headers=auth_headers)
+    assert client.get('/api/notes/search?q=cat', headers=auth_headers).json['results'] == []
+
+def test_bulk_writes_compressed(client, auth_headers, compressed):
+    """Test batch writes go through the same compression"""
+    results = client.post('/api/notes/batch', json={'operations': [
+        {'op': 'create', 'title': 'Bulk', 'content': LARGE},
+    ]}, headers=auth_headers).json['results']
+    assert results[0]['note']['content'] == LARGE
+    assert _raw(results[0]['id']).type == 'blob'
+
+def test_migrate_content(client, auth_headers, app):
+    """Test existing rows are converted in batches both ways"""
+    ids = [
+        client.post('/api/notes', json={'title': f'Note {i}', 'content': LARGE}, headers=auth_headers).json['id']
+        for i in range(5)
+    ]
+    assert {_raw(note_id).type for note_id in ids} == {'text'}
+    
+    app.config['NOTES_COMPRESS_CONTENT'] = True
+    init_content_storage(app)
+    assert migrate_content(db.session, batch_size=2) == 5
+    assert {_raw(note_id).type for note_id in ids} == {'blob'}
+    assert migrate_content(db.session, batch_size=2) == 0
+    
+    app.config['NOTES_COMPRESS_CONTENT'] = False
+    init_content_storage(app)
+    assert migrate_content(db.session, batch_size=2) == 5
+    assert {_raw(note_id).type for note_id in ids} == {'text'}
+    assert client.get(f'/api/notes/{ids[0]}', headers=auth_headers).json['content'] == LARGE
+
+def test_compress_notes_script_on_baseline_database(tmp_path):
+    """Test compress_notes.py adds the size columns to an old database and compresses it"""
+    path = tmp_path / 'old.db'
+    make_baseline(path)
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE notes SET content = ? WHERE title = 'Plans'", (LARGE,))
+    connection.commit()
+    connection.close()
+    
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', NOTES_COMPRESS_CONTENT='true',
+               ATTACHMENTS_DIR=str(tmp_path / 'attachments'))
+    result = subprocess.run([sys.executable, 'compress_notes.py'], cwd=backend, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert 'Rewrote 1 notes.' in result.stdout
+    
+    connection = sqlite3.connect(path)
+    try:
+        rows = dict(connection.execute('SELECT title, typeof(content) FROM notes').fetchall())
+        assert rows == {'Groceries': 'text', 'Plans': 'blob'}
+        sizes = connection.execute("SELECT content_size FROM notes WHERE title = 'Plans'").fetchone()
+        assert sizes == (len(LARGE.encode('utf-8')),)
+        assert connection.execute('SELECT notes_content_bytes FROM users').fetchone() == (
+            len(LARGE.encode('utf-8')) + len('eggs and milk'),
+        )
+    finally:
+        connection.close()
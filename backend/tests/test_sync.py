@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from db import db
+from models import NoteTombstone
+from sync import compact_tombstones
+
+def test_changes_full_snapshot(client, auth_headers):
+    """Test omitting since returns every note and a sync token"""
+    client.post('/api/notes', json={'title': 'One'}, headers=auth_headers)
+    client.post('/api/notes', json={'title': 'Two'}, headers=auth_headers)
+    
+    response = client.get('/api/notes/changes', headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json
+    assert [note['title'] for note in data['notes']] == ['One', 'Two']
+    assert data['deleted'] == []
+    assert data['sync_token'] == '2'
+
+def test_changes_since_token(client, auth_headers):
+    """Test only later creates, updates and deletes are returned"""
+    keep = client.post('/api/notes', json={'title': 'Keep'}, headers=auth_headers).json
+    drop = client.post('/api/notes', json={'title': 'Drop'}, headers=auth_headers).json
+    client.post('/api/notes', json={'title': 'Untouched'}, headers=auth_headers)
+    token = client.get('/api/notes/changes', headers=auth_headers).json['sync_token']
+    
+    response = client.get(f'/api/notes/changes?since={token}', headers=auth_headers)
+    assert response.json == {'notes': [], 'deleted': [], 'sync_token': token}
+    
+    client.put(f"/api/notes/{keep['id']}", json={'title': 'Kept'}, headers=auth_headers)
+    client.delete(f"/api/notes/{drop['id']}", headers=auth_headers)
+    client.post('/api/notes', json={'title': 'Fresh'}, headers=auth_headers)
+    
+    data = client.get(f'/api/notes/changes?since={token}', headers=auth_headers).json
+    assert [note['title'] for note in data['notes']] == ['Kept', 'Fresh']
+    assert [tombstone['id'] for tombstone in data['deleted']] == [drop['id']]
+    assert int(data['sync_token']) == int(token) + 3
+
+def test_changes_include_batch_deletes(client, auth_headers):
+    """Test batch writes stamp the change sequence and leave tombstones"""
+    note_id = client.post('/api/notes', json={'title': 'Batch me'}, headers=auth_headers).json['id']
+    token = client.get('/api/notes/changes', headers=auth_headers).json['sync_token']
+    
+    client.post('/api/notes/batch', json={'operations': [
+        {'op': 'delete', 'id': note_id},
+        {'op': 'create', 'title': 'Batched'},
+    ]}, headers=auth_headers)
+    
+    data = client.get(f'/api/notes/changes?since={token}', headers=auth_headers).json
+    assert [note['title'] for note in data['notes']] == ['Batched']
+    assert [tombstone['id'] for tombstone in data['deleted']] == [note_id]
+
+def test_changes_invalid_token(client, auth_headers):
+    """Test malformed and future sync tokens are rejected"""
+    assert client.get('/api/notes/changes?since=abc', headers=auth_headers).status_code == 400
+    assert client.get('/api/notes/changes?since=-1', headers=auth_headers).status_code == 400
+    assert client.get('/api/notes/changes?since=50', headers=auth_headers).status_code == 400
+
+def test_compact_tombstones(client, auth_headers, app):
+    """Test compaction prunes old tombstones and expires older tokens"""
+    first = client.post('/api/notes', json={'title': 'Old'}, headers=auth_headers).json
+    second = client.post('/api/notes', json={'title': 'Recent'}, headers=auth_headers).json
+    client.delete(f"/api/notes/{first['id']}", headers=auth_headers)
+    token = client.get('/api/notes/changes', headers=auth_headers).json['sync_token']
+    client.delete(f"/api/notes/{second['id']}", headers=auth_headers)
+    
+    NoteTombstone.query.filter_by(note_id=first['id']).update(
+        {'deleted_at': datetime.utcnow() - timedelta(days=60)}
+    )
+    db.session.commit()
+    
+    assert compact_tombstones(30) == 1
+    assert NoteTombstone.query.count() == 1
+    
+    # Tokens from before the pruned delete must resync from scratch
+    response = client.get('/api/notes/changes?since=2', headers=auth_headers)
+    assert response.status_code == 410
+    
+    data = client.get(f'/api/notes/changes?since={token}', headers=auth_headers).json
+    assert [tombstone['id'] for tombstone in data['deleted']] == [second['id']]
@@ -0,0 +1,56 @@
+from datetime import datetime
+from sqlalchemy import or_, select, update
+from db import db
+from deletion import AccountDeleted
+from identity import TOKEN_TIME_SLACK, token_issued_at, token_predates
+from models import User
+from sharding import UserMoving
+
+def bump_notes_version(user_id):
+    """Record a change to a user's notes as part of the current transaction.
+
+    Returns the new version, which writers stamp on the notes they touch.
+    The same UPDATE refuses the write, so accepting one costs no extra
+    statement. It raises AccountDeleted once deletion of the account was
+    requested or when the request's token predates the account, and
+    UserMoving when the user's notes are being moved off the database this
+    transaction writes to, or have already left it.
+    """
+    conditions = [
+        User.id == user_id,
+        User.deletion_requested_at.is_(None),
+        User.shard.is_(None),
+        User.shard_moving.is_(False)
+    ]
+    issued_at = token_issued_at()
+    if issued_at is not None:
+        conditions.append(or_(User.created_at.is_(None), User.created_at < issued_at + TOKEN_TIME_SLACK))
+    version = db.session.execute(
+        update(User)
+        .where(*conditions)
+        .values(notes_version=User.notes_version + 1, notes_modified_at=datetime.utcnow())
+        .returning(User.notes_version)
+    ).scalar_one_or_none()
+    if version is None:
+        # Only refused writes look up why, on the directory
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(User.deletion_requested_at, User.created_at).where(User.id == user_id)
+            ).first()
+        if row is None or row.deletion_requested_at is not None or token_predates(row.created_at):
+            raise AccountDeleted(user_id)
+        raise UserMoving(user_id)
+    return version
+
+def get_notes_version(user_id):
+    """Return ``(notes_version, notes_modified_at, account)`` with a single row lookup.
+
+    ``account`` tells this account apart from any earlier one that held the
+    same id (databases from before ids stopped being reused), so keys built
+    from it never serve one account's notes to the other.
+    """
+    row = db.session.query(User.notes_version, User.notes_modified_at, User.created_at).filter_by(id=user_id).first()
+    if row is None:
+        return 0, None, ''
+    account = '' if row.created_at is None else row.created_at.strftime('%Y%m%d%H%M%S%f')
+    return row.notes_version, row.notes_modified_at, account
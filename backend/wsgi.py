@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+from db import init_db
+
+app = create_app()
+init_db(app)